@@ -4,10 +4,21 @@ Provides HTTP endpoints to capture and serve camera images.
 """
 import os
 import logging
-from flask import Flask, send_file, jsonify, render_template_string, Response
-from datetime import datetime
+import threading
+import time
+from flask import Flask, abort, g, jsonify, make_response, render_template_string, Response, request, send_file
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
 import config
-from camera import CameraCapture, capture_snapshot
+import metrics
+import websocket_push
+from camera import Camera, camera_names, capture_snapshot, get_camera
+from frame_source import jpeg_dimensions
+from history import parse_time
+from scheduler import CaptureScheduler
+from storage import content_hash
+from thumbnails import select_width
+from motion import MotionDetector, start_motion_detection
 
 # Setup logging
 logging.basicConfig(
@@ -19,8 +30,13 @@ logger = logging.getLogger(__name__)
 # Initialize Flask app
 app = Flask(__name__)
 
-# Initialize camera
-camera = CameraCapture()
+# Periodic capture per camera (started in main() if enabled)
+schedulers: Dict[str, CaptureScheduler] = {
+    name: CaptureScheduler(lambda name=name: capture_snapshot(name)) for name in camera_names()
+}
+
+# Motion-triggered capture per camera (started in main() if enabled)
+motion_detectors: Dict[str, MotionDetector] = {}
 
 
 # Simple HTML template for the index page
@@ -90,10 +106,16 @@ INDEX_HTML = """
             align-items: center;
             justify-content: center;
         }
-        .stream-container img {
+        .stream-container img, .stream-container canvas {
             border: none;
+            max-width: 100%;
             max-height: 720px;
         }
+        .stream-options {
+            text-align: center;
+            color: #666;
+            margin: 10px 0;
+        }
         .button {
             background-color: #4CAF50;
             border: none;
@@ -159,11 +181,17 @@ INDEX_HTML = """
         <!-- Live Stream Tab -->
         <div id="live-tab" class="tab-content active">
             <h2>Live Video Stream</h2>
+            <div class="stream-options">
+                <label><input type="radio" name="stream-mode" value="mjpeg" checked onchange="setStreamMode(this.value)"> Motion JPEG</label>
+                <label><input type="radio" name="stream-mode" value="ws" onchange="setStreamMode(this.value)"> WebSocket</label>
+                <span id="latency"></span>
+            </div>
             <div class="stream-container">
-                <img src="/video_feed" alt="Live camera stream">
+                <img id="stream" src="/video_feed" alt="Live camera stream">
+                <canvas id="stream-canvas" style="display: none;"></canvas>
             </div>
             <p style="color: #666; text-align: center;">
-                <small>Motion JPEG stream - updates automatically</small>
+                <small id="stream-info">Motion JPEG stream - updates automatically</small>
             </p>
         </div>
         
@@ -176,13 +204,14 @@ INDEX_HTML = """
             </div>
             
             <div class="image-container">
-                <img id="snapshot" src="/snapshot.jpg?t={{ cache_bust }}" alt="Latest camera snapshot">
+                <img id="snapshot" src="/snapshot.jpg" alt="Latest camera snapshot">
             </div>
         </div>
         
         <div class="info">
             <strong>Direct URLs:</strong><br>
             Live stream: <code>http://{{ host }}:{{ port }}/video_feed</code><br>
+            WebSocket stream: <code>ws://{{ host }}:{{ port }}/video_ws</code><br>
             Latest snapshot: <code>http://{{ host }}:{{ port }}/snapshot.jpg</code>
         </div>
     </div>
@@ -202,9 +231,97 @@ INDEX_HTML = """
             event.target.classList.add('active');
         }
         
-        function refreshImage() {
+        let socket = null;
+        
+        function setStreamMode(mode) {
+            const img = document.getElementById('stream');
+            const canvas = document.getElementById('stream-canvas');
+            if (socket) {
+                socket.close();
+                socket = null;
+            }
+            document.getElementById('latency').textContent = '';
+            if (mode === 'ws') {
+                img.src = '';
+                img.style.display = 'none';
+                canvas.style.display = '';
+                document.getElementById('stream-info').textContent =
+                    'WebSocket stream - latency is capture to display';
+                startWebSocket(canvas);
+            } else {
+                canvas.style.display = 'none';
+                img.style.display = '';
+                img.src = '/video_feed';
+                document.getElementById('stream-info').textContent =
+                    'Motion JPEG stream - updates automatically';
+            }
+        }
+        
+        function startWebSocket(canvas) {
+            const scheme = location.protocol === 'https:' ? 'wss:' : 'ws:';
+            const ws = new WebSocket(scheme + '//' + location.host + '/video_ws');
+            const context = canvas.getContext('2d');
+            const readout = document.getElementById('latency');
+            let offset = 0;  // server clock minus browser clock (ms)
+            let bestRtt = Infinity;
+            let pingTimer = null;
+            socket = ws;
+            ws.binaryType = 'arraybuffer';
+            
+            const ping = () => ws.send(JSON.stringify({type: 'ping', t: Date.now()}));
+            ws.onopen = () => {
+                ping();
+                pingTimer = setInterval(ping, 5000);
+                // Two frames in flight hide the round trip without queueing
+                ws.send(JSON.stringify({type: 'credit', n: 2}));
+            };
+            ws.onclose = () => clearInterval(pingTimer);
+            ws.onmessage = async (event) => {
+                if (typeof event.data === 'string') {
+                    const message = JSON.parse(event.data);
+                    if (message.type === 'pong') {
+                        // Keep the offset from the fastest round trip (least asymmetric)
+                        const rtt = Date.now() - message.t;
+                        if (rtt <= bestRtt) {
+                            bestRtt = rtt;
+                            offset = message.server_time * 1000 - (message.t + rtt / 2);
+                        }
+                    }
+                    return;
+                }
+                const header = new DataView(event.data, 0, 16);
+                const seq = header.getUint32(0);
+                const capturedAt = header.getFloat64(4);
+                const width = header.getUint16(12);
+                const height = header.getUint16(14);
+                const bitmap = await createImageBitmap(
+                    new Blob([new Uint8Array(event.data, 16)], {type: 'image/jpeg'}));
+                if (canvas.width !== width || canvas.height !== height) {
+                    canvas.width = width;
+                    canvas.height = height;
+                }
+                context.drawImage(bitmap, 0, 0);
+                bitmap.close();
+                const latency = Date.now() + offset - capturedAt * 1000;
+                readout.textContent = `| frame ${seq} | latency ${latency.toFixed(0)} ms`;
+                if (ws.readyState === WebSocket.OPEN) {
+                    ws.send(JSON.stringify({type: 'credit', n: 1}));
+                }
+            };
+        }
+        
+        async function refreshImage() {
+            // Revalidate with the server; unchanged images come back as 304
+            const response = await fetch('/snapshot.jpg', {cache: 'no-cache'});
+            if (!response.ok) {
+                return;
+            }
             const img = document.getElementById('snapshot');
-            img.src = '/snapshot.jpg?t=' + new Date().getTime();
+            const previous = img.src;
+            img.src = URL.createObjectURL(await response.blob());
+            if (previous.startsWith('blob:')) {
+                URL.revokeObjectURL(previous);
+            }
         }
         
         async function captureImage() {
@@ -228,6 +345,135 @@ INDEX_HTML = """
 """
 
 
+@app.before_request
+def start_request_timer():
+    """Remember when the request started for the latency histogram."""
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_latency(response):
+    """Record per-endpoint latency (for streams: time until the response starts)."""
+    start = g.get('request_start')
+    if start is not None:
+        metrics.HTTP_REQUEST_SECONDS.labels(
+            request.endpoint or 'unmatched', request.method, str(response.status_code)
+        ).observe(time.perf_counter() - start)
+    return response
+
+
+def _camera_or_404(name: Optional[str]) -> Camera:
+    """Look up a camera from the URL, aborting with 404 if it is unknown."""
+    try:
+        return get_camera(name)
+    except KeyError:
+        abort(make_response(jsonify({"error": f"Unknown camera: {name}"}), 404))
+
+
+def _url_prefix(name: Optional[str]) -> str:
+    """URL prefix for links in responses: none for the default routes."""
+    return f"/cameras/{name}" if name is not None else ""
+
+
+def _thumbnail_width() -> Optional[int]:
+    """Parse the ?w= thumbnail width, aborting with 400 if it is invalid."""
+    width = request.args.get('w')
+    if width is None or width == '':
+        return None
+    try:
+        width = int(width)
+    except ValueError:
+        width = 0
+    if not 16 <= width <= 7680:
+        abort(make_response(jsonify({"error": "w must be a number between 16 and 7680"}), 400))
+    return width
+
+
+def _max_age() -> Optional[float]:
+    """Parse the ?max_age= snapshot freshness in seconds, aborting with 400 if it is invalid."""
+    max_age = request.args.get('max_age')
+    if max_age is None or max_age == '':
+        return None
+    try:
+        max_age = float(max_age)
+    except ValueError:
+        max_age = -1.0
+    # Also rejects nan and inf
+    if not 0 <= max_age < float('inf'):
+        abort(make_response(jsonify({"error": "max_age must be a non-negative number of seconds"}), 400))
+    return max_age
+
+
+def _quality_thresholds(min_brightness: Optional[float] = None,
+                        min_sharpness: Optional[float] = None) -> Tuple[Optional[float], Optional[float]]:
+    """
+    Parse ?min_brightness= and ?min_sharpness=, aborting with 400 if invalid.
+    
+    Args:
+        min_brightness: Default when the parameter is not given
+        min_sharpness: Default when the parameter is not given
+    
+    Returns:
+        Tuple of (min_brightness, min_sharpness)
+    """
+    values = []
+    for name, default in (('min_brightness', min_brightness), ('min_sharpness', min_sharpness)):
+        value = request.args.get(name)
+        if value is None or value == '':
+            values.append(default)
+            continue
+        try:
+            value = float(value)
+        except ValueError:
+            value = -1.0
+        if value < 0:
+            abort(make_response(jsonify({"error": f"{name} must be a non-negative number"}), 400))
+        values.append(value)
+    return values[0], values[1]
+
+
+def _snapshot_quality(item: dict) -> Optional[dict]:
+    """Stored quality of a snapshot row, or None if it was not analyzed."""
+    if item['brightness'] is None:
+        return None
+    return {
+        "brightness": round(item['brightness'], 1),
+        "sharpness": round(item['sharpness'], 1),
+        "histogram": item['histogram']
+    }
+
+
+def _thumbnail(cam: Camera, etag: str, width: int, source_width: Optional[int], load) -> Optional[Response]:
+    """
+    Build a thumbnail response from the camera's derivative cache.
+    
+    Args:
+        cam: Camera owning the cache
+        etag: Content hash of the source image
+        width: Requested width
+        source_width: Width of the source image, if known
+        load: Returns the source JPEG bytes (only called on a cache miss)
+    
+    Returns:
+        JPEG response, or None if the original image should be served
+    """
+    size = select_width(width, source_width)
+    if size is None:
+        return None
+    
+    # The derivative is immutable for a given source, so answer revalidations without touching the cache
+    response = Response(mimetype='image/jpeg')
+    response.set_etag(f"{etag}-w{size}")
+    if request.if_none_match.contains(f"{etag}-w{size}"):
+        return response.make_conditional(request)
+    
+    data = cam.thumbnails.get(etag, size, load)
+    if data is None:
+        return None
+    response.set_data(data)
+    return response
+
+
 @app.route('/')
 def index():
     """
@@ -241,79 +487,630 @@ def index():
         INDEX_HTML,
         status="Online",
         timestamp=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        cache_bust=int(datetime.now().timestamp()),
         host=local_ip,
         port=config.PORT
     )
 
 
-@app.route('/snapshot.jpg')
-def get_snapshot():
+@app.route('/snapshot.jpg', defaults={'name': None})
+@app.route('/cameras/<name>/snapshot.jpg')
+def get_snapshot(name: Optional[str]):
     """
-    Serve the latest captured image.
+    Serve the latest captured image from the in-memory snapshot cache.
+    Supports conditional GET (ETag / If-None-Match, Last-Modified /
+    If-Modified-Since), so polling clients get 304 for unchanged images.
+    
+    Query parameters:
+        max_age: Maximum acceptable snapshot age in seconds. The cached
+                 image is returned if it is fresh enough, otherwise a new
+                 one is captured.
+        w: Thumbnail width (rounded up to a THUMBNAIL_SIZES width)
+        roi: ROI_PRESETS region; cropped from the newest live frame
+             (max_age does not apply) and shared with ?roi= streams
     
     Returns:
-        JPEG image file
+        JPEG image
     """
-    snapshot_path = os.path.join(config.IMAGES_DIR, config.LATEST_IMAGE_NAME)
+    cam = _camera_or_404(name)
+    max_age = _max_age()
+    width = _thumbnail_width()
+    try:
+        roi = parse_roi(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if roi is not None:
+        return _roi_snapshot(cam, roi, width)
+    snapshot = cam.snapshot_cache.get()
     
-    # Check if snapshot exists
-    if not os.path.exists(snapshot_path):
-        logger.warning("Snapshot not found, capturing new image...")
-        success, _ = capture_snapshot()
+    # Capture only if there is no snapshot or it is older than requested
+    if snapshot is None or (max_age is not None and snapshot.age() > max_age):
+        if snapshot is None:
+            logger.warning("Snapshot not found, capturing new image...")
+        success, _ = cam.capture_snapshot()
         
-        if not success:
+        if success:
+            snapshot = cam.snapshot_cache.get()
+        elif snapshot is None:
             return jsonify({
                 "error": "No snapshot available and failed to capture new image"
             }), 404
     
     try:
-        return send_file(
-            snapshot_path,
-            mimetype='image/jpeg',
-            as_attachment=False,
-            download_name='snapshot.jpg'
-        )
+        response = None
+        if width is not None:
+            source_width = (jpeg_dimensions(snapshot.jpeg) or (None,))[0]
+            response = _thumbnail(cam, snapshot.etag, width, source_width, lambda: snapshot.jpeg)
+        if response is None:
+            response = Response(snapshot.jpeg, mimetype='image/jpeg')
+            response.set_etag(snapshot.etag)
+        response.last_modified = snapshot.last_modified
+        # Let browsers keep the image but revalidate it on every request
+        response.cache_control.no_cache = True
+        response.headers['Content-Disposition'] = 'inline; filename=snapshot.jpg'
+        return response.make_conditional(request)
     except Exception as e:
         logger.error(f"Error serving snapshot: {e}")
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/video_feed')
-def video_feed():
+def _roi_snapshot(cam: Camera, roi: str, width: Optional[int]) -> Response:
+    """
+    Serve a ROI preset of the newest live frame. The crop is the frame's
+    stream variant, so it is encoded once per frame for all requests and
+    ?roi= streams of the same region.
+    
+    Args:
+        cam: Camera to capture from
+        roi: ROI_PRESETS region
+        width: Requested width (rounded up to a THUMBNAIL_SIZES width), or None
+    
+    Returns:
+        JPEG image, or 503 if the camera is not available
+    """
+    frame = cam.worker.capture_frame()
+    if frame is None:
+        return jsonify({"error": "Camera not available"}), 503
+    
+    size = select_width(width, frame.variant_size(None, roi)[0]) if width is not None else None
+    jpeg = frame.jpeg(size, config.STREAM_JPEG_QUALITY, roi)
+    if jpeg is None:
+        return jsonify({"error": "Failed to encode image"}), 500
+    
+    response = Response(bytes(jpeg), mimetype='image/jpeg')
+    response.set_etag(f"{roi}-{frame.captured_at!r}-w{size or 0}")
+    response.last_modified = datetime.fromtimestamp(int(frame.captured_at), tz=timezone.utc)
+    response.cache_control.no_cache = True
+    response.headers['Content-Disposition'] = f'inline; filename=snapshot_{roi}.jpg'
+    return response.make_conditional(request)
+
+
+@app.route('/snapshots', defaults={'name': None})
+@app.route('/cameras/<name>/snapshots')
+def list_snapshots(name: Optional[str]):
+    """
+    List stored snapshots in a time range, oldest first.
+    
+    Query parameters:
+        from: Earliest capture time (UNIX timestamp or ISO 8601)
+        to: Latest capture time (UNIX timestamp or ISO 8601)
+        limit: Page size (default 100, max 1000)
+        cursor: next_cursor value from the previous page
+        min_brightness: Only snapshots with at least this mean luminance (0-255)
+        min_sharpness: Only snapshots with at least this sharpness
+    
+    Returns:
+        JSON response with snapshot metadata and the next page cursor
+    """
+    cam = _camera_or_404(name)
+    min_brightness, min_sharpness = _quality_thresholds()
+    try:
+        start = parse_time(request.args['from']) if 'from' in request.args else None
+        end = parse_time(request.args['to']) if 'to' in request.args else None
+        limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+        items, next_cursor = cam.history.query(start, end, limit, request.args.get('cursor'),
+                                               min_brightness, min_sharpness)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid query parameter: {e}"}), 400
+    
+    return jsonify({
+        "items": [
+            {
+                "id": item['id'],
+                "filename": item['filename'],
+                "timestamp": datetime.fromtimestamp(item['captured_at']).isoformat(),
+                "captured_at": item['captured_at'],
+                "size": item['size'],
+                "width": item['width'],
+                "height": item['height'],
+                "content_hash": item['content_hash'],
+                "quality": _snapshot_quality(item),
+                "url": f"{_url_prefix(name)}/snapshots/{item['id']}.jpg",
+                "thumbnail_url": f"{_url_prefix(name)}/snapshots/{item['id']}.jpg?w={config.THUMBNAIL_SIZES[0]}"
+            }
+            for item in items
+        ],
+        "next_cursor": next_cursor
+    })
+
+
+@app.route('/snapshots/<int:snapshot_id>.jpg', defaults={'name': None})
+@app.route('/cameras/<name>/snapshots/<int:snapshot_id>.jpg')
+def get_history_snapshot(snapshot_id: int, name: Optional[str]):
+    """
+    Serve a stored snapshot by its history id.
+    
+    Query parameters:
+        w: Thumbnail width (rounded up to a THUMBNAIL_SIZES width)
+    
+    Returns:
+        JPEG image file
+    """
+    cam = _camera_or_404(name)
+    width = _thumbnail_width()
+    history = cam.history
+    item = history.get(snapshot_id)
+    path = history.path_for(item) if item else None
+    
+    if path is None or not os.path.exists(path):
+        return jsonify({"error": "Snapshot not found"}), 404
+    
+    if width is not None:
+        def load():
+            try:
+                with open(path, 'rb') as f:
+                    return f.read()
+            except OSError:
+                return None
+        
+        # Rows indexed before content hashes were recorded are hashed on the fly
+        etag = item['content_hash'] or content_hash(load() or b'')
+        response = _thumbnail(cam, etag, width, item['width'], load)
+        if response is not None:
+            response.cache_control.max_age = 86400
+            response.cache_control.public = True
+            return response.make_conditional(request)
+    
+    response = send_file(path, mimetype='image/jpeg', download_name=item['filename'],
+                         etag=item['content_hash'] or True, max_age=86400)
+    return response.make_conditional(request)
+
+
+@app.route('/motion/events', defaults={'name': None})
+@app.route('/cameras/<name>/motion/events')
+def motion_events(name: Optional[str]):
+    """
+    List recorded motion events, newest first.
+    
+    Query parameters:
+        from: Earliest event time (UNIX timestamp or ISO 8601)
+        to: Latest event time (UNIX timestamp or ISO 8601)
+        limit: Maximum number of events (default 100, max 1000)
+    
+    Returns:
+        JSON response with motion events
+    """
+    cam = _camera_or_404(name)
+    try:
+        start = parse_time(request.args['from']) if 'from' in request.args else None
+        end = parse_time(request.args['to']) if 'to' in request.args else None
+        limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid query parameter: {e}"}), 400
+    
+    events = cam.history.query_motion_events(start, end, limit)
+    
+    return jsonify({
+        "enabled": cam.name in motion_detectors,
+        "events": [
+            {
+                "id": event['id'],
+                "timestamp": datetime.fromtimestamp(event['occurred_at']).isoformat(),
+                "score": round(event['score'], 4),
+                "snapshot": event['snapshot_filename'],
+                "url": (f"{_url_prefix(name)}/snapshots/{event['snapshot_id']}.jpg"
+                        if event['snapshot_id'] else None)
+            }
+            for event in events
+        ]
+    })
+
+
+@app.route('/quality', defaults={'name': None})
+@app.route('/cameras/<name>/quality')
+def image_quality(name: Optional[str]):
+    """
+    Image quality (brightness, sharpness, histogram) of the live frame and
+    of stored snapshots over time, e.g. to track greenhouse lighting.
+    
+    Query parameters:
+        from: Earliest capture time (UNIX timestamp or ISO 8601)
+        to: Latest capture time (UNIX timestamp or ISO 8601)
+        limit: Page size (default 100, max 1000)
+        cursor: next_cursor value from the previous page
+    
+    Returns:
+        JSON response with the live quality (None while the camera is idle),
+        the configured thresholds and a time series of stored snapshots
+    """
+    cam = _camera_or_404(name)
+    try:
+        start = parse_time(request.args['from']) if 'from' in request.args else None
+        end = parse_time(request.args['to']) if 'to' in request.args else None
+        limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+        items, next_cursor = cam.history.query(start, end, limit, request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({"error": f"Invalid query parameter: {e}"}), 400
+    
+    live = cam.worker.image_quality()
+    return jsonify({
+        "live": live.to_dict() if live else None,
+        "min_brightness": config.QUALITY_MIN_BRIGHTNESS,
+        "min_sharpness": config.QUALITY_MIN_SHARPNESS,
+        "items": [
+            {
+                "id": item['id'],
+                "timestamp": datetime.fromtimestamp(item['captured_at']).isoformat(),
+                "captured_at": item['captured_at'],
+                **(_snapshot_quality(item) or {"brightness": None, "sharpness": None, "histogram": None}),
+                "url": f"{_url_prefix(name)}/snapshots/{item['id']}.jpg"
+            }
+            for item in items
+        ],
+        "next_cursor": next_cursor
+    })
+
+
+@app.route('/timelapse', methods=['GET', 'POST'], defaults={'name': None})
+@app.route('/cameras/<name>/timelapse', methods=['GET', 'POST'])
+def create_timelapse(name: Optional[str]):
+    """
+    Start building a time-lapse video from stored snapshots.
+    Identical requests share a running job or return the cached video.
+    
+    Query parameters:
+        from: Earliest capture time (UNIX timestamp or ISO 8601)
+        to: Latest capture time (UNIX timestamp or ISO 8601)
+        fps: Output frame rate (default: TIMELAPSE_DEFAULT_FPS)
+        width: Output width in pixels (default: snapshot width)
+        format: 'avi' (Motion JPEG, default) or 'mp4'
+    
+    Returns:
+        JSON response with the job state (202 Accepted)
+    """
+    cam = _camera_or_404(name)
+    try:
+        start = parse_time(request.args['from']) if 'from' in request.args else None
+        end = parse_time(request.args['to']) if 'to' in request.args else None
+        width, _, fps = parse_stream_params(request.args)
+        job = cam.timelapse.submit(start, end, fps or config.TIMELAPSE_DEFAULT_FPS, width,
+                                   request.args.get('format', 'avi'))
+    except ValueError as e:
+        return jsonify({"error": f"Invalid query parameter: {e}"}), 400
+    
+    return jsonify(_timelapse_status(name, job)), 202
+
+
+@app.route('/timelapse/<job_id>', defaults={'name': None})
+@app.route('/cameras/<name>/timelapse/<job_id>')
+def timelapse_status(job_id: str, name: Optional[str]):
+    """
+    Progress of a time-lapse job.
+    
+    Returns:
+        JSON response with the job state
+    """
+    job = _camera_or_404(name).timelapse.get(job_id)
+    if job is None:
+        return jsonify({"error": "Time-lapse job not found"}), 404
+    return jsonify(_timelapse_status(name, job))
+
+
+@app.route('/timelapse/<job_id>/video', defaults={'name': None})
+@app.route('/cameras/<name>/timelapse/<job_id>/video')
+def timelapse_video(job_id: str, name: Optional[str]):
+    """
+    Download a finished time-lapse video.
+    
+    Returns:
+        Video file, or 409 while the job is still running
+    """
+    job = _camera_or_404(name).timelapse.get(job_id)
+    if job is None:
+        return jsonify({"error": "Time-lapse job not found"}), 404
+    if job.status != 'done':
+        return jsonify(_timelapse_status(name, job)), 409
+    if not os.path.exists(job.path):
+        return jsonify({"error": "Time-lapse video was removed from the cache, request it again"}), 410
+    
+    mimetype = 'video/mp4' if job.format == 'mp4' else 'video/x-msvideo'
+    response = send_file(job.path, mimetype=mimetype, download_name=os.path.basename(job.path),
+                         etag=job.key, max_age=86400)
+    return response.make_conditional(request)
+
+
+def _timelapse_status(name: Optional[str], job) -> dict:
+    """Job state with links to poll and download it."""
+    status = job.to_dict()
+    status["status_url"] = f"{_url_prefix(name)}/timelapse/{job.id}"
+    status["video_url"] = f"{_url_prefix(name)}/timelapse/{job.id}/video" if job.status == 'done' else None
+    return status
+
+
+@app.route('/recordings', defaults={'name': None})
+@app.route('/cameras/<name>/recordings')
+def list_recordings(name: Optional[str]):
+    """
+    List recording segments overlapping a time range, oldest first.
+    
+    Query parameters:
+        from: Earliest time (UNIX timestamp or ISO 8601)
+        to: Latest time (UNIX timestamp or ISO 8601)
+        limit: Page size (default 100, max 1000)
+        cursor: next_cursor value from the previous page
+    
+    Returns:
+        JSON response with segment metadata and the next page cursor
+    """
+    cam = _camera_or_404(name)
+    try:
+        start = parse_time(request.args['from']) if 'from' in request.args else None
+        end = parse_time(request.args['to']) if 'to' in request.args else None
+        limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+        items, next_cursor = cam.history.query_recordings(start, end, limit, request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({"error": f"Invalid query parameter: {e}"}), 400
+    
+    return jsonify({
+        "recording": cam.recorder.is_running(),
+        "items": [
+            {
+                "id": item['id'],
+                "filename": item['filename'],
+                "timestamp": datetime.fromtimestamp(item['started_at']).isoformat(),
+                "started_at": item['started_at'],
+                "ended_at": item['ended_at'],
+                "frames": item['frames'],
+                "size": item['size'],
+                "width": item['width'],
+                "height": item['height'],
+                "url": f"{_url_prefix(name)}/recordings/{item['id']}.avi",
+                "index_url": f"{_url_prefix(name)}/recordings/{item['id']}/index"
+            }
+            for item in items
+        ],
+        "next_cursor": next_cursor
+    })
+
+
+@app.route('/recordings/<int:recording_id>.avi', defaults={'name': None})
+@app.route('/cameras/<name>/recordings/<int:recording_id>.avi')
+def get_recording(recording_id: int, name: Optional[str]):
+    """
+    Serve a recording segment. Supports Range requests, so single frames
+    or time windows (see the segment index) can be fetched on their own.
+    
+    Returns:
+        Motion JPEG AVI file (206 Partial Content for Range requests)
+    """
+    cam = _camera_or_404(name)
+    item = cam.history.get_recording(recording_id)
+    path = cam.recorder.path_for(item) if item else None
+    if path is None or not os.path.exists(path):
+        return jsonify({"error": "Recording not found"}), 404
+    # Finished segments never change
+    return send_file(path, mimetype='video/x-msvideo', download_name=item['filename'],
+                     etag=f"{item['filename']}-{item['size']}", max_age=86400, conditional=True)
+
+
+@app.route('/recordings/<int:recording_id>/index', defaults={'name': None})
+@app.route('/cameras/<name>/recordings/<int:recording_id>/index')
+def get_recording_index(recording_id: int, name: Optional[str]):
+    """
+    Frame index of a recording segment: capture time, byte offset and size
+    of every JPEG frame in the file.
+    
+    Query parameters:
+        from: Earliest frame time (UNIX timestamp or ISO 8601)
+        to: Latest frame time (UNIX timestamp or ISO 8601)
+    
+    Returns:
+        JSON response with the frames and a Range header value covering them
+    """
+    cam = _camera_or_404(name)
+    item = cam.history.get_recording(recording_id)
+    index = cam.recorder.read_index(item) if item else None
+    if index is None:
+        return jsonify({"error": "Recording not found"}), 404
+    try:
+        start = parse_time(request.args['from']) if 'from' in request.args else None
+        end = parse_time(request.args['to']) if 'to' in request.args else None
+    except ValueError as e:
+        return jsonify({"error": f"Invalid query parameter: {e}"}), 400
+    
+    frames = [frame for frame in index['frames']
+              if (start is None or frame[0] >= start) and (end is None or frame[0] <= end)]
+    return jsonify({
+        "id": item['id'],
+        "url": f"{_url_prefix(name)}/recordings/{item['id']}.avi",
+        "started_at": item['started_at'],
+        "ended_at": item['ended_at'],
+        "width": item['width'],
+        "height": item['height'],
+        "frames": [{"captured_at": t, "offset": offset, "size": size} for t, offset, size in frames],
+        "range": f"bytes={frames[0][1]}-{frames[-1][1] + frames[-1][2] - 1}" if frames else None
+    })
+
+
+def parse_roi(args) -> Optional[str]:
+    """
+    Parse and validate the ?roi= preset name.
+    
+    Args:
+        args: Mapping of query parameter names to string values
+    
+    Returns:
+        Name of a ROI_PRESETS region, or None for the whole frame
+    
+    Raises:
+        ValueError: If the preset does not exist
+    """
+    roi = args.get('roi')
+    if roi is None or roi == '':
+        return None
+    if roi not in config.ROI_PRESETS:
+        raise ValueError(f"Unknown roi '{roi}', configured: {', '.join(sorted(config.ROI_PRESETS)) or 'none'}")
+    return roi
+
+
+def parse_stream_params(args) -> Tuple[Optional[int], Optional[int], Optional[float]]:
+    """
+    Parse and validate /video_feed query parameters.
+    
+    Args:
+        args: Mapping of query parameter names to string values
+    
+    Returns:
+        Tuple of (width, quality, fps), each None if not given
+    
+    Raises:
+        ValueError: If a parameter is malformed or out of range
+    """
+    def number(name, kind, low, high):
+        value = args.get(name)
+        if value is None or value == '':
+            return None
+        try:
+            value = kind(value)
+        except ValueError:
+            raise ValueError(f"{name} must be a number")
+        if not low <= value <= high:
+            raise ValueError(f"{name} must be between {low} and {high}")
+        return value
+    
+    width = number('width', int, 16, 7680)
+    quality = number('quality', int, 10, 100)
+    fps = number('fps', float, 0.1, 120)
+    return width, quality, fps
+
+
+@app.route('/video_feed', defaults={'name': None})
+@app.route('/cameras/<name>/video_feed')
+def video_feed(name: Optional[str]):
     """
     Video streaming route. Returns Motion JPEG stream.
     
+    Query parameters:
+        width: Output width in pixels (default: full resolution)
+        quality: JPEG quality 10-100 (default: STREAM_JPEG_QUALITY)
+        fps: Maximum frame rate for this client (default: camera rate)
+        roi: ROI_PRESETS region to crop to (default: whole frame); width
+             then applies to the cropped region
+    
     Returns:
         Response with multipart/x-mixed-replace content type
     """
-    logger.info("Video feed request received")
+    cam = _camera_or_404(name)
+    logger.info(f"Video feed request received ({cam.name})")
+    
+    try:
+        width, quality, fps = parse_stream_params(request.args)
+        roi = parse_roi(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
     return Response(
-        camera.generate_frames(),
+        cam.capture.generate_frames(width=width, quality=quality, fps=fps, roi=roi),
         mimetype='multipart/x-mixed-replace; boundary=frame'
     )
 
 
-@app.route('/capture')
-def capture():
+class _SocketTakenOver:
+    """
+    Response body for a request whose connection the route has taken over.
+    
+    video_ws writes the 101 handshake and the whole WebSocket session to
+    the raw socket (environ['werkzeug.socket']) and shuts it down when the
+    session ends, so the server must not send a status line or headers of
+    its own afterwards. Werkzeug sends them together with the first body
+    chunk; iterating this body raises ConnectionError before any chunk,
+    which the server handles as a client that went away: nothing is
+    written and the connection is closed.
+    """
+    
+    def __iter__(self):
+        raise ConnectionError("Connection was taken over by the route")
+
+
+@app.route('/video_ws', defaults={'name': None}, websocket=True)
+@app.route('/cameras/<name>/video_ws', websocket=True)
+def video_ws(name: Optional[str]):
+    """
+    WebSocket frame push with per-frame metadata and credit-based flow
+    control (see websocket_push for the message format). Only upgrade
+    requests are routed here; plain requests get 400 from the router.
+    
+    Query parameters:
+        width, quality, fps, roi: Same as /video_feed
+    
+    Returns:
+        101 Switching Protocols, then binary frame messages. Under the
+        development server the route takes over the connection: it writes
+        the handshake and the session itself, and the returned response
+        only tells the server not to write anything (see _SocketTakenOver)
+    """
+    cam = _camera_or_404(name)
+    if 'Sec-WebSocket-Key' not in request.headers:
+        return jsonify({"error": "Missing Sec-WebSocket-Key header"}), 400
+    
+    try:
+        width, quality, fps = parse_stream_params(request.args)
+        roi = parse_roi(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    sock = request.environ.get('werkzeug.socket')
+    if sock is None:
+        return jsonify({"error": "WebSocket is not supported by this server, use SERVER_MODE='asyncio'"}), 501
+    
+    logger.info(f"WebSocket stream request received ({cam.name})")
+    sock.sendall(websocket_push.handshake_response(request.headers['Sec-WebSocket-Key']))
+    metrics.HTTP_REQUEST_SECONDS.labels('video_ws', 'GET', '101').observe(time.perf_counter() - g.request_start)
+    # The session is not a request latency; skip the after_request observation
+    g.request_start = None
+    
+    websocket_push.serve(sock, cam.worker, width, quality or config.STREAM_JPEG_QUALITY, fps, roi)
+    # The handshake and the session went over the raw socket; nothing may be written after them
+    return Response(_SocketTakenOver(), direct_passthrough=True)
+
+
+@app.route('/capture', defaults={'name': None})
+@app.route('/cameras/<name>/capture')
+def capture(name: Optional[str]):
     """
     Trigger a new image capture from the camera.
     
+    Query parameters:
+        min_brightness: Wait for a frame at least this bright (default: QUALITY_MIN_BRIGHTNESS)
+        min_sharpness: Wait for a frame at least this sharp (default: QUALITY_MIN_SHARPNESS)
+    
     Returns:
         JSON response with success status
     """
-    logger.info("Capture request received")
+    cam = _camera_or_404(name)
+    logger.info(f"Capture request received ({cam.name})")
+    min_brightness, min_sharpness = _quality_thresholds(config.QUALITY_MIN_BRIGHTNESS,
+                                                        config.QUALITY_MIN_SHARPNESS)
     
     try:
-        success, filepath = capture_snapshot()
+        success, filepath = cam.capture_snapshot(min_brightness, min_sharpness)
         
         if success:
             return jsonify({
                 "success": True,
                 "message": "Image captured successfully",
                 "timestamp": datetime.now().isoformat(),
-                "filepath": filepath
+                "filepath": filepath,
+                "latency_ms": cam.worker.get_stats()["last_capture_ms"]
             })
         else:
             return jsonify({
@@ -329,33 +1126,94 @@ def capture():
         }), 500
 
 
-@app.route('/status')
-def status():
+def _camera_status(cam: Camera) -> dict:
+    """Session, storage, scheduler and motion state of one camera."""
+    detector = motion_detectors.get(cam.name)
+    return {
+        "camera": cam.name,
+        "camera_index": cam.worker.camera_index,
+        "camera_device": cam.settings.device,
+        "camera_state": cam.supervisor.state,
+        "images_dir": cam.settings.images_dir,
+        "supervisor": cam.supervisor.get_stats(),
+        "camera_session": cam.worker.get_stats(),
+        "writer": cam.writer.get_stats(),
+        "retention": cam.retention.get_stats(),
+        "thumbnails": cam.thumbnails.get_stats(),
+        "roi_presets": sorted(config.ROI_PRESETS),
+        "recorder": cam.recorder.get_stats(),
+        "scheduler": schedulers[cam.name].get_stats(),
+        "motion": detector.get_stats() if detector else None
+    }
+
+
+@app.route('/status', defaults={'name': None})
+@app.route('/cameras/<name>/status')
+def status(name: Optional[str]):
     """
-    Get server and camera status.
+    Get server and camera status (default camera unless a camera is named).
     
     Returns:
         JSON response with system status
     """
+    cam = _camera_or_404(name)
     return jsonify({
         "status": "online",
         "timestamp": datetime.now().isoformat(),
-        "camera_index": config.CAMERA_INDEX,
-        "images_dir": config.IMAGES_DIR
+        **_camera_status(cam),
+        "cameras": camera_names()
     })
 
 
-@app.route('/test_camera')
-def test_camera():
+@app.route('/cameras')
+def list_cameras():
+    """
+    List configured cameras with their routes and session state.
+    
+    Returns:
+        JSON response with one entry per camera, default camera first
+    """
+    cameras = []
+    for name in camera_names():
+        cam = get_camera(name)
+        session = cam.worker.get_stats()
+        cameras.append({
+            "name": name,
+            "index": cam.settings.index,
+            "source": cam.settings.source or config.FRAME_SOURCE,
+            "state": cam.supervisor.state,
+            "running": session["running"],
+            "stream_clients": session["stream_clients"],
+            "video_feed": f"/cameras/{name}/video_feed",
+            "snapshot": f"/cameras/{name}/snapshot.jpg"
+        })
+    return jsonify({"default": cameras[0]["name"], "cameras": cameras})
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """
+    Prometheus metrics: camera, encoding, storage, streaming and HTTP latency.
+    
+    Returns:
+        Metrics in Prometheus text exposition format
+    """
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@app.route('/test_camera', defaults={'name': None})
+@app.route('/cameras/<name>/test_camera')
+def test_camera(name: Optional[str]):
     """
     Test camera connectivity.
     
     Returns:
         JSON response with camera test results
     """
-    logger.info("Camera test request received")
+    cam = _camera_or_404(name)
+    logger.info(f"Camera test request received ({cam.name})")
     
-    test_result = camera.test_camera()
+    test_result = cam.capture.test_camera()
     
     return jsonify({
         "success": test_result,
@@ -368,31 +1226,40 @@ def main():
     """
     Main entry point for the application.
     """
+    names = camera_names()
+    
     logger.info("="*60)
     logger.info("Edge IoT Camera Server Starting...")
     logger.info("="*60)
     logger.info(f"Images directory: {config.IMAGES_DIR}")
-    logger.info(f"Camera index: {config.CAMERA_INDEX}")
+    for name in names:
+        logger.info(f"Camera '{name}': index {get_camera(name).settings.index}")
     logger.info(f"Server will listen on: {config.HOST}:{config.PORT}")
     logger.info("="*60)
     
     # Create images directory if it doesn't exist
     os.makedirs(config.IMAGES_DIR, exist_ok=True)
     
-    # Test camera before starting server
-    logger.info("Testing camera connection...")
-    if camera.test_camera():
-        logger.info("✓ Camera test successful!")
+    for name in names:
+        cam = get_camera(name)
         
-        # Capture initial snapshot
-        logger.info("Capturing initial snapshot...")
-        success, filepath = capture_snapshot()
-        if success:
-            logger.info(f"✓ Initial snapshot saved: {filepath}")
-        else:
-            logger.warning("✗ Failed to capture initial snapshot")
-    else:
-        logger.warning("✗ Camera test failed! Server will start but camera may not work.")
+        # Probe the camera and take the initial snapshot in the background,
+        # so the server is reachable right away (state is shown in /status)
+        cam.supervisor.start()
+        
+        # Enforce retention on images left from previous runs. The first prune
+        # indexes snapshots the history does not know yet, which can take
+        # minutes on an SD card, so it must not delay binding the server.
+        threading.Thread(target=cam.retention.prune, name=f"retention-prune-{name}", daemon=True).start()
+        
+        if config.CAPTURE_SCHEDULER_ENABLED:
+            schedulers[name].start(cam.worker)
+        
+        if config.MOTION_ENABLED:
+            motion_detectors[name] = start_motion_detection(cam.worker, cam.writer, cam.history)
+        
+        if config.RECORDING_ENABLED:
+            cam.recorder.start(cam.worker)
     
     # Start Flask server
     logger.info("Starting web server...")
@@ -400,12 +1267,16 @@ def main():
     logger.info(f"Direct image URL: http://<your-server-ip>:{config.PORT}/snapshot.jpg")
     
     try:
-        app.run(
-            host=config.HOST,
-            port=config.PORT,
-            debug=config.DEBUG,
-            threaded=True
-        )
+        if config.SERVER_MODE == 'asyncio':
+            import async_server
+            async_server.run(app, config.HOST, config.PORT)
+        else:
+            app.run(
+                host=config.HOST,
+                port=config.PORT,
+                debug=config.DEBUG,
+                threaded=True
+            )
     except KeyboardInterrupt:
         logger.info("\nServer stopped by user")
     except Exception as e:
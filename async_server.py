@@ -0,0 +1,591 @@
+"""
+Asyncio server mode for the edge IoT camera server.
+
+Streams /video_feed from a single event loop instead of dedicating an OS
+thread to every viewer. One pump thread waits for new frames from the
+capture worker and wakes all stream clients at once; socket writes are
+non-blocking with per-client backpressure, so slow clients skip frames.
+All other routes are served by the Flask app, called through a minimal
+WSGI adapter in a thread pool, so both modes behave the same.
+"""
+import asyncio
+import io
+import json
+import logging
+import sys
+import threading
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+from urllib.parse import parse_qsl, unquote
+from werkzeug.wsgi import FileWrapper
+import config
+import metrics
+import websocket_push
+from camera import Frame, get_camera_settings, get_capture_worker
+
+logger = logging.getLogger(__name__)
+
+MAX_HEADER_BYTES = 65536
+MAX_BODY_BYTES = 1024 * 1024
+RESPONSE_BLOCK_BYTES = 256 * 1024  # WSGI response data sent per executor call
+VIDEO_FEED_PATH = re.compile(r'^(?:/cameras/([^/]+))?/video_feed$')
+VIDEO_WS_PATH = re.compile(r'^(?:/cameras/([^/]+))?/video_ws$')
+
+
+class RequestError(Exception):
+    """Malformed HTTP request; answered with 400 before the connection is closed."""
+
+
+def _file_wrapper(file, block_size: int = 8192) -> FileWrapper:
+    """
+    wsgi.file_wrapper for send_file: reads at least RESPONSE_BLOCK_BYTES at
+    a time (Werkzeug asks for 8 KiB), so large downloads need fewer
+    executor round trips.
+    """
+    return FileWrapper(file, max(block_size, RESPONSE_BLOCK_BYTES))
+
+
+class FramePump:
+    """
+    Bridges the blocking capture worker to asyncio.
+    A single thread waits for new frames, pre-encodes the default stream
+    variant and publishes the frame to the event loop, where all waiting
+    clients are woken by one event.
+    """
+    
+    def __init__(self, loop: asyncio.AbstractEventLoop, name: Optional[str] = None):
+        """
+        Args:
+            loop: Event loop serving the clients
+            name: Camera name (None = default camera)
+        """
+        self.loop = loop
+        self.worker = get_capture_worker(name)
+        self._clients = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._frame: Optional[Frame] = None
+        self._event = asyncio.Event()
+    
+    def add_client(self, width: Optional[int] = None, quality: int = config.STREAM_JPEG_QUALITY,
+                   roi: Optional[str] = None):
+        """
+        Register a stream client and start the pump if needed.
+        
+        Args:
+            width: Stream variant width the client receives (None = full size)
+            quality: Stream variant JPEG quality
+            roi: Stream variant ROI preset (None = whole frame)
+        """
+        self.worker.subscribe(width, quality, roi)
+        with self._lock:
+            self._clients += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"async-frame-pump-{self.worker.name}",
+                                                daemon=True)
+                self._thread.start()
+    
+    def remove_client(self, width: Optional[int] = None, quality: int = config.STREAM_JPEG_QUALITY,
+                      roi: Optional[str] = None):
+        """Unregister a stream client."""
+        with self._lock:
+            self._clients -= 1
+        self.worker.unsubscribe(width, quality, roi)
+    
+    async def next_frame(self, last_seq: int, timeout: float = 2.0) -> Optional[Frame]:
+        """
+        Wait for a frame newer than last_seq.
+        
+        Args:
+            last_seq: Sequence number of the last frame the client received
+            timeout: Maximum time to wait in seconds
+        
+        Returns:
+            Newest Frame, or None on timeout
+        """
+        frame = self._frame
+        if frame is not None and frame.seq != last_seq:
+            return frame
+        event = self._event
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        return self._frame
+    
+    def _publish(self, frame: Optional[Frame]):
+        """Store the newest frame and wake all waiting clients (event loop thread)."""
+        self._frame = frame
+        event, self._event = self._event, asyncio.Event()
+        event.set()
+    
+    def _run(self):
+        """Pump loop: runs while at least one stream client is connected."""
+        seq = 0
+        while True:
+            with self._lock:
+                if self._clients <= 0:
+                    self._thread = None
+                    break
+            
+            frame = self.worker.wait_for_frame(seq, timeout=1.0)
+            if frame is None:
+                continue
+            seq = frame.seq
+            
+            # Most clients use the default variant; encode it off the event loop
+            frame.mjpeg_part(None, config.STREAM_JPEG_QUALITY)
+            self.loop.call_soon_threadsafe(self._publish, frame)
+            frame = None
+
+
+class AsyncCameraServer:
+    """Minimal HTTP/1.1 server built on asyncio streams."""
+    
+    def __init__(self, flask_app, host: str = config.HOST, port: int = config.PORT,
+                 executor_workers: int = config.ASYNC_EXECUTOR_WORKERS):
+        """
+        Args:
+            flask_app: WSGI application serving the non-streaming routes
+            host: Listen address
+            port: Listen port
+            executor_workers: Threads for blocking work (OpenCV, Flask routes)
+        """
+        self.flask_app = flask_app
+        self.host = host
+        self.port = port
+        self.executor = ThreadPoolExecutor(max_workers=executor_workers, thread_name_prefix="async-exec")
+        self.pumps: Dict[str, FramePump] = {}
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.stream_clients = 0
+    
+    async def start(self):
+        """Bind the listening socket."""
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(self.executor)
+        self.server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port, limit=MAX_HEADER_BYTES
+        )
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.info(f"Async server listening on {self.host}:{self.port}")
+    
+    async def serve_forever(self):
+        """Start (if needed) and serve until cancelled."""
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+    
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve requests on one connection (keep-alive until a stream or close)."""
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, target, version, headers, body = request
+                path, _, query = target.partition('?')
+                path = unquote(path)
+                
+                match = VIDEO_FEED_PATH.match(path)
+                if match and method == 'GET':
+                    await self._stream(writer, match.group(1), query)
+                    break
+                
+                match = VIDEO_WS_PATH.match(path)
+                if match and method == 'GET' and websocket_push.is_upgrade(headers):
+                    await self._websocket(reader, writer, match.group(1), query, headers)
+                    break
+                
+                keep_alive = await self._call_wsgi(writer, method, path, query, version, headers, body)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.LimitOverrunError:
+            await self._send_simple(writer, 431, {"error": "Request header too large"})
+        except RequestError as e:
+            await self._send_simple(writer, 400, {"error": str(e)})
+        except Exception as e:
+            logger.error(f"Error handling connection: {e}")
+        finally:
+            writer.close()
+    
+    async def _read_request(self, reader: asyncio.StreamReader):
+        """
+        Read one request.
+        
+        Returns:
+            Tuple of (method, target, version, headers, body) or None on EOF
+        
+        Raises:
+            RequestError: If the request line or Content-Length is malformed
+        """
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError as e:
+            if e.partial.strip():
+                raise
+            return None
+        
+        lines = head.decode('latin-1').split('\r\n')
+        parts = lines[0].split(' ')
+        if len(parts) != 3 or not parts[2].startswith('HTTP/1.'):
+            raise RequestError(f"Malformed request line: {lines[0][:100]!r}")
+        method, target, version = parts
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        
+        length = headers.get('content-length') or '0'
+        if not length.isdigit():
+            raise RequestError(f"Invalid Content-Length: {length[:100]!r}")
+        length = int(length)
+        if length > MAX_BODY_BYTES:
+            raise ConnectionError("Request body too large")
+        body = await reader.readexactly(length) if length else b''
+        return method, target, version, headers, body
+    
+    async def _send_simple(self, writer: asyncio.StreamWriter, status: int, payload: dict):
+        """Send a small JSON response and close the connection."""
+        data = json.dumps(payload).encode()
+        reason = {400: 'Bad Request', 404: 'Not Found', 426: 'Upgrade Required',
+                  431: 'Request Header Fields Too Large'}.get(status, 'Error')
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode() + data
+        )
+        await writer.drain()
+    
+    def _pump(self, name: Optional[str]) -> FramePump:
+        """
+        Get the frame pump of a camera.
+        
+        Raises:
+            KeyError: If no camera has this name
+        """
+        name = get_camera_settings(name).name
+        pump = self.pumps.get(name)
+        if pump is None:
+            pump = self.pumps[name] = FramePump(asyncio.get_running_loop(), name)
+        return pump
+    
+    async def _stream(self, writer: asyncio.StreamWriter, name: Optional[str], query: str):
+        """Serve a Motion JPEG stream of one camera with non-blocking writes."""
+        from app import parse_roi, parse_stream_params
+        
+        start = time.perf_counter()
+        try:
+            pump = self._pump(name)
+        except KeyError:
+            await self._send_simple(writer, 404, {"error": f"Unknown camera: {name}"})
+            return
+        try:
+            args = dict(parse_qsl(query))
+            width, quality, fps = parse_stream_params(args)
+            roi = parse_roi(args)
+        except ValueError as e:
+            await self._send_simple(writer, 400, {"error": str(e)})
+            metrics.HTTP_REQUEST_SECONDS.labels('video_feed', 'GET', '400').observe(time.perf_counter() - start)
+            return
+        quality = quality or config.STREAM_JPEG_QUALITY
+        min_interval = 1.0 / fps if fps else 0.0
+        
+        loop = asyncio.get_running_loop()
+        pump.add_client(width, quality, roi)
+        self.stream_clients += 1
+        frame_count = 0
+        seq = 0
+        next_send = 0.0
+        
+        try:
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: multipart/x-mixed-replace; boundary=frame\r\n"
+                b"Cache-Control: no-cache\r\nConnection: close\r\n\r\n"
+            )
+            await writer.drain()
+            metrics.HTTP_REQUEST_SECONDS.labels('video_feed', 'GET', '200').observe(time.perf_counter() - start)
+            
+            while True:
+                if min_interval:
+                    delay = next_send - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                
+                frame = await pump.next_frame(seq)
+                if frame is None:
+                    if not pump.worker.is_running():
+                        logger.error("Capture worker stopped, ending stream")
+                        break
+                    continue
+                
+                if seq and frame.seq - seq > 1:
+                    pump.worker.record_dropped(frame.seq - seq - 1)
+                seq = frame.seq
+                
+                part = frame.cached_part(width, quality, roi)
+                if part is None:
+                    part = await loop.run_in_executor(None, frame.mjpeg_part, width, quality, roi)
+                # Release the Frame so its capture buffer can be reused
+                frame = None
+                if part is None:
+                    continue
+                
+                writer.write(part)
+                # Backpressure: a slow client waits here and then takes the newest frame
+                await writer.drain()
+                
+                next_send = max(next_send + min_interval, time.monotonic())
+                frame_count += 1
+        except (ConnectionError, asyncio.CancelledError):
+            logger.info("Video stream stopped by client")
+        finally:
+            self.stream_clients -= 1
+            pump.remove_client(width, quality, roi)
+            logger.info(f"Video stream ended. Total frames: {frame_count}")
+    
+    async def _websocket(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                         name: Optional[str], query: str, headers: Dict[str, str]):
+        """Push frames of one camera over a WebSocket with credit-based flow control."""
+        from app import parse_roi, parse_stream_params
+        
+        start = time.perf_counter()
+        try:
+            pump = self._pump(name)
+        except KeyError:
+            await self._send_simple(writer, 404, {"error": f"Unknown camera: {name}"})
+            return
+        try:
+            args = dict(parse_qsl(query))
+            width, quality, fps = parse_stream_params(args)
+            roi = parse_roi(args)
+        except ValueError as e:
+            await self._send_simple(writer, 400, {"error": str(e)})
+            return
+        key = headers.get('sec-websocket-key')
+        if not key:
+            await self._send_simple(writer, 426, {"error": "WebSocket upgrade required"})
+            return
+        quality = quality or config.STREAM_JPEG_QUALITY
+        min_interval = 1.0 / fps if fps else 0.0
+        
+        writer.write(websocket_push.handshake_response(key))
+        await writer.drain()
+        metrics.HTTP_REQUEST_SECONDS.labels('video_ws', 'GET', '101').observe(time.perf_counter() - start)
+        
+        loop = asyncio.get_running_loop()
+        credits = 0
+        credit_event = asyncio.Event()
+        closed = False
+        
+        async def read_messages():
+            nonlocal credits, closed
+            try:
+                while True:
+                    opcode, payload = await websocket_push.read_message_async(reader)
+                    granted, reply, close = websocket_push.handle_message(opcode, payload)
+                    if reply is not None:
+                        writer.write(reply)
+                    if close:
+                        break
+                    if granted:
+                        credits = min(websocket_push.MAX_CREDITS, credits + granted)
+                        credit_event.set()
+            except (ConnectionError, asyncio.IncompleteReadError, websocket_push.WebSocketError) as e:
+                logger.debug(f"WebSocket reader stopped: {e}")
+            finally:
+                closed = True
+                credit_event.set()
+        
+        reader_task = asyncio.ensure_future(read_messages())
+        pump.add_client(width, quality, roi)
+        self.stream_clients += 1
+        frame_count = 0
+        seq = 0
+        next_send = 0.0
+        
+        try:
+            while not closed:
+                # Wait for the client to grant a credit before taking a frame
+                if credits <= 0:
+                    credit_event.clear()
+                    await credit_event.wait()
+                    continue
+                if min_interval:
+                    delay = next_send - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                
+                frame = await pump.next_frame(seq)
+                if frame is None:
+                    if not pump.worker.is_running():
+                        logger.error("Capture worker stopped, ending WebSocket stream")
+                        break
+                    continue
+                if seq and frame.seq - seq > 1:
+                    pump.worker.record_dropped(frame.seq - seq - 1)
+                seq = frame.seq
+                
+                if frame.cached_part(width, quality, roi) is not None:
+                    message = websocket_push.frame_message(frame, width, quality, roi)
+                else:
+                    message = await loop.run_in_executor(None, websocket_push.frame_message,
+                                                         frame, width, quality, roi)
+                frame = None
+                if message is None:
+                    continue
+                
+                credits -= 1
+                writer.write(message[0])
+                writer.write(message[1])
+                await writer.drain()
+                next_send = max(next_send + min_interval, time.monotonic())
+                frame_count += 1
+            
+            if not closed:
+                writer.write(websocket_push.close_message())
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            logger.info("WebSocket stream stopped by client")
+        finally:
+            reader_task.cancel()
+            self.stream_clients -= 1
+            pump.remove_client(width, quality, roi)
+            logger.info(f"WebSocket stream ended. Total frames: {frame_count}")
+    
+    async def _call_wsgi(self, writer: asyncio.StreamWriter, method: str, path: str, query: str,
+                         version: str, headers: dict, body: bytes) -> bool:
+        """
+        Run the Flask app for one request in the executor and send the response.
+        The response body is streamed: blocks of about RESPONSE_BLOCK_BYTES
+        are read from the WSGI iterable in the executor and written with
+        backpressure, so downloads (recordings, time-lapse videos) are
+        never held in memory as a whole. Responses without a body (HEAD,
+        1xx, 204, 304) end with the head: no chunked framing is sent, or
+        the next request on a keep-alive connection would be misread.
+        
+        Returns:
+            True if the connection can be kept alive
+        """
+        peer = writer.get_extra_info('peername') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'SERVER_NAME': self.host,
+            'SERVER_PORT': str(self.port),
+            'SERVER_PROTOCOL': version,
+            'REMOTE_ADDR': peer[0],
+            'REMOTE_PORT': str(peer[1]),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+            'wsgi.file_wrapper': _file_wrapper,
+        }
+        for name, value in headers.items():
+            if name == 'content-type':
+                environ['CONTENT_TYPE'] = value
+            elif name == 'content-length':
+                environ['CONTENT_LENGTH'] = value
+            else:
+                environ['HTTP_' + name.upper().replace('-', '_')] = value
+        
+        def run():
+            response = {}
+            
+            def start_response(status, response_headers, exc_info=None):
+                response['status'] = status
+                response['headers'] = response_headers
+            
+            result = self.flask_app(environ, start_response)
+            iterator = iter(result)
+            try:
+                # The first block also makes Flask call start_response
+                first = read_block(iterator)
+            except BaseException:
+                close(result)
+                raise
+            return response['status'], response['headers'], result, iterator, first
+        
+        def read_block(iterator) -> bytes:
+            parts = []
+            size = 0
+            for chunk in iterator:
+                if chunk:
+                    parts.append(chunk)
+                    size += len(chunk)
+                    if size >= RESPONSE_BLOCK_BYTES:
+                        break
+            return b''.join(parts)
+        
+        def close(result):
+            if hasattr(result, 'close'):
+                result.close()
+        
+        loop = asyncio.get_running_loop()
+        status, response_headers, result, iterator, block = await loop.run_in_executor(None, run)
+        
+        try:
+            length = None
+            head = [f"HTTP/1.1 {status}"]
+            for name, value in response_headers:
+                lower = name.lower()
+                if lower == 'content-length':
+                    length = value
+                elif lower not in ('connection', 'transfer-encoding'):
+                    head.append(f"{name}: {value}")
+            
+            keep_alive = (version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close')
+            code = int(status.split(' ', 1)[0])
+            has_body = method != 'HEAD' and code >= 200 and code not in (204, 304)
+            chunked = False
+            if method == 'HEAD' and length is None:
+                length = str(len(block))
+            if length is not None:
+                head.append(f"Content-Length: {length}")
+            elif keep_alive and has_body:
+                chunked = True
+                head.append("Transfer-Encoding: chunked")
+            head.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+            writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+            
+            if has_body:
+                while block:
+                    if chunked:
+                        writer.write(f"{len(block):x}\r\n".encode('latin-1') + block + b'\r\n')
+                    else:
+                        writer.write(block)
+                    await writer.drain()
+                    block = await loop.run_in_executor(None, read_block, iterator)
+                if chunked:
+                    writer.write(b'0\r\n\r\n')
+            await writer.drain()
+        finally:
+            await loop.run_in_executor(None, close, result)
+        return keep_alive
+
+
+def run(flask_app, host: str = config.HOST, port: int = config.PORT):
+    """
+    Run the asyncio server until interrupted.
+    
+    Args:
+        flask_app: Flask application for the non-streaming routes
+        host: Listen address
+        port: Listen port
+    """
+    server = AsyncCameraServer(flask_app, host, port)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        logger.info("Async server stopped by user")
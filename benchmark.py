@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Benchmark and load-test harness for the capture, encode and HTTP streaming
+paths. Runs against the synthetic frame source, so no camera is needed.
+Results are written to a JSON file for comparison across releases.
+
+Usage:
+    python3 benchmark.py --output bench_results.json
+"""
+import argparse
+import http.client
+import json
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import List
+
+import config
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """
+    Nearest-rank percentile of a list of values.
+    
+    Args:
+        values: Samples
+        pct: Percentile (0-100)
+    
+    Returns:
+        Percentile value, 0.0 for an empty list
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def summarize_ms(samples: List[float]) -> dict:
+    """Summarize latency samples given in seconds as milliseconds."""
+    ms = [s * 1000 for s in samples]
+    return {
+        "count": len(ms),
+        "mean_ms": round(sum(ms) / len(ms), 3) if ms else 0.0,
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+        "max_ms": round(max(ms), 3) if ms else 0.0
+    }
+
+
+def bench_generate_frames(num_frames: int) -> dict:
+    """Measure frames/sec and inter-frame latency of generate_frames()."""
+    from camera import CameraCapture
+    
+    stream = CameraCapture().generate_frames()
+    next(stream)  # first frame includes device open and warmup
+    
+    intervals = []
+    start = last = time.perf_counter()
+    for _ in range(num_frames):
+        next(stream)
+        now = time.perf_counter()
+        intervals.append(now - last)
+        last = now
+    elapsed = time.perf_counter() - start
+    stream.close()
+    
+    result = summarize_ms(intervals)
+    result["fps"] = round(num_frames / elapsed, 2)
+    return result
+
+
+def bench_imencode(iterations: int, qualities: List[int]) -> dict:
+    """Measure cv2.imencode cost and output size per JPEG quality."""
+    import cv2
+    from frame_source import SyntheticSource
+    
+    source = SyntheticSource(config.CAMERA_WIDTH, config.CAMERA_HEIGHT, fps=0)
+    source.open()
+    frames = [source.read()[1] for _ in range(min(iterations, 30))]
+    source.release()
+    
+    results = {}
+    for quality in qualities:
+        params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        samples = []
+        size = 0
+        for i in range(iterations):
+            frame = frames[i % len(frames)]
+            start = time.perf_counter()
+            ret, buffer = cv2.imencode('.jpg', frame, params)
+            samples.append(time.perf_counter() - start)
+            size += len(buffer)
+        result = summarize_ms(samples)
+        result["mean_bytes"] = size // iterations
+        results[str(quality)] = result
+    return results
+
+
+def bench_capture_image(warm_runs: int, cold_runs: int) -> dict:
+    """Measure capture_image() end-to-end time for cold and warm sessions."""
+    from camera import CameraCapture, get_capture_worker
+    
+    camera = CameraCapture()
+    worker = get_capture_worker(camera.name)
+    idle_timeout = worker.idle_timeout
+    
+    # Cold: the session is idle, so every capture opens and warms up the device
+    cold = []
+    failures = 0
+    worker.idle_timeout = 0
+    for _ in range(cold_runs):
+        while worker.is_running():
+            time.sleep(0.01)
+        start = time.perf_counter()
+        success, _ = camera.capture_image(save_with_timestamp=True)
+        cold.append(time.perf_counter() - start)
+        failures += not success
+    
+    # Warm: the device stays open between captures
+    worker.idle_timeout = idle_timeout
+    camera.capture_image(save_with_timestamp=False)
+    warm = []
+    for _ in range(warm_runs):
+        start = time.perf_counter()
+        success, _ = camera.capture_image(save_with_timestamp=True)
+        warm.append(time.perf_counter() - start)
+        failures += not success
+    
+    return {"cold": summarize_ms(cold), "warm": summarize_ms(warm), "failures": failures}
+
+
+def bench_warmup(cold_runs: int) -> dict:
+    """
+    Measure cold capture_image() time with the fixed and the adaptive
+    warmup. Set --exposure-seconds to let the synthetic source emulate an
+    auto-exposure loop that has to settle first.
+    """
+    from camera import CameraCapture, get_capture_worker
+    
+    camera = CameraCapture()
+    worker = get_capture_worker(camera.name)
+    idle_timeout = worker.idle_timeout
+    adaptive = config.CAMERA_WARMUP_ADAPTIVE
+    worker.idle_timeout = 0
+    results = {}
+    
+    try:
+        for mode in ('fixed', 'adaptive'):
+            config.CAMERA_WARMUP_ADAPTIVE = mode == 'adaptive'
+            times = []
+            warmups = []
+            failures = 0
+            for _ in range(cold_runs):
+                while worker.is_running():
+                    time.sleep(0.01)
+                start = time.perf_counter()
+                success, _ = camera.capture_image(save_with_timestamp=False)
+                times.append(time.perf_counter() - start)
+                failures += not success
+                warmups.append(worker.get_stats()["warmup"])
+            results[mode] = {
+                "cold": summarize_ms(times),
+                "warmup_frames": [warmup["frames"] for warmup in warmups if warmup],
+                "converged": [warmup.get("converged") for warmup in warmups if warmup],
+                "failures": failures
+            }
+            print(f"  {mode}: cold p50 {results[mode]['cold']['p50_ms']} ms")
+    finally:
+        config.CAMERA_WARMUP_ADAPTIVE = adaptive
+        worker.idle_timeout = idle_timeout
+    
+    return results
+
+
+def _stream_client(port: int, duration: float, results: list, index: int):
+    """Read /video_feed for a fixed time and count received frames."""
+    boundary = b'--frame\r\n'
+    frames = 0
+    received = 0
+    try:
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        conn.request('GET', '/video_feed')
+        response = conn.getresponse()
+        tail = b''
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            chunk = response.read1(65536)
+            if not chunk:
+                break
+            received += len(chunk)
+            data = tail + chunk
+            frames += data.count(boundary)
+            tail = data[-(len(boundary) - 1):]
+        conn.close()
+    except Exception as e:
+        print(f"  client {index} error: {e}", file=sys.stderr)
+    results[index] = (frames, received)
+
+
+def _start_server(mode: str):
+    """
+    Start the app on a free local port in a background thread.
+    
+    Returns:
+        Tuple of (port, shutdown function)
+    """
+    import app as app_module
+    
+    if mode == 'asyncio':
+        import asyncio
+        from async_server import AsyncCameraServer
+        
+        server = AsyncCameraServer(app_module.app, '127.0.0.1', 0)
+        loop = asyncio.new_event_loop()
+        asyncio.run_coroutine_threadsafe(server.start(), loop)
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+        while server.server is None:
+            time.sleep(0.01)
+        return server.port, lambda: loop.call_soon_threadsafe(server.server.close)
+    
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_port, server.shutdown
+
+
+def bench_http_streaming(client_counts: List[int], duration: float, mode: str = 'flask') -> dict:
+    """Measure /video_feed throughput with concurrent HTTP clients."""
+    port, shutdown = _start_server(mode)
+    
+    results = {}
+    try:
+        for count in client_counts:
+            per_client = [None] * count
+            threads = [
+                threading.Thread(target=_stream_client, args=(port, duration, per_client, i))
+                for i in range(count)
+            ]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            
+            frames = [r[0] for r in per_client if r]
+            total_bytes = sum(r[1] for r in per_client if r)
+            results[str(count)] = {
+                "clients": count,
+                "total_fps": round(sum(frames) / duration, 2),
+                "mean_client_fps": round(sum(frames) / len(frames) / duration, 2) if frames else 0.0,
+                "min_client_fps": round(min(frames) / duration, 2) if frames else 0.0,
+                "total_mbit_s": round(total_bytes * 8 / duration / 1e6, 2)
+            }
+            print(f"  {count:3d} clients: {results[str(count)]['total_fps']} fps total, "
+                  f"{results[str(count)]['mean_client_fps']} fps/client")
+    finally:
+        shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Camera server benchmark (no hardware needed)")
+    parser.add_argument('--output', default='bench_results.json', help="JSON results file")
+    parser.add_argument('--source-fps', type=float, default=config.CAMERA_FPS,
+                        help="Synthetic source frame rate (0 = unthrottled)")
+    parser.add_argument('--frames', type=int, default=300, help="Frames for generate_frames benchmark")
+    parser.add_argument('--encode-iterations', type=int, default=200)
+    parser.add_argument('--qualities', type=int, nargs='+', default=[50, 70, 85, 95])
+    parser.add_argument('--capture-runs', type=int, default=20, help="Warm capture_image runs")
+    parser.add_argument('--cold-runs', type=int, default=3, help="Cold capture_image runs")
+    parser.add_argument('--exposure-seconds', type=float, default=config.SYNTHETIC_EXPOSURE_SECONDS,
+                        help="Emulated auto-exposure settling time of the synthetic source")
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--duration', type=float, default=5.0, help="Seconds per HTTP load level")
+    parser.add_argument('--server', choices=['flask', 'asyncio'], default=config.SERVER_MODE,
+                        help="Server mode for the HTTP benchmark")
+    parser.add_argument('--passthrough', action='store_true',
+                        help="MJPEG passthrough (the synthetic source encodes like a camera would)")
+    parser.add_argument('--resolution', default=f"{config.CAMERA_WIDTH}x{config.CAMERA_HEIGHT}",
+                        help="Synthetic frame size as WIDTHxHEIGHT, e.g. 1920x1080")
+    parser.add_argument('--encoder-workers', type=int, default=config.ENCODER_WORKERS,
+                        help="Encoder pool threads (0 = encode in client threads)")
+    args = parser.parse_args()
+    width, _, height = args.resolution.partition('x')
+    
+    # Configure before importing camera/app so every path uses the synthetic source
+    images_dir = tempfile.mkdtemp(prefix='camera-bench-')
+    config.FRAME_SOURCE = 'synthetic'
+    config.CAMERA_FPS = args.source_fps
+    config.CAMERA_MJPEG_PASSTHROUGH = args.passthrough
+    config.CAMERA_WIDTH, config.CAMERA_HEIGHT = int(width), int(height)
+    config.ENCODER_WORKERS = args.encoder_workers
+    config.SYNTHETIC_EXPOSURE_SECONDS = args.exposure_seconds
+    config.IMAGES_DIR = images_dir
+    
+    import cv2
+    import numpy as np
+    import logging
+    logging.disable(logging.INFO)
+    
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+            "frame_source": config.FRAME_SOURCE,
+            "resolution": [config.CAMERA_WIDTH, config.CAMERA_HEIGHT],
+            "source_fps": args.source_fps,
+            "server_mode": args.server,
+            "passthrough": args.passthrough,
+            "encoder_workers": args.encoder_workers,
+            "exposure_seconds": args.exposure_seconds
+        },
+        "results": {}
+    }
+    
+    try:
+        print("[1/5] generate_frames...")
+        report["results"]["generate_frames"] = bench_generate_frames(args.frames)
+        
+        print("[2/5] cv2.imencode...")
+        report["results"]["imencode"] = bench_imencode(args.encode_iterations, args.qualities)
+        
+        print("[3/5] capture_image...")
+        report["results"]["capture_image"] = bench_capture_image(args.capture_runs, args.cold_runs)
+        
+        print("[4/5] warmup (fixed vs adaptive)...")
+        report["results"]["warmup"] = bench_warmup(args.cold_runs)
+        
+        print("[5/5] HTTP /video_feed...")
+        report["results"]["http_video_feed"] = bench_http_streaming(args.clients, args.duration, args.server)
+    finally:
+        shutil.rmtree(images_dir, ignore_errors=True)
+    
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,12 +4,26 @@ Designed for headless Ubuntu Server with USB camera on /dev/video0.
 """
 import cv2
 import os
+import atexit
 import logging
-from datetime import datetime
-from typing import Optional, Tuple, Generator
+from datetime import datetime, timezone
+from typing import Callable, Dict, Generator, List, Optional, Tuple
 import threading
 import time
+import weakref
+import numpy as np
 import config
+from frame_source import create_frame_source, jpeg_dimensions, resolve_device
+from encoder import EncoderPool
+from storage import RetentionIndex, SnapshotWriter, StoredImage, content_hash
+from history import SnapshotHistory
+from timelapse import TimelapseBuilder
+from thumbnails import DerivativeCache
+from recorder import SegmentRecorder
+from supervisor import CameraSupervisor
+from quality import FrameQuality, analyze, analyze_jpeg
+from warmup import get_warmup_profiles, settle
+import metrics
 
 # Setup logging
 logging.basicConfig(
@@ -18,68 +32,149 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Global lock for camera access (only one thread can use camera at a time)
-camera_lock = threading.Lock()
+# Multipart framing around every JPEG in a Motion JPEG stream
+MJPEG_PART_HEADER = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+MJPEG_PART_TRAILER = b'\r\n'
+
+
+class CameraSettings:
+    """Device and storage settings of one named camera."""
+    
+    def __init__(self, name: str, index: int = config.CAMERA_INDEX,
+                 width: Optional[int] = None, height: Optional[int] = None,
+                 fps: Optional[float] = None, source: Optional[str] = None,
+                 replay_path: Optional[str] = None, images_dir: Optional[str] = None,
+                 history_db_path: Optional[str] = None, passthrough: Optional[bool] = None,
+                 device: Optional[str] = None):
+        """
+        Args:
+            name: Camera name used in routes and storage paths
+            index: Camera device index (0 for /dev/video0)
+            width: Frame width (None = CAMERA_WIDTH)
+            height: Frame height (None = CAMERA_HEIGHT)
+            fps: Frame rate (None = CAMERA_FPS)
+            source: Frame source type (None = FRAME_SOURCE)
+            replay_path: Recording for the replay source (None = REPLAY_PATH)
+            images_dir: Snapshot directory (None = IMAGES_DIR)
+            history_db_path: Snapshot history database (None = default location)
+            passthrough: Forward the camera's MJPEG frames (None = CAMERA_MJPEG_PASSTHROUGH)
+            device: Stable device path or serial, resolved on every open (overrides index)
+        """
+        self.name = name
+        self.index = index
+        self.device = device
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.source = source
+        self.replay_path = replay_path
+        self.images_dir = images_dir or config.IMAGES_DIR
+        self.history_db_path = history_db_path
+        self.passthrough = passthrough
+
+
+def load_camera_settings() -> List[CameraSettings]:
+    """
+    Read the camera list from config.CAMERAS.
+    Without CAMERAS a single camera named 'default' uses the CAMERA_*
+    settings and stores snapshots directly in IMAGES_DIR.
+    
+    Returns:
+        List of CameraSettings, default camera first
+    
+    Raises:
+        ValueError: If the configuration is invalid
+    """
+    if not config.CAMERAS:
+        return [CameraSettings('default', config.CAMERA_INDEX, device=config.CAMERA_DEVICE)]
+    
+    settings = []
+    devices = set()
+    for name, options in config.CAMERAS.items():
+        if not name or '/' in name:
+            raise ValueError(f"Invalid camera name: {name!r}")
+        options = dict(options)
+        index = options.pop('index', config.CAMERA_INDEX)
+        source = options.get('source') or config.FRAME_SOURCE
+        if source == 'v4l2':
+            device = options.get('device') or index
+            if device in devices:
+                raise ValueError(f"Camera device {device} is configured twice")
+            devices.add(device)
+        images_dir = os.path.join(config.IMAGES_DIR, name)
+        settings.append(CameraSettings(
+            name, index, images_dir=images_dir,
+            history_db_path=os.path.join(images_dir, 'snapshots.db'), **options
+        ))
+    
+    default = config.DEFAULT_CAMERA
+    if default is not None:
+        if default not in config.CAMERAS:
+            raise ValueError(f"DEFAULT_CAMERA {default!r} is not in CAMERAS")
+        settings.sort(key=lambda item: item.name != default)
+    return settings
 
 
 class CameraCapture:
     """
     Handles USB camera operations for capturing images.
     Uses OpenCV (cv2) with headless backend suitable for Ubuntu Server.
-    Thread-safe with automatic locking.
+    Frames come from the source configured for the camera.
+    Thread-safe: every camera has its own device lock.
     """
     
-    def __init__(self, camera_index: int = config.CAMERA_INDEX):
+    def __init__(self, name: Optional[str] = None):
         """
         Initialize camera capture.
         
         Args:
-            camera_index: Camera device index (0 for /dev/video0)
+            name: Camera name (None = default camera)
         """
-        self.camera_index = camera_index
+        self.settings = get_camera_settings(name)
+        self.name = self.settings.name
+        self.camera_index = self.settings.index
         self.camera = None
+        self.lock = get_camera_lock(self.name)
         
         # Ensure images directory exists
-        os.makedirs(config.IMAGES_DIR, exist_ok=True)
-        logger.info(f"Images directory: {config.IMAGES_DIR}")
+        os.makedirs(self.settings.images_dir, exist_ok=True)
+        logger.info(f"Images directory ({self.name}): {self.settings.images_dir}")
     
     def _open_camera(self) -> bool:
         """
-        Open camera connection with proper settings for headless operation.
+        Open the configured frame source (USB camera by default).
         
         Returns:
             True if camera opened successfully, False otherwise
         """
         try:
-            # Use V4L2 backend for Linux USB cameras
-            self.camera = cv2.VideoCapture(
-                self.camera_index,
-                cv2.CAP_V4L2
-            )
-            
-            if not self.camera.isOpened():
-                logger.error(f"Failed to open camera at index {self.camera_index}")
-                return False
+            settings = self.settings
+            if settings.device and (settings.source or config.FRAME_SOURCE) == 'v4l2':
+                # The index may change when a USB camera is plugged back in
+                index = resolve_device(settings.device)
+                if index is None:
+                    logger.error(f"Camera device not found: {settings.device}")
+                    return False
+                if index != self.camera_index:
+                    logger.info(f"Camera '{self.name}' found at /dev/video{index}")
+                    self.camera_index = index
             
-            # Set camera properties
-            self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, config.CAMERA_WIDTH)
-            self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, config.CAMERA_HEIGHT)
-            self.camera.set(cv2.CAP_PROP_FPS, config.CAMERA_FPS)
+            self.camera = create_frame_source(self.camera_index, settings.width, settings.height,
+                                              settings.fps, settings.source, settings.replay_path,
+                                              settings.passthrough)
             
-            # Try to enable auto exposure and auto white balance
-            self.camera.set(cv2.CAP_PROP_AUTO_EXPOSURE, 0.75)  # Auto exposure
-            self.camera.set(cv2.CAP_PROP_AUTOFOCUS, 1)  # Auto focus if available
-            
-            # Log actual camera settings
-            actual_width = self.camera.get(cv2.CAP_PROP_FRAME_WIDTH)
-            actual_height = self.camera.get(cv2.CAP_PROP_FRAME_HEIGHT)
-            actual_fps = self.camera.get(cv2.CAP_PROP_FPS)
+            with metrics.CAMERA_OPEN_SECONDS.labels(self.name).time():
+                opened = self.camera.open()
+            if not opened:
+                self.camera.release()
+                self.camera = None
+                return False
             
-            logger.info(f"Camera opened: {actual_width}x{actual_height} @ {actual_fps}fps")
             return True
             
         except Exception as e:
             logger.error(f"Error opening camera: {e}")
+            self.camera = None
             return False
     
     def _close_camera(self):
@@ -89,69 +184,117 @@ class CameraCapture:
             self.camera = None
             logger.info("Camera released")
     
-    def capture_image(self, save_with_timestamp: bool = True) -> Tuple[bool, Optional[str]]:
+    def capture_image(self, save_with_timestamp: bool = True, min_brightness: Optional[float] = None,
+                      min_sharpness: Optional[float] = None,
+                      timeout: float = config.QUALITY_RETRY_SECONDS) -> Tuple[bool, Optional[str]]:
         """
         Capture a single frame from the camera and save it to disk.
-        Thread-safe: uses lock to prevent concurrent camera access.
+        Uses the shared warm capture session, so the device is only opened
+        and warmed up if it was idle.
+        
+        With quality thresholds, newer frames are taken until one meets
+        them (e.g. while exposure settles after opening); if none does
+        within the timeout, nothing is stored.
         
         Args:
             save_with_timestamp: If True, saves both timestamped and latest versions
+            min_brightness: Minimum mean luminance 0-255 (None = no limit)
+            min_sharpness: Minimum Laplacian variance sharpness (None = no limit)
+            timeout: Maximum time to wait for a frame meeting the thresholds
         
         Returns:
             Tuple of (success: bool, filepath: Optional[str])
         """
-        # Acquire lock to ensure exclusive camera access
-        with camera_lock:
-            logger.debug("Camera lock acquired for capture")
-            
-            # Open camera
-            if not self._open_camera():
+        # Take the newest frame from the warm capture session
+        worker = get_capture_worker(self.name)
+        frame = worker.capture_frame()
+        
+        if frame is None:
+            logger.error("Failed to capture frame from camera")
+            return False, None
+        
+        if min_brightness is not None or min_sharpness is not None:
+            frame = self._wait_for_quality(worker, frame, min_brightness, min_sharpness, timeout)
+            if frame is None:
                 return False, None
+        
+        logger.info(f"Frame captured: {frame.width}x{frame.height}")
+        
+        try:
+            return self._save_frame(frame, save_with_timestamp)
+        except Exception as e:
+            logger.error(f"Error during image capture: {e}")
+            return False, None
+    
+    def _wait_for_quality(self, worker, frame, min_brightness: Optional[float],
+                          min_sharpness: Optional[float], timeout: float):
+        """
+        Take newer frames until one meets the quality thresholds.
+        
+        Returns:
+            The first frame meeting the thresholds, or None on timeout
+        """
+        deadline = time.monotonic() + timeout
+        tried = 0
+        result = None
+        while True:
+            if not frame.placeholder:
+                result = frame.image_quality
+                tried += 1
+                if result is not None and result.meets(min_brightness, min_sharpness):
+                    if tried > 1:
+                        logger.info(f"Quality threshold met after {tried} frames")
+                    return frame
             
-            try:
-                # Allow camera to warm up (important for USB cameras)
-                # Some cameras need more warm-up time
-                logger.info("Warming up camera...")
-                for i in range(10):
-                    ret, _ = self.camera.read()
-                    if i % 3 == 0:
-                        logger.debug(f"Warmup frame {i+1}/10")
-                
-                # Small delay for camera stabilization
-                time.sleep(0.5)
-                
-                # Capture frame
-                ret, frame = self.camera.read()
-                
-                if not ret or frame is None:
-                    logger.error("Failed to capture frame from camera")
-                    return False, None
-                
-                logger.info(f"Frame captured: {frame.shape}")
-                
-                # Save latest snapshot (always overwrite)
-                latest_path = os.path.join(config.IMAGES_DIR, config.LATEST_IMAGE_NAME)
-                cv2.imwrite(latest_path, frame, [cv2.IMWRITE_JPEG_QUALITY, 95])
-                logger.info(f"Latest snapshot saved: {latest_path}")
-                
-                # Save timestamped version if requested
-                if save_with_timestamp:
-                    timestamp = datetime.now().strftime(config.TIMESTAMP_FORMAT)
-                    timestamped_filename = f"snapshot_{timestamp}.jpg"
-                    timestamped_path = os.path.join(config.IMAGES_DIR, timestamped_filename)
-                    cv2.imwrite(timestamped_path, frame, [cv2.IMWRITE_JPEG_QUALITY, 95])
-                    logger.info(f"Timestamped snapshot saved: {timestamped_path}")
-                
-                return True, latest_path
-                
-            except Exception as e:
-                logger.error(f"Error during image capture: {e}")
-                return False, None
-                
-            finally:
-                # Always release camera
-                self._close_camera()
-                logger.debug("Camera lock released")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            newer = worker.wait_for_frame(frame.seq, timeout=remaining)
+            if newer is None:
+                if not worker.is_running():
+                    break
+                continue
+            frame = newer
+        
+        last = f" (last: brightness {result.brightness:.1f}, sharpness {result.sharpness:.1f})" if result else ""
+        logger.warning(f"No frame met the quality thresholds within {timeout}s{last}")
+        return None
+    
+    def _save_frame(self, frame, save_with_timestamp: bool) -> Tuple[bool, Optional[str]]:
+        """
+        Hand a captured frame to the background snapshot writer.
+        Returns as soon as the frame is encoded and the snapshot cache is
+        updated; the disk writes finish asynchronously.
+        
+        Passthrough frames are stored as the camera's own JPEG without
+        decoding or re-encoding.
+        
+        Args:
+            frame: Captured Frame
+            save_with_timestamp: If True, saves both timestamped and latest versions
+        
+        Returns:
+            Tuple of (success: bool, filepath: Optional[str])
+        """
+        writer = get_camera(self.name).writer
+        if frame.native_jpeg is not None:
+            job = writer.submit(None, save_with_timestamp, frame.captured_at, jpeg=frame.native_jpeg,
+                                image_quality=frame.image_quality)
+        else:
+            # Copy out of the ring buffer; the writer owns its frame
+            job = writer.submit(frame.image.copy(), save_with_timestamp, frame.captured_at,
+                                image_quality=frame.image_quality)
+        
+        if not job.encoded.wait(timeout=10.0):
+            logger.error("Timed out waiting for snapshot encoding")
+            return False, None
+        
+        if job.written.is_set() and not job.success:
+            logger.error("Failed to store snapshot")
+            return False, None
+        
+        latest_path = os.path.join(self.settings.images_dir, config.LATEST_IMAGE_NAME)
+        return True, latest_path
     
     def test_camera(self) -> bool:
         """
@@ -161,7 +304,12 @@ class CameraCapture:
         Returns:
             True if camera test successful, False otherwise
         """
-        with camera_lock:
+        # The device is busy but healthy while the capture worker streams
+        if get_capture_worker(self.name).latest_frame() is not None:
+            logger.info("✓ Camera test successful (live stream active)")
+            return True
+        
+        with self.lock:
             logger.info("Testing camera connection...")
             
             if not self._open_camera():
@@ -185,76 +333,1316 @@ class CameraCapture:
             finally:
                 self._close_camera()
     
-    def generate_frames(self) -> Generator[bytes, None, None]:
+    def generate_frames(self, width: Optional[int] = None, quality: Optional[int] = None,
+                        fps: Optional[float] = None, roi: Optional[str] = None) -> Generator[bytes, None, None]:
         """
         Generate video frames for streaming.
         Yields JPEG encoded frames in Motion JPEG format.
-        Thread-safe: uses lock for each frame to allow capture during streaming.
+        Frames come from the shared capture worker, so any number of clients
+        can stream without touching the camera device themselves. Each
+        distinct (width, quality, roi) variant is encoded once per frame and
+        shared by all clients that request it.
+        
+        Args:
+            width: Output width in pixels (None = full resolution)
+            quality: JPEG quality (None = STREAM_JPEG_QUALITY)
+            fps: Maximum frame rate for this client (None = device rate)
+            roi: Name of a ROI_PRESETS region to crop to (None = whole frame)
         
         Yields:
             JPEG encoded frame bytes
         """
         logger.info("Starting video stream...")
+        worker = get_capture_worker(self.name)
+        quality = quality or config.STREAM_JPEG_QUALITY
+        worker.subscribe(width, quality, roi)
+        min_interval = 1.0 / fps if fps else 0.0
+        next_send = 0.0
         frame_count = 0
+        dropped = 0
+        seq = 0
         
         try:
             while True:
-                # Acquire lock for each frame (allows other operations between frames)
-                with camera_lock:
-                    # Open camera if not open
-                    if self.camera is None or not self.camera.isOpened():
-                        if not self._open_camera():
-                            logger.error("Failed to open camera for streaming")
-                            break
-                        # Warmup only on first open
-                        if frame_count == 0:
-                            for _ in range(5):
-                                self.camera.read()
-                    
-                    # Read frame
-                    ret, frame = self.camera.read()
-                    
-                    if not ret or frame is None:
-                        logger.warning("Failed to read frame from camera")
-                        self._close_camera()
-                        continue
-                    
-                    # Encode frame as JPEG
-                    ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-                    
-                    if not ret:
-                        logger.warning("Failed to encode frame")
-                        continue
-                    
-                    frame_bytes = buffer.tobytes()
+                # Honor the client's frame rate cap; frames captured meanwhile are skipped
+                if min_interval:
+                    delay = next_send - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                
+                # Always take the newest frame; a slow client never gets a backlog
+                frame = worker.wait_for_frame(seq)
                 
-                # Yield frame outside of lock (allows other threads to access camera)
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+                if frame is None:
+                    if not worker.is_running():
+                        logger.error("Capture worker stopped, ending stream")
+                        break
+                    continue
                 
+                if seq and frame.seq - seq > 1:
+                    skipped = frame.seq - seq - 1
+                    dropped += skipped
+                    worker.record_dropped(skipped)
+                seq = frame.seq
+                
+                # The framed part is shared by all clients of this variant;
+                # drop the Frame before yielding so its buffer can be reused
+                part = frame.mjpeg_part(width, quality, roi)
+                frame = None
+                if part is None:
+                    continue
+                
+                yield part
+                
+                next_send = max(next_send + min_interval, time.monotonic())
                 frame_count += 1
                 if frame_count % 100 == 0:
-                    logger.debug(f"Streamed {frame_count} frames")
+                    logger.debug(f"Streamed {frame_count} frames ({dropped} skipped)")
+                    if not min_interval and dropped > frame_count:
+                        logger.warning(f"Slow stream client: skipped {dropped} of "
+                                       f"{dropped + frame_count} frames")
                     
         except GeneratorExit:
             logger.info("Video stream stopped by client")
         except Exception as e:
             logger.error(f"Error during video streaming: {e}")
         finally:
-            with camera_lock:
-                self._close_camera()
-            logger.info(f"Video stream ended. Total frames: {frame_count}")
+            worker.unsubscribe(width, quality, roi)
+            logger.info(f"Video stream ended. Total frames: {frame_count}, skipped: {dropped}")
+
+
+def roi_box(region: Tuple[float, float, float, float], width: int, height: int) -> Tuple[int, int, int, int]:
+    """
+    Convert a region given as fractions of the frame to pixels.
+    
+    Args:
+        region: (x, y, width, height) as fractions of the frame size
+        width: Frame width
+        height: Frame height
+    
+    Returns:
+        Tuple of (left, top, right, bottom) in pixels, at least 1x1 and
+        clipped to the frame
+    """
+    x, y, w, h = region
+    left = min(max(0, round(x * width)), width - 1)
+    top = min(max(0, round(y * height)), height - 1)
+    right = min(width, max(left + 1, round((x + w) * width)))
+    bottom = min(height, max(top + 1, round((y + h) * height)))
+    return left, top, right, bottom
+
+
+def variant_key(width: Optional[int], quality: int, roi: Optional[str],
+                frame_width: int, frame_height: int) -> Tuple[Optional[int], int, Optional[str]]:
+    """
+    Normalize a stream variant: widths at or above the width of the
+    (cropped) source mean full size, so e.g. ?width=641 on a 640 pixel
+    camera is the same variant as no width at all.
+    
+    Args:
+        width: Requested width (None = full size)
+        quality: JPEG quality
+        roi: Name of a ROI_PRESETS region (None = whole frame)
+        frame_width: Width of the captured frame
+        frame_height: Height of the captured frame
+    
+    Returns:
+        Tuple of (width, quality, roi)
+    """
+    if width is not None:
+        if roi is None:
+            source_width = frame_width
+        else:
+            left, _, right, _ = roi_box(config.ROI_PRESETS[roi], frame_width, frame_height)
+            source_width = right - left
+        if width >= source_width:
+            width = None
+    return width, quality, roi
 
 
-def capture_snapshot() -> Tuple[bool, Optional[str]]:
+class Frame:
+    """
+    A captured frame shared by all consumers.
+    JPEG variants are encoded lazily, once per (width, quality, roi), by
+    the first consumer that asks for them; others wait for and reuse the
+    result. Each variant is stored already framed as a multipart part, so
+    stream clients send it without copying. ROI variants (digital pan and
+    zoom to a ROI_PRESETS region) crop the shared image with a slice view,
+    so only the encoder reads the region and nothing is copied before it.
+    
+    The image usually lives in a FrameRing buffer that is reused once the
+    Frame is no longer referenced; keep the Frame, not just its image.
+    
+    In MJPEG passthrough mode the Frame holds the camera's JPEG instead:
+    the full-size default variant is that JPEG as is, and the image is
+    decoded only when a consumer needs pixels (resizing, other qualities,
+    motion detection).
+    
+    Placeholder frames are shown to stream clients while the camera
+    recovers; they are never captured as snapshots.
+    """
+    
+    def __init__(self, seq: int, image, captured_at: float, native_jpeg: Optional[bytes] = None,
+                 placeholder: bool = False):
+        """
+        Args:
+            seq: Frame sequence number
+            image: BGR frame as numpy array (must not be modified), or None
+                   for passthrough frames
+            captured_at: Capture time as UNIX timestamp
+            native_jpeg: JPEG data as delivered by the camera
+            placeholder: True for a generated "camera unavailable" frame
+        """
+        self.seq = seq
+        self.captured_at = captured_at
+        self.native_jpeg = native_jpeg
+        self.placeholder = placeholder
+        self._image = image
+        self._lock = threading.Lock()
+        self._decode_lock = threading.Lock()
+        self._variants = {}
+        self._image_quality: Optional[FrameQuality] = None
+        
+        if image is not None:
+            self.height, self.width = image.shape[:2]
+        else:
+            self.width, self.height = jpeg_dimensions(native_jpeg) or (0, 0)
+    
+    @property
+    def image(self):
+        """BGR frame as numpy array, decoded on first access for passthrough frames."""
+        image = self._image
+        if image is None and self.native_jpeg is not None:
+            with self._decode_lock:
+                image = self._image
+                if image is None:
+                    start = time.perf_counter()
+                    image = cv2.imdecode(np.frombuffer(self.native_jpeg, np.uint8), cv2.IMREAD_COLOR)
+                    metrics.JPEG_DECODE_SECONDS.observe(time.perf_counter() - start)
+                    if image is None:
+                        raise ValueError("Failed to decode passthrough frame")
+                    self._image = image
+        return image
+    
+    @property
+    def decoded(self) -> bool:
+        """True if the pixels are available without decoding the camera's JPEG."""
+        return self._image is not None
+    
+    @property
+    def image_quality(self) -> Optional[FrameQuality]:
+        """
+        Brightness, sharpness and histogram of this frame, analyzed on first
+        access. Passthrough frames are analyzed from a reduced JPEG decode
+        unless their pixels are already decoded.
+        """
+        if self._image_quality is None:
+            start = time.perf_counter()
+            if self._image is not None or self.native_jpeg is None:
+                result = analyze(self.image)
+            else:
+                result = analyze_jpeg(self.native_jpeg)
+            metrics.QUALITY_ANALYSIS_SECONDS.observe(time.perf_counter() - start)
+            # Concurrent first accesses may both analyze; the results are identical
+            self._image_quality = result
+        return self._image_quality
+    
+    def roi_box(self, roi: Optional[str]) -> Tuple[int, int, int, int]:
+        """
+        Pixel box of a ROI preset in this frame.
+        
+        Args:
+            roi: Name of a ROI_PRESETS region (None = whole frame)
+        
+        Returns:
+            Tuple of (left, top, right, bottom) in pixels
+        
+        Raises:
+            KeyError: If the preset does not exist
+        """
+        if roi is None:
+            return 0, 0, self.width, self.height
+        return roi_box(config.ROI_PRESETS[roi], self.width, self.height)
+    
+    def variant_size(self, width: Optional[int] = None, roi: Optional[str] = None) -> Tuple[int, int]:
+        """
+        Size of a stream variant.
+        
+        Args:
+            width: Requested width (None or >= source width = full size)
+            roi: Name of a ROI_PRESETS region (None = whole frame)
+        
+        Returns:
+            Tuple of (width, height) in pixels
+        """
+        left, top, right, bottom = self.roi_box(roi)
+        source_width, source_height = right - left, bottom - top
+        if width is None or width >= source_width:
+            return source_width, source_height
+        return width, max(1, round(source_height * width / source_width))
+    
+    def _variant_key(self, width: Optional[int], quality: int, roi: Optional[str]) -> tuple:
+        """Normalized variant key (see variant_key)."""
+        return variant_key(width, quality, roi, self.width, self.height)
+    
+    def mjpeg_part(self, width: Optional[int] = None,
+                   quality: int = config.STREAM_JPEG_QUALITY, roi: Optional[str] = None) -> Optional[bytes]:
+        """
+        Get this frame as a Motion JPEG part, encoding it on first request.
+        
+        Args:
+            width: Output width in pixels (None or >= source width = full size)
+            quality: JPEG quality
+            roi: Name of a ROI_PRESETS region to crop to (None = whole frame)
+        
+        Returns:
+            Multipart header, JPEG data and trailer, or None if encoding failed
+        """
+        key = self._variant_key(width, quality, roi)
+        
+        with self._lock:
+            variant = self._variants.get(key)
+            owner = variant is None
+            if owner:
+                variant = self._variants[key] = [threading.Event(), None]
+        
+        if owner:
+            try:
+                variant[1] = self._encode(*key)
+            finally:
+                variant[0].set()
+        else:
+            variant[0].wait()
+        return variant[1]
+    
+    def cached_part(self, width: Optional[int] = None,
+                    quality: int = config.STREAM_JPEG_QUALITY, roi: Optional[str] = None) -> Optional[bytes]:
+        """
+        Get an already encoded Motion JPEG part without blocking.
+        
+        Returns:
+            Multipart part, or None if the variant is not ready yet
+        """
+        key = self._variant_key(width, quality, roi)
+        with self._lock:
+            variant = self._variants.get(key)
+        if variant is None or not variant[0].is_set():
+            return None
+        return variant[1]
+    
+    def jpeg(self, width: Optional[int] = None,
+             quality: int = config.STREAM_JPEG_QUALITY, roi: Optional[str] = None) -> Optional[memoryview]:
+        """
+        Get this frame as JPEG, encoding it on first request.
+        
+        Args:
+            width: Output width in pixels (None or >= source width = full size)
+            quality: JPEG quality
+            roi: Name of a ROI_PRESETS region to crop to (None = whole frame)
+        
+        Returns:
+            Zero-copy view of the JPEG data, or None if encoding failed
+        """
+        part = self.mjpeg_part(width, quality, roi)
+        if part is None:
+            return None
+        return memoryview(part)[len(MJPEG_PART_HEADER):-len(MJPEG_PART_TRAILER)]
+    
+    def _encode(self, width: Optional[int], quality: int, roi: Optional[str]) -> Optional[bytes]:
+        """Crop and resize (if requested), JPEG encode and frame the image as a multipart part."""
+        if (self.native_jpeg is not None and width is None and roi is None
+                and quality == config.STREAM_JPEG_QUALITY):
+            # The camera already encoded this variant; only frame it
+            metrics.JPEG_PASSTHROUGH.labels('stream').inc()
+            return b''.join((MJPEG_PART_HEADER, self.native_jpeg, MJPEG_PART_TRAILER))
+        
+        start = time.perf_counter()
+        try:
+            image = self.image
+        except ValueError as e:
+            logger.warning(str(e))
+            return None
+        if roi is not None:
+            # A view into the shared image; the encoder reads the rows with their stride
+            left, top, right, bottom = self.roi_box(roi)
+            image = image[top:bottom, left:right]
+        if width is not None:
+            image = cv2.resize(image, self.variant_size(width, roi), interpolation=cv2.INTER_AREA)
+        
+        ret, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ret:
+            logger.warning("Failed to encode frame")
+            return None
+        # One copy from the encoder buffer straight into the framed part
+        part = b''.join((MJPEG_PART_HEADER, buffer, MJPEG_PART_TRAILER))
+        metrics.JPEG_ENCODE_SECONDS.labels('stream').observe(time.perf_counter() - start)
+        metrics.JPEG_ENCODE_BYTES.labels('stream').observe(buffer.size)
+        return part
+
+
+class FrameRing:
+    """
+    Fixed set of reusable frame buffers for the capture thread.
+    
+    Camera reads fill a buffer in place instead of allocating a new array
+    per frame. A buffer is reused only after the Frame that published it
+    has been released by every consumer; if all buffers are still in use
+    (many slow clients), the read allocates a fresh array instead.
+    Only the capture thread calls into the ring, so it needs no lock.
+    """
+    
+    def __init__(self, size: int = config.FRAME_RING_SIZE, allocations: Optional[metrics.Counter] = None):
+        """
+        Args:
+            size: Number of buffers
+            allocations: Counter of reads that needed a new array
+        """
+        self._allocations = allocations or metrics.FRAME_BUFFER_ALLOCATIONS.labels('default')
+        self._buffers = [None] * size
+        self._owners = [None] * size
+        self._next = 0
+    
+    def acquire(self) -> Tuple[int, Optional[object]]:
+        """
+        Find a free buffer.
+        
+        Returns:
+            Tuple of (slot index or -1 if all are busy, buffer or None if not allocated yet)
+        """
+        size = len(self._buffers)
+        for _ in range(size):
+            index = self._next
+            self._next = (index + 1) % size
+            owner = self._owners[index]
+            if owner is None or owner() is None:
+                self._owners[index] = None
+                return index, self._buffers[index]
+        return -1, None
+    
+    def commit(self, index: int, image, frame: "Frame"):
+        """
+        Assign the image read into a slot to the Frame that publishes it.
+        
+        Args:
+            index: Slot index from acquire()
+            image: Array returned by the read (adopted if it is a new allocation)
+            frame: Frame that now owns the buffer
+        """
+        if index < 0:
+            self._allocations.inc()
+            return
+        if image is not self._buffers[index]:
+            # First use of the slot or the resolution changed
+            self._allocations.inc()
+            self._buffers[index] = image
+        self._owners[index] = weakref.ref(frame)
+    
+    def clear(self):
+        """Drop all buffers (e.g. when the device is released)."""
+        self._buffers = [None] * len(self._buffers)
+        self._owners = [None] * len(self._owners)
+
+
+class CaptureWorker:
+    """
+    Long-lived capture session that owns the camera device.
+    
+    The device is opened and warmed up once and then kept open:
+    - Streaming clients subscribe and read the newest Frame; each JPEG
+      variant is encoded once per frame regardless of the number of viewers.
+    - Still captures take the newest live frame in a few milliseconds
+      instead of opening and warming up the device on every call.
+    
+    The device is released after CAMERA_IDLE_TIMEOUT_SECONDS without
+    stream clients or captures and reopened lazily on the next request.
+    
+    With ENCODER_WORKERS set, frames are encoded into every variant that
+    stream clients subscribed to by an EncoderPool before they are
+    published, so consecutive frames are encoded on several cores.
+    
+    Failed reads, frozen images (CAMERA_FROZEN_FRAMES identical frames)
+    and failed opens are reported to the CameraSupervisor, which reopens
+    the device with backoff. Meanwhile the thread stays alive for stream
+    clients, which receive the supervisor's placeholder frames.
+    """
+    
+    def __init__(self, name: Optional[str] = None,
+                 idle_timeout: float = config.CAMERA_IDLE_TIMEOUT_SECONDS,
+                 supervisor: Optional[CameraSupervisor] = None):
+        """
+        Initialize capture worker.
+        
+        Args:
+            name: Camera name (None = default camera)
+            idle_timeout: Seconds without users before the device is released
+            supervisor: Reconnect supervisor that owns reopening a failed device
+        """
+        self._camera = CameraCapture(name)
+        self._supervisor = supervisor
+        self.name = self._camera.name
+        self.idle_timeout = idle_timeout
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._clients = 0
+        self._waiters = 0
+        self._pins = 0
+        self._listeners = []
+        self._last_used = 0.0
+        self._seq = 0
+        self._frame: Optional[Frame] = None
+        self._variants: Dict[Tuple[Optional[int], int, Optional[str]], int] = {}
+        self._encoder: Optional[EncoderPool] = None
+        ring_size = config.FRAME_RING_SIZE
+        if config.ENCODER_WORKERS > 0:
+            self._encoder = EncoderPool(self._publish_encoded, name=self.name)
+            atexit.register(self._encoder.close)
+            # Frames held by the pool keep their buffers
+            ring_size += self._encoder.capacity
+        self._ring = FrameRing(ring_size, metrics.FRAME_BUFFER_ALLOCATIONS.labels(self.name))
+        self._dropped = 0
+        
+        # Device health: fault count wakes up waiting captures, the read
+        # start time lets the supervisor detect a blocked read
+        self._faults = 0
+        self._reading_since: Optional[float] = None
+        self._last_digest: Optional[int] = None
+        self._identical_frames = 0
+        self._placeholder_base = None
+        
+        # Metric children are resolved once, off the per-frame path
+        self._read_seconds = metrics.CAMERA_READ_SECONDS.labels(self.name)
+        self._read_failures = metrics.CAMERA_READ_FAILURES.labels(self.name)
+        self._frames_captured = metrics.FRAMES_CAPTURED.labels(self.name)
+        self._warmup_seconds = metrics.CAMERA_WARMUP_SECONDS.labels(self.name)
+        self._warmup_timeouts = metrics.CAMERA_WARMUP_TIMEOUTS.labels(self.name)
+        self._stream_clients = metrics.STREAM_CLIENTS.labels(self.name)
+        self._stream_dropped = metrics.STREAM_FRAMES_DROPPED.labels(self.name)
+        self._brightness = metrics.CAMERA_BRIGHTNESS.labels(self.name)
+        self._sharpness = metrics.CAMERA_SHARPNESS.labels(self.name)
+        
+        # Quality of the last analyzed live frame
+        self._image_quality: Optional[FrameQuality] = None
+        self._analyzed_at = 0.0
+        
+        # Result of the last warmup after opening the device
+        self._last_warmup: Optional[dict] = None
+        
+        # Per-capture latency statistics (milliseconds)
+        self._capture_count = 0
+        self._capture_total_ms = 0.0
+        self._capture_last_ms = 0.0
+        self._capture_max_ms = 0.0
+    
+    @property
+    def camera_index(self) -> int:
+        """Index of the device, as last resolved from the camera's device path."""
+        return self._camera.camera_index
+    
+    def _ensure_running(self):
+        """Start the capture thread if it is not running. Caller holds the condition."""
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run,
+                name=f"capture-worker-{self.name}",
+                daemon=True
+            )
+            self._thread.start()
+    
+    def subscribe(self, width: Optional[int] = None, quality: int = config.STREAM_JPEG_QUALITY,
+                  roi: Optional[str] = None):
+        """
+        Register a stream client and start the capture thread if needed.
+        
+        Args:
+            width: Stream variant width the client receives (None = full size)
+            quality: Stream variant JPEG quality
+            roi: Stream variant ROI preset (None = whole frame)
+        """
+        with self._condition:
+            key = self._variant_key(width, quality, roi)
+            self._variants[key] = self._variants.get(key, 0) + 1
+            self._clients += 1
+            self._stream_clients.inc()
+            self._last_used = time.monotonic()
+            self._ensure_running()
+            logger.info(f"Stream client subscribed ({self._clients} active)")
+    
+    def unsubscribe(self, width: Optional[int] = None, quality: int = config.STREAM_JPEG_QUALITY,
+                    roi: Optional[str] = None):
+        """Unregister a stream client. The device stays warm until the idle timeout."""
+        with self._condition:
+            key = self._variant_key(width, quality, roi)
+            if self._variants.get(key, 0) > 1:
+                self._variants[key] -= 1
+            else:
+                self._variants.pop(key, None)
+            if self._clients > 0:
+                self._clients -= 1
+                self._stream_clients.dec()
+            self._last_used = time.monotonic()
+            logger.info(f"Stream client unsubscribed ({self._clients} active)")
+    
+    def _variant_key(self, width: Optional[int], quality: int, roi: Optional[str]) -> tuple:
+        """
+        Subscription key of a stream variant, normalized like Frame does.
+        The configured frame size is used, so subscribe and unsubscribe
+        always agree on the key.
+        """
+        settings = self._camera.settings
+        return variant_key(width, quality, roi, settings.width or config.CAMERA_WIDTH,
+                           settings.height or config.CAMERA_HEIGHT)
+    
+    def pin(self):
+        """Keep the session open regardless of the idle timeout (e.g. for motion detection)."""
+        with self._condition:
+            self._pins += 1
+            self._ensure_running()
+    
+    def unpin(self):
+        """Release a pin taken with pin()."""
+        with self._condition:
+            self._pins = max(0, self._pins - 1)
+            self._last_used = time.monotonic()
+    
+    def resume(self):
+        """Restart the capture thread after a failure if the session is still pinned or streamed."""
+        with self._condition:
+            if self._pins or self._clients:
+                self._ensure_running()
+    
+    def add_frame_listener(self, listener: Callable[[Frame, int, float], None]):
+        """
+        Register a callback invoked on the capture thread for every frame.
+        Listeners receive (Frame, sequence number, capture timestamp) and
+        must be fast. Passthrough frames are not decoded yet; listeners that
+        need few pixels should decode them at reduced size instead of using
+        Frame.image. Copy the pixels out to keep them: the Frame holds a
+        reusable ring buffer.
+        
+        Args:
+            listener: Callback function
+        """
+        with self._condition:
+            self._listeners = self._listeners + [listener]
+    
+    def remove_frame_listener(self, listener: Callable[[Frame, int, float], None]):
+        """Unregister a frame listener."""
+        with self._condition:
+            self._listeners = [l for l in self._listeners if l is not listener]
+    
+    def is_running(self) -> bool:
+        """Return True if the capture thread is active."""
+        with self._condition:
+            return self._thread is not None
+    
+    def latest_frame(self):
+        """
+        Get a copy of the newest raw frame without waking up the device.
+        
+        Returns:
+            BGR frame as numpy array, or None if the session is not live
+        """
+        with self._condition:
+            if self._thread is None or self._frame is None or self._frame.placeholder:
+                return None
+            return self._frame.image.copy()
+    
+    def capture_frame(self, timeout: float = 5.0):
+        """
+        Get the newest live frame, opening and warming up the device if needed.
+        
+        Args:
+            timeout: Maximum time to wait for the first frame of a cold session
+        
+        Returns:
+            Newest Frame (must not be modified), or None if the camera is not available
+        """
+        start = time.monotonic()
+        supervisor = self._supervisor
+        
+        with self._condition:
+            self._last_used = start
+            self._waiters += 1
+            self._ensure_running()
+            faults = self._faults
+            try:
+                # Give up early when the device fails or is waiting for the supervisor
+                self._condition.wait_for(
+                    lambda: (self._frame is not None and not self._frame.placeholder)
+                    or self._thread is None or self._faults != faults
+                    or (supervisor is not None and not supervisor.allow_open()),
+                    timeout
+                )
+            finally:
+                self._waiters -= 1
+                self._last_used = time.monotonic()
+            frame = self._frame
+            if frame is not None and frame.placeholder:
+                frame = None
+            
+            if frame is not None:
+                latency_ms = (time.monotonic() - start) * 1000
+                self._capture_count += 1
+                self._capture_total_ms += latency_ms
+                self._capture_last_ms = latency_ms
+                self._capture_max_ms = max(self._capture_max_ms, latency_ms)
+                logger.info(f"Capture latency: {latency_ms:.1f} ms")
+        
+        return frame
+    
+    def wait_for_frame(self, last_seq: int, timeout: float = 2.0) -> Optional[Frame]:
+        """
+        Block until a frame newer than last_seq is published.
+        Slow clients simply skip intermediate frames.
+        
+        Args:
+            last_seq: Sequence number of the last frame the client received
+            timeout: Maximum time to wait in seconds
+        
+        Returns:
+            Newest Frame, or None on timeout/stop
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: (self._frame is not None and self._frame.seq != last_seq)
+                or self._thread is None,
+                timeout
+            )
+            if self._frame is None or self._frame.seq == last_seq:
+                return None
+            return self._frame
+    
+    def read_stalled(self, limit: float) -> bool:
+        """
+        Check if a device read has been blocked for longer than limit.
+        
+        Args:
+            limit: Maximum duration of one read in seconds
+        
+        Returns:
+            True if the current read started more than limit seconds ago
+        """
+        reading_since = self._reading_since
+        return reading_since is not None and time.monotonic() - reading_since > limit
+    
+    def publish_placeholder(self, message: str):
+        """
+        Publish a generated frame for stream clients while the device recovers.
+        It also replaces the last live frame, which captures must not reuse.
+        
+        Args:
+            message: Status line shown below "Camera unavailable"
+        """
+        with self._condition:
+            if self._thread is None:
+                return
+            
+            if self._placeholder_base is None:
+                settings = self._camera.settings
+                width = settings.width or config.CAMERA_WIDTH
+                height = settings.height or config.CAMERA_HEIGHT
+                base = np.full((height, width, 3), 40, np.uint8)
+                cv2.putText(base, f"Camera '{self.name}' unavailable", (width // 20, height // 2),
+                            cv2.FONT_HERSHEY_SIMPLEX, width / 800, (255, 255, 255), max(1, width // 400))
+                self._placeholder_base = base
+            
+            image = self._placeholder_base.copy()
+            height, width = image.shape[:2]
+            cv2.putText(image, f"{message} {datetime.now().strftime('%H:%M:%S')}",
+                        (width // 20, height // 2 + height // 10), cv2.FONT_HERSHEY_SIMPLEX,
+                        width / 1200, (200, 200, 200), max(1, width // 600))
+            
+            self._seq += 1
+            self._frame = Frame(self._seq, image, time.time(), placeholder=True)
+            self._condition.notify_all()
+    
+    def record_dropped(self, count: int):
+        """Count frames a slow stream client skipped."""
+        with self._condition:
+            self._dropped += count
+        self._stream_dropped.inc(count)
+    
+    def get_stats(self) -> dict:
+        """
+        Get session state and capture latency statistics.
+        
+        Returns:
+            Dictionary with session state and latencies in milliseconds
+        """
+        with self._condition:
+            count = self._capture_count
+            return {
+                "running": self._thread is not None,
+                "stream_clients": self._clients,
+                "pins": self._pins,
+                "frames": self._seq,
+                "frames_dropped": self._dropped,
+                "captures": count,
+                "last_capture_ms": round(self._capture_last_ms, 2),
+                "avg_capture_ms": round(self._capture_total_ms / count, 2) if count else 0.0,
+                "max_capture_ms": round(self._capture_max_ms, 2),
+                "idle_timeout_seconds": self.idle_timeout,
+                "encoder": self._encoder.get_stats() if self._encoder is not None else None,
+                "image_quality": self._image_quality.to_dict() if self._image_quality else None,
+                "warmup": self._last_warmup
+            }
+    
+    def image_quality(self) -> Optional[FrameQuality]:
+        """
+        Quality of the last analyzed live frame, without waking up the device.
+        
+        Returns:
+            FrameQuality, or None if the session is not live
+        """
+        with self._condition:
+            if self._thread is None:
+                return None
+            return self._image_quality
+    
+    def _analyze(self, frame: Frame):
+        """
+        Analyze a published frame on the capture thread. Passthrough frames
+        need a JPEG decode, so they are analyzed at most once per second.
+        """
+        if frame.native_jpeg is not None and frame.captured_at - self._analyzed_at < 1.0:
+            return
+        try:
+            result = frame.image_quality
+        except Exception as e:
+            logger.error(f"Error analyzing frame: {e}")
+            return
+        if result is None:
+            return
+        self._analyzed_at = frame.captured_at
+        self._brightness.set(result.brightness)
+        self._sharpness.set(result.sharpness)
+        with self._condition:
+            self._image_quality = result
+    
+    def _publish_encoded(self, frame: Frame):
+        """Publish a frame finished by the encoder pool (called in capture order)."""
+        with self._condition:
+            if self._thread is None:
+                return
+            # Frames published directly while nobody streamed may be newer
+            if self._frame is None or frame.seq > self._frame.seq:
+                self._frame = frame
+                self._condition.notify_all()
+    
+    def _is_idle(self) -> bool:
+        """Check if the session has no users. Caller holds the condition."""
+        return (self._clients == 0 and self._waiters == 0 and self._pins == 0 and
+                time.monotonic() - self._last_used > self.idle_timeout)
+    
+    def _should_stop(self) -> bool:
+        """Release the device and stop the thread if the session is idle."""
+        with self._condition:
+            if not self._is_idle():
+                return False
+        
+        # Release the device before giving up ownership of the thread slot,
+        # so a new thread never races with this one on the same device
+        with self._camera.lock:
+            self._camera._close_camera()
+        self._ring.clear()
+        
+        with self._condition:
+            if not self._is_idle():
+                return False
+            self._thread = None
+            self._frame = None
+            self._condition.notify_all()
+            return True
+    
+    def _stop_on_error(self):
+        """Stop the thread after a fatal error and wake up all waiters."""
+        with self._camera.lock:
+            self._camera._close_camera()
+        self._ring.clear()
+        with self._condition:
+            self._thread = None
+            self._frame = None
+            self._condition.notify_all()
+    
+    def _fault(self, reason: str) -> bool:
+        """
+        Record a device fault and hand recovery to the supervisor.
+        
+        Args:
+            reason: 'open', 'read' or 'frozen'
+        
+        Returns:
+            True if the supervisor recovers the device, False if the
+            worker has to retry (or give up) on its own
+        """
+        self._last_digest = None
+        self._identical_frames = 0
+        with self._condition:
+            self._faults += 1
+            self._condition.notify_all()
+        if self._supervisor is None:
+            return False
+        return self._supervisor.report_failure(reason)
+    
+    def _wait_for_recovery(self) -> bool:
+        """
+        Wait while the supervisor recovers the device. Stream clients and
+        pins keep the thread alive; without them it stops, so captures
+        fail fast.
+        
+        Returns:
+            False if the thread should stop
+        """
+        with self._condition:
+            if not self._clients and not self._pins:
+                return False
+            # Polled, since the supervisor allows reopening under its own lock
+            self._condition.wait(0.2)
+            return True
+    
+    def _is_frozen(self, frame, jpeg) -> bool:
+        """Check for CAMERA_FROZEN_FRAMES consecutive identical frames."""
+        limit = config.CAMERA_FROZEN_FRAMES
+        if not limit:
+            return False
+        # A sparse pixel sample is enough: live sensors always have some noise
+        digest = hash(jpeg) if jpeg is not None else hash(frame[::16, ::16].tobytes())
+        if digest == self._last_digest:
+            self._identical_frames += 1
+        else:
+            self._last_digest = digest
+            self._identical_frames = 0
+        return self._identical_frames >= limit
+    
+    def _warmup_key(self) -> str:
+        """Identity of the device and frame size for its learned warmup profile."""
+        settings = self._camera.settings
+        source = settings.source or config.FRAME_SOURCE
+        if source == 'v4l2':
+            device = settings.device or f"/dev/video{self._camera.camera_index}"
+        elif source == 'replay':
+            device = settings.replay_path or config.REPLAY_PATH
+        else:
+            device = self.name
+        width = settings.width or config.CAMERA_WIDTH
+        height = settings.height or config.CAMERA_HEIGHT
+        return f"{source}:{device}:{width}x{height}"
+    
+    def _warmup(self):
+        """
+        Let the camera settle after opening (important for USB cameras).
+        Frames are read continuously instead of sleeping so the driver
+        buffer never holds stale images.
+        
+        With CAMERA_WARMUP_ADAPTIVE the warmup ends as soon as
+        auto-exposure has converged, and the device's learned profile is
+        updated. Otherwise CAMERA_WARMUP_FRAMES frames and then
+        CAMERA_WARMUP_SECONDS are discarded.
+        """
+        camera = self._camera.camera
+        logger.info("Warming up camera...")
+        
+        if config.CAMERA_WARMUP_ADAPTIVE:
+            profiles = get_warmup_profiles()
+            key = self._warmup_key()
+            result = settle(camera, profiles.min_frames(key), config.CAMERA_WARMUP_MAX_SECONDS)
+            if result["converged"]:
+                logger.info(f"Exposure settled after {result['frames']} frames ({result['seconds']:.2f}s)")
+            else:
+                self._warmup_timeouts.inc()
+                logger.warning(f"Exposure of camera '{self.name}' did not settle within "
+                               f"{config.CAMERA_WARMUP_MAX_SECONDS}s")
+            result["profile"] = profiles.update(key, result["frames"], result["seconds"], result["converged"])
+            with self._condition:
+                self._last_warmup = result
+            return
+        
+        # Discarded frames are all read into one scratch buffer
+        # (passthrough frames are discarded without decoding)
+        scratch = None
+        frames = 0
+        start = time.monotonic()
+        
+        def discard():
+            nonlocal scratch, frames
+            frames += 1
+            if camera.passthrough:
+                camera.read_jpeg()
+            else:
+                _, scratch = camera.read(scratch)
+        
+        for _ in range(config.CAMERA_WARMUP_FRAMES):
+            discard()
+        deadline = time.monotonic() + config.CAMERA_WARMUP_SECONDS
+        while time.monotonic() < deadline:
+            discard()
+        with self._condition:
+            self._last_warmup = {"adaptive": False, "frames": frames,
+                                 "seconds": round(time.monotonic() - start, 3)}
+    
+    def _run(self):
+        """Capture loop: read and publish; stream clients encode on demand."""
+        logger.info("Capture worker started")
+        camera = self._camera
+        supervisor = self._supervisor
+        open_failed = False
+        
+        try:
+            while not self._should_stop():
+                # A failed device is reopened by the supervisor, not by every caller
+                if camera.camera is None and supervisor is not None and (open_failed or not supervisor.allow_open()):
+                    open_failed = False
+                    if not self._wait_for_recovery():
+                        logger.warning(f"Camera '{self.name}' unavailable, waiting for reconnect")
+                        break
+                    continue
+                
+                with camera.lock:
+                    # Open camera if not open
+                    if camera.camera is None or not camera.camera.is_opened():
+                        if not camera._open_camera():
+                            logger.error("Failed to open camera")
+                            if not self._fault('open'):
+                                break
+                            open_failed = True
+                            continue
+                        with self._warmup_seconds.time():
+                            self._warmup()
+                    
+                    source = camera.camera
+                    start = time.perf_counter()
+                    self._reading_since = time.monotonic()
+                    if source.passthrough:
+                        # Keep the camera's JPEG; pixels are decoded on demand
+                        slot, frame = -1, None
+                        ret, jpeg = source.read_jpeg()
+                        valid = ret and jpeg is not None
+                    else:
+                        # Read into a free ring buffer instead of a new array
+                        slot, buffer = self._ring.acquire()
+                        ret, frame = source.read(buffer)
+                        jpeg = None
+                        valid = ret and frame is not None
+                    captured_at = time.time()
+                    self._reading_since = None
+                    self._read_seconds.observe(time.perf_counter() - start)
+                    
+                    if not valid:
+                        self._read_failures.inc()
+                        logger.warning("Failed to read frame from camera")
+                        camera._close_camera()
+                        self._ring.clear()
+                        self._fault('read')
+                        continue
+                    
+                    # Release a frozen device, or one the supervisor declared failed
+                    # while this read was stalled, and let the supervisor reopen it
+                    frozen = self._is_frozen(frame, jpeg)
+                    if frozen or (supervisor is not None and not supervisor.allow_open()):
+                        if frozen:
+                            logger.warning(f"Camera '{self.name}' frozen: {self._identical_frames} identical frames")
+                        camera._close_camera()
+                        self._ring.clear()
+                        if frozen:
+                            self._fault('frozen')
+                        continue
+                
+                self._frames_captured.inc()
+                with self._condition:
+                    self._seq += 1
+                    seq = self._seq
+                    published = Frame(seq, frame, captured_at, jpeg)
+                    if jpeg is None:
+                        self._ring.commit(slot, frame, published)
+                    listeners = self._listeners
+                    variants = list(self._variants) if self._encoder is not None else None
+                    if not variants:
+                        self._frame = published
+                        self._condition.notify_all()
+                
+                if variants:
+                    # Published by the pool once all stream variants are encoded
+                    self._encoder.submit(published, variants)
+                
+                if config.QUALITY_ANALYSIS_ENABLED:
+                    self._analyze(published)
+                
+                for listener in listeners:
+                    try:
+                        listener(published, seq, captured_at)
+                    except Exception as e:
+                        logger.error(f"Error in frame listener: {e}")
+                # Do not hold the Frame (and its ring buffer) across the next read
+                published = None
+            else:
+                logger.info("Capture worker stopped (idle)")
+                return
+                
+        except Exception as e:
+            logger.error(f"Error in capture worker: {e}")
+        
+        self._stop_on_error()
+        logger.info("Capture worker stopped (camera error)")
+
+
+class Snapshot:
+    """An encoded snapshot with HTTP cache validators."""
+    
+    def __init__(self, jpeg: bytes, captured_at: float):
+        """
+        Args:
+            jpeg: Encoded JPEG bytes
+            captured_at: Capture time as UNIX timestamp
+        """
+        self.jpeg = jpeg
+        self.captured_at = captured_at
+        self.etag = content_hash(jpeg)
+        self.last_modified = datetime.fromtimestamp(int(captured_at), tz=timezone.utc)
+    
+    def age(self) -> float:
+        """Seconds since the snapshot was captured."""
+        return time.time() - self.captured_at
+
+
+class SnapshotCache:
+    """
+    Keeps the latest encoded snapshot in memory, so /snapshot.jpg can be
+    served (or answered with 304 Not Modified) without touching the disk.
+    """
+    
+    def __init__(self, images_dir: Optional[str] = None):
+        """
+        Args:
+            images_dir: Directory holding the latest snapshot file (default: IMAGES_DIR)
+        """
+        self.images_dir = images_dir
+        self._lock = threading.Lock()
+        self._snapshot: Optional[Snapshot] = None
+    
+    def update(self, jpeg: bytes, captured_at: Optional[float] = None):
+        """
+        Replace the cached snapshot.
+        
+        Args:
+            jpeg: Encoded JPEG bytes
+            captured_at: Capture time as UNIX timestamp (default: now)
+        """
+        snapshot = Snapshot(jpeg, time.time() if captured_at is None else captured_at)
+        with self._lock:
+            self._snapshot = snapshot
+    
+    def get(self) -> Optional[Snapshot]:
+        """
+        Get the cached snapshot, loading the latest file from disk on first use.
+        
+        Returns:
+            Snapshot or None if nothing was captured yet
+        """
+        with self._lock:
+            if self._snapshot is not None:
+                return self._snapshot
+        
+        latest_path = os.path.join(self.images_dir or config.IMAGES_DIR, config.LATEST_IMAGE_NAME)
+        try:
+            with open(latest_path, 'rb') as f:
+                jpeg = f.read()
+            captured_at = os.path.getmtime(latest_path)
+        except OSError:
+            return None
+        
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = Snapshot(jpeg, captured_at)
+            return self._snapshot
+
+
+class Camera:
+    """
+    A named camera with its own device lock, capture worker and snapshot
+    storage (cache, writer, history and retention index). Cameras share
+    nothing, so several devices capture and encode in parallel.
+    """
+    
+    def __init__(self, settings: CameraSettings):
+        """
+        Args:
+            settings: Camera settings
+        """
+        self.settings = settings
+        self.name = settings.name
+        self.lock = metrics.TimedLock(metrics.CAMERA_LOCK_WAIT_SECONDS.labels(self.name))
+        
+        # Latest snapshot shared by capture and HTTP paths
+        self.snapshot_cache = SnapshotCache(settings.images_dir)
+        # Persistent index of stored snapshots (history API)
+        self.history = SnapshotHistory(settings.history_db_path, settings.images_dir)
+        # Stored timestamped snapshots, used to enforce retention limits
+        self.retention = RetentionIndex(loader=self.history.stored_images,
+                                        on_removed=self.history.remove)
+        # Background encoder/writer for captured snapshots
+        self.writer = SnapshotWriter(on_encoded=self.snapshot_cache.update,
+                                     on_stored=self._on_snapshot_stored,
+                                     images_dir=settings.images_dir)
+        atexit.register(self.writer.flush, 5.0)
+        # Background time-lapse builds from the stored snapshots
+        self.timelapse = TimelapseBuilder(self.history, os.path.join(settings.images_dir, 'timelapse'),
+                                          self.name)
+        atexit.register(self.timelapse.close)
+        # Downscaled snapshots for grid views, keyed by content hash
+        self.thumbnails = DerivativeCache(os.path.join(settings.images_dir, 'thumbnails'))
+        # Continuous recording into rolling segments (started by the server)
+        self.recorder = SegmentRecorder(self.history, os.path.join(settings.images_dir, 'recordings'),
+                                        self.name)
+        atexit.register(self.recorder.stop)
+        # Background device probing and reconnects (started by the server)
+        self.supervisor = CameraSupervisor(self)
+        
+        self._worker: Optional[CaptureWorker] = None
+        self._capture: Optional[CameraCapture] = None
+        self._init_lock = threading.Lock()
+    
+    def _on_snapshot_stored(self, image: StoredImage, jpeg: bytes):
+        """Register a newly written timestamped snapshot and create its eager thumbnails."""
+        self.history.add(image)
+        self.retention.add(image)
+        
+        widths = [width for width in config.THUMBNAIL_EAGER_SIZES if image.width is None or width < image.width]
+        if widths and image.content_hash:
+            try:
+                self.thumbnails.generate(image.content_hash, jpeg, widths)
+            except Exception as e:
+                logger.error(f"Error creating thumbnails for {image.path}: {e}")
+    
+    @property
+    def worker(self) -> CaptureWorker:
+        """Shared capture worker (created on first use)."""
+        with self._init_lock:
+            if self._worker is None:
+                self._worker = CaptureWorker(self.name, supervisor=self.supervisor)
+            return self._worker
+    
+    @property
+    def capture(self) -> CameraCapture:
+        """Camera operations (capture, test, stream) for this camera."""
+        with self._init_lock:
+            if self._capture is None:
+                self._capture = CameraCapture(self.name)
+            return self._capture
+    
+    def capture_snapshot(self, min_brightness: Optional[float] = config.QUALITY_MIN_BRIGHTNESS,
+                         min_sharpness: Optional[float] = config.QUALITY_MIN_SHARPNESS) -> Tuple[bool, Optional[str]]:
+        """
+        Capture and store a timestamped snapshot. Frames below the quality
+        thresholds (QUALITY_MIN_BRIGHTNESS / QUALITY_MIN_SHARPNESS by
+        default) are discarded.
+        
+        Args:
+            min_brightness: Minimum mean luminance 0-255 (None = no limit)
+            min_sharpness: Minimum sharpness (None = no limit)
+        
+        Returns:
+            Tuple of (success: bool, filepath: Optional[str])
+        """
+        return self.capture.capture_image(save_with_timestamp=True, min_brightness=min_brightness,
+                                          min_sharpness=min_sharpness)
+
+
+# Configured cameras by name, created on first use
+_settings: Optional[Dict[str, CameraSettings]] = None
+_cameras: Dict[str, Camera] = {}
+_cameras_lock = threading.Lock()
+
+
+def _load_settings() -> Dict[str, CameraSettings]:
+    """Load camera settings once. Caller holds _cameras_lock."""
+    global _settings
+    if _settings is None:
+        _settings = {settings.name: settings for settings in load_camera_settings()}
+    return _settings
+
+
+def camera_names() -> List[str]:
+    """
+    List configured camera names.
+    
+    Returns:
+        Camera names, default camera first
+    """
+    with _cameras_lock:
+        return list(_load_settings())
+
+
+def get_camera_settings(name: Optional[str] = None) -> CameraSettings:
+    """
+    Get the settings of a camera.
+    
+    Args:
+        name: Camera name (None = default camera)
+    
+    Returns:
+        CameraSettings
+    
+    Raises:
+        KeyError: If no camera has this name
+    """
+    with _cameras_lock:
+        settings = _load_settings()
+        if name is None:
+            return next(iter(settings.values()))
+        return settings[name]
+
+
+def get_camera(name: Optional[str] = None) -> Camera:
+    """
+    Get a configured camera.
+    
+    Args:
+        name: Camera name (None = default camera)
+    
+    Returns:
+        Camera instance (created on first use)
+    
+    Raises:
+        KeyError: If no camera has this name
+    """
+    settings = get_camera_settings(name)
+    with _cameras_lock:
+        camera = _cameras.get(settings.name)
+        if camera is None:
+            camera = Camera(settings)
+            _cameras[settings.name] = camera
+        return camera
+
+
+def get_camera_lock(name: Optional[str] = None) -> "metrics.TimedLock":
+    """Get the device lock of a camera (one lock per camera, not per process)."""
+    return get_camera(name).lock
+
+
+def get_capture_worker(name: Optional[str] = None) -> CaptureWorker:
+    """
+    Get the shared capture worker for a camera.
+    
+    Args:
+        name: Camera name (None = default camera)
+    
+    Returns:
+        CaptureWorker instance (created on first use)
+    """
+    return get_camera(name).worker
+
+
+def capture_snapshot(name: Optional[str] = None) -> Tuple[bool, Optional[str]]:
     """
     Convenience function to capture a snapshot.
     
+    Args:
+        name: Camera name (None = default camera)
+    
     Returns:
         Tuple of (success: bool, filepath: Optional[str])
     """
-    camera = CameraCapture()
-    return camera.capture_image(save_with_timestamp=True)
+    return get_camera(name).capture_snapshot()
 
 
 if __name__ == "__main__":
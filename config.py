@@ -5,20 +5,116 @@ import os
 
 # Camera settings
 CAMERA_INDEX = 2  # /dev/video2 = J1455 USB camera (not built-in HP camera)
+CAMERA_DEVICE = None  # Stable device path (/dev/v4l/by-id/..., /dev/v4l/by-path/...) or serial; overrides CAMERA_INDEX
 CAMERA_WIDTH = 640
 CAMERA_HEIGHT = 480
 CAMERA_FPS = 30
+CAMERA_WARMUP_FRAMES = 10  # Fixed warmup: frames discarded right after opening the device
+CAMERA_WARMUP_SECONDS = 0.5  # Fixed warmup: extra stabilization time after warmup frames
+CAMERA_IDLE_TIMEOUT_SECONDS = 60  # Release the device after this long without users
+CAMERA_RECONNECT_INITIAL_SECONDS = 1.0  # First retry after the device fails to open
+CAMERA_RECONNECT_MAX_SECONDS = 60.0  # Retry delay doubles up to this limit
+CAMERA_STALL_SECONDS = 5.0  # A read blocked this long marks the camera failed
+CAMERA_FROZEN_FRAMES = 150  # Identical consecutive frames before the camera counts as frozen (0 = off)
+CAMERA_PLACEHOLDER_FPS = 1.0  # Placeholder frames sent to stream clients while the camera recovers
+FRAME_RING_SIZE = 6  # Reusable capture buffers (more avoids allocations with many slow clients)
+CAMERA_MJPEG_PASSTHROUGH = False  # Forward the camera's own MJPEG frames; decode only when pixels are needed
+
+# Adaptive warmup: after opening, frames are discarded until auto-exposure has
+# settled, i.e. the mean luminance of the last CAMERA_WARMUP_STABLE_FRAMES frames
+# varies by at most CAMERA_WARMUP_TOLERANCE gray levels. Learned warmup times are
+# kept per device in CAMERA_WARMUP_PROFILES_PATH. False = fixed warmup above.
+CAMERA_WARMUP_ADAPTIVE = True
+CAMERA_WARMUP_MIN_FRAMES = 3  # Always discarded, even if the first frames look stable
+CAMERA_WARMUP_MAX_SECONDS = 3.0  # Give up waiting for convergence after this long
+CAMERA_WARMUP_STABLE_FRAMES = 5
+CAMERA_WARMUP_TOLERANCE = 2.0  # Gray levels (0-255)
+CAMERA_WARMUP_PROFILES_PATH = None  # None = IMAGES_DIR/warmup_profiles.json
+
+# Multiple cameras (None = a single camera named 'default' using the settings
+# above). Each entry may override index, device, width, height, fps, source,
+# replay_path and passthrough; snapshots of each camera are stored in IMAGES_DIR/<name>.
+# Example: {'front': {'index': 0}, 'yard': {'index': 2, 'width': 1280, 'height': 720}}
+CAMERAS = None
+DEFAULT_CAMERA = None  # Camera served by the routes without /cameras/<name> (None = first)
+
+# Streaming settings (defaults for /video_feed; clients may ask for less)
+STREAM_JPEG_QUALITY = 85
+# Named regions for ?roi= on /video_feed, /video_ws and /snapshot.jpg (digital
+# pan and zoom): name -> (x, y, width, height) as fractions of the frame.
+# Example: {'tray_left': (0.0, 0.25, 0.5, 0.5), 'seedling': (0.6, 0.4, 0.2, 0.2)}
+ROI_PRESETS = {}
+
+# Encoder pool: threads that encode consecutive frames of the active stream
+# variants in parallel (OpenCV releases the GIL). Useful for 1080p streams
+# on multi-core boards; 0 = encode on demand in the client threads.
+ENCODER_WORKERS = 0
+ENCODER_QUEUE_SIZE = 4  # Frames waiting for an encoder thread
+ENCODER_DROP_POLICY = 'oldest'  # Frame skipped when the queue is full: 'oldest' or 'newest'
+
+# Frame source: 'v4l2' (USB camera), 'synthetic' (generated test pattern,
+# no hardware needed) or 'replay' (video file or directory of JPEGs)
+FRAME_SOURCE = 'v4l2'
+REPLAY_PATH = None  # Used by the 'replay' source
+REPLAY_LOOP = True  # Restart replay from the beginning when it ends
+SYNTHETIC_EXPOSURE_SECONDS = 0.0  # Emulated auto-exposure settling after open (0 = exposed right away)
 
 # Image storage settings
 IMAGES_DIR = os.path.join(os.path.dirname(__file__), 'images')
 LATEST_IMAGE_NAME = 'snapshot.jpg'
 TIMESTAMP_FORMAT = '%Y%m%d_%H%M%S'
+WRITER_QUEUE_SIZE = 32  # Pending snapshot writes before the oldest is dropped
+HISTORY_DB_PATH = None  # SQLite snapshot index (None = images/snapshots.db)
+
+# Time-lapse videos built from stored snapshots (cached in IMAGES_DIR/timelapse)
+TIMELAPSE_DEFAULT_FPS = 24
+TIMELAPSE_MAX_FRAMES = 10000  # Larger requests are rejected
+TIMELAPSE_CACHE_FILES = 5  # Finished videos kept; least recently requested are deleted
+TIMELAPSE_MAX_JOBS = 50  # Finished jobs remembered for the status API
+
+# Snapshot thumbnails (?w= on snapshot URLs), cached per camera in IMAGES_DIR/thumbnails
+THUMBNAIL_SIZES = (160, 320, 640)  # Requested widths are rounded up to one of these
+THUMBNAIL_EAGER_SIZES = (320,)  # Generated as soon as a snapshot is stored, () = only on request
+THUMBNAIL_CACHE_BYTES = 64 * 1024 * 1024  # Least recently used thumbnails are deleted beyond this
+THUMBNAIL_QUALITY = 75
+
+# Image quality analytics (brightness, sharpness, histogram) of captured frames
+QUALITY_ANALYSIS_ENABLED = True  # Analyze every frame (passthrough frames at most once per second)
+QUALITY_FRAME_WIDTH = 160  # Frames are downscaled to this width for analysis
+QUALITY_HISTOGRAM_BINS = 16
+QUALITY_MIN_BRIGHTNESS = None  # Snapshots darker than this (mean 0-255) are not stored, e.g. 40
+QUALITY_MIN_SHARPNESS = None  # Snapshots blurrier than this are not stored, e.g. 20
+QUALITY_RETRY_SECONDS = 5.0  # How long a capture waits for a frame meeting the thresholds
+
+# Continuous recording into Motion JPEG AVI segments (IMAGES_DIR/recordings;
+# keeps the camera open while enabled)
+RECORDING_ENABLED = False
+RECORDING_FPS = 10  # Frames per second taken from the live stream
+RECORDING_SEGMENT_SECONDS = 60  # Segments start on multiples of this (wall clock)
+RECORDING_MAX_BYTES = 2 * 1024**3  # Oldest segments are deleted beyond this total size (None = no limit)
+RECORDING_QUEUE_SIZE = 100  # Frames buffered for the writer; the oldest are dropped when full
 
 # Web server settings
 HOST = '0.0.0.0'  # Listen on all network interfaces
 PORT = 5000
 DEBUG = False  # Set to True only during development
+SERVER_MODE = 'flask'  # 'flask' (thread per client) or 'asyncio' (event loop, many stream clients)
+ASYNC_EXECUTOR_WORKERS = 8  # Threads for blocking work in asyncio mode
 
-# Future settings (for periodic capture)
+# Periodic capture settings
+CAPTURE_SCHEDULER_ENABLED = True  # Capture a timestamped snapshot every interval (keeps the camera open while enabled)
 CAPTURE_INTERVAL_SECONDS = 300  # 5 minutes
+
+# Motion-triggered capture (keeps the camera open while enabled)
+MOTION_ENABLED = False
+MOTION_FRAME_WIDTH = 160  # Frames are downscaled to this width for analysis
+MOTION_PIXEL_THRESHOLD = 25  # Gray level change that marks a pixel as changed
+MOTION_MIN_AREA = 0.02  # Fraction of ROI pixels that must change to trigger
+MOTION_LEARNING_RATE = 0.05  # Background model adaptation speed
+MOTION_COOLDOWN_SECONDS = 30  # Minimum time between motion snapshots
+MOTION_ROI = None  # List of (x, y, width, height) fractions, e.g. [(0.25, 0.5, 0.5, 0.5)]
+
+# Retention of timestamped snapshots (None = no limit)
 MAX_STORED_IMAGES = 100  # Maximum number of historical images to keep
+MAX_STORED_BYTES = None  # Maximum total size of historical images, e.g. 500 * 1024**2
+MAX_IMAGE_AGE_SECONDS = None  # Delete images older than this, e.g. 30 * 86400
@@ -0,0 +1,212 @@
+"""
+Encoder pool for high-resolution streams.
+
+cv2.imencode releases the GIL, so a few threads can encode consecutive
+frames on separate cores at the same time. Frames are shared with the
+threads in place: a Frame keeps its capture ring buffer until it has been
+encoded and released, so no pixels are copied. Encoded frames are handed
+back strictly in capture order.
+"""
+import logging
+import threading
+from collections import deque
+from typing import Callable, Iterable, List, Optional, Tuple
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DROP_POLICIES = ('oldest', 'newest')
+
+
+class _Job:
+    """A frame waiting for or going through the pool."""
+    
+    __slots__ = ('frame', 'variants', 'done', 'dropped')
+    
+    def __init__(self, frame, variants: Tuple[Tuple[Optional[int], int, Optional[str]], ...]):
+        self.frame = frame
+        self.variants = variants
+        self.done = False
+        self.dropped = False
+
+
+class EncoderPool:
+    """
+    Encodes stream variants of captured frames on a pool of threads.
+    
+    Every submitted frame is encoded into all requested (width, quality, roi)
+    variants by one thread, so consecutive frames are encoded in parallel.
+    Finished frames are passed to on_ready in the order they were
+    submitted; a frame that finishes early waits for its predecessors.
+    
+    When more than max_pending frames wait for a thread, the drop policy
+    decides which frame is skipped: 'oldest' drops the longest waiting
+    frame (viewers stay close to live), 'newest' rejects the incoming one.
+    """
+    
+    def __init__(self, on_ready: Callable[[object], None],
+                 workers: int = config.ENCODER_WORKERS,
+                 max_pending: int = config.ENCODER_QUEUE_SIZE,
+                 drop_policy: str = config.ENCODER_DROP_POLICY,
+                 name: str = 'default'):
+        """
+        Initialize encoder pool.
+        
+        Args:
+            on_ready: Called with each encoded Frame, in submission order
+            workers: Number of encoder threads
+            max_pending: Maximum number of frames waiting for a thread
+            drop_policy: 'oldest' or 'newest' frame is dropped when the queue is full
+            name: Camera name used for thread names and metrics
+        
+        Raises:
+            ValueError: If the settings are invalid
+        """
+        if workers < 1:
+            raise ValueError("Encoder pool needs at least one worker")
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown encoder drop policy: {drop_policy}")
+        
+        self.on_ready = on_ready
+        self.workers = workers
+        self.max_pending = max(1, max_pending)
+        self.drop_policy = drop_policy
+        self.name = name
+        self._condition = threading.Condition()
+        self._queue = deque()  # jobs waiting for a thread
+        self._order = deque()  # all accepted jobs in submission order
+        self._release_lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._closed = False
+        
+        self._submitted = 0
+        self._encoded = 0
+        self._dropped = 0
+        self._queue_depth = metrics.ENCODER_QUEUE_DEPTH.labels(name)
+        self._dropped_total = metrics.ENCODER_FRAMES_DROPPED.labels(name)
+    
+    @property
+    def capacity(self) -> int:
+        """Maximum number of frames held by the pool at once."""
+        return self.max_pending + self.workers
+    
+    def submit(self, frame, variants: Iterable[Tuple[Optional[int], int, Optional[str]]]) -> bool:
+        """
+        Queue a frame for encoding.
+        
+        Args:
+            frame: Frame to encode (must not be modified)
+            variants: (width, quality, roi) tuples to encode
+        
+        Returns:
+            True if the frame was accepted, False if it was dropped
+        """
+        job = _Job(frame, tuple(variants))
+        
+        with self._condition:
+            if self._closed:
+                return False
+            self._submitted += 1
+            if len(self._queue) >= self.max_pending:
+                self._dropped += 1
+                self._dropped_total.inc()
+                if self.drop_policy == 'newest':
+                    return False
+                oldest = self._queue.popleft()
+                oldest.dropped = True
+                oldest.frame = None
+            
+            self._queue.append(job)
+            self._order.append(job)
+            self._queue_depth.set(len(self._queue))
+            if len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, name=f"encoder-{self.name}-{len(self._threads)}",
+                                          daemon=True)
+                self._threads.append(thread)
+                thread.start()
+            self._condition.notify()
+        
+        # A dropped job at the head of the line may unblock finished frames
+        self._release_ready()
+        return True
+    
+    def close(self, timeout: float = 2.0):
+        """
+        Stop the encoder threads. Queued frames are discarded; frames being
+        encoded are finished first, so no thread is inside OpenCV when the
+        interpreter shuts down.
+        
+        Args:
+            timeout: Maximum time to wait for each thread
+        """
+        with self._condition:
+            self._closed = True
+            self._queue.clear()
+            self._order.clear()
+            self._queue_depth.set(0)
+            threads = list(self._threads)
+            self._condition.notify_all()
+        for thread in threads:
+            thread.join(timeout)
+    
+    def get_stats(self) -> dict:
+        """
+        Get pool statistics.
+        
+        Returns:
+            Dictionary with pool size, queue depth and frame counters
+        """
+        with self._condition:
+            return {
+                "workers": self.workers,
+                "threads": len(self._threads),
+                "queue_depth": len(self._queue),
+                "max_pending": self.max_pending,
+                "drop_policy": self.drop_policy,
+                "submitted": self._submitted,
+                "encoded": self._encoded,
+                "dropped": self._dropped
+            }
+    
+    def _run(self):
+        """Encoder thread: encode one frame at a time into all its variants."""
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._queue or self._closed)
+                if self._closed:
+                    return
+                job = self._queue.popleft()
+                self._queue_depth.set(len(self._queue))
+            
+            try:
+                for width, quality, roi in job.variants:
+                    job.frame.mjpeg_part(width, quality, roi)
+            except Exception as e:
+                logger.error(f"Error in encoder pool: {e}")
+            
+            with self._condition:
+                job.done = True
+                self._encoded += 1
+            self._release_ready()
+    
+    def _release_ready(self):
+        """Hand finished frames to on_ready in submission order."""
+        # One thread releases at a time, so callbacks never overtake each other
+        with self._release_lock:
+            while True:
+                with self._condition:
+                    if not self._order:
+                        return
+                    job = self._order[0]
+                    if not job.dropped and not job.done:
+                        return
+                    self._order.popleft()
+                    frame, job.frame = job.frame, None
+                
+                if frame is None:
+                    continue
+                try:
+                    self.on_ready(frame)
+                except Exception as e:
+                    logger.error(f"Error publishing encoded frame: {e}")
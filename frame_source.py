@@ -0,0 +1,511 @@
+"""
+Frame sources for the camera server.
+A frame source hides where frames come from, so capture, streaming and
+encoding paths can run against a real USB camera, a synthetic test
+pattern or a recorded video without code changes.
+"""
+import cv2
+import os
+import glob
+import logging
+import math
+import time
+from typing import Optional, Tuple
+import numpy as np
+import config
+
+logger = logging.getLogger(__name__)
+
+
+def jpeg_dimensions(data) -> Optional[Tuple[int, int]]:
+    """
+    Read the image size from the JPEG frame header without decoding.
+    
+    Args:
+        data: JPEG bytes (or any buffer)
+    
+    Returns:
+        Tuple of (width, height), or None if the header is not found
+    """
+    data = memoryview(data)
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        # Standalone markers and fill bytes have no length field
+        if marker == 0xFF or marker == 0x01 or 0xD0 <= marker <= 0xD9:
+            i += 1 if marker == 0xFF else 2
+            continue
+        length = (data[i + 2] << 8) | data[i + 3]
+        # SOF0-SOF15 except DHT (C4), JPG (C8) and DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = (data[i + 5] << 8) | data[i + 6]
+            width = (data[i + 7] << 8) | data[i + 8]
+            return width, height
+        i += 2 + length
+    return None
+
+
+# JPEG decoder downscaling: (factor, color flag, grayscale flag), largest factor first
+_REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+)
+
+
+def reduced_decode_flag(source_width: Optional[int], width: Optional[int], grayscale: bool = False) -> int:
+    """
+    Decode flag that lets the JPEG decoder downscale by 2, 4 or 8 while
+    the result is still at least the target width, which is much cheaper
+    than a full decode followed by a resize.
+    
+    Args:
+        source_width: Width of the JPEG (None = unknown, decode at full size)
+        width: Smallest acceptable decoded width (None = full size)
+        grayscale: Decode to grayscale instead of BGR
+    
+    Returns:
+        cv2.IMREAD_* flag for cv2.imread / cv2.imdecode
+    """
+    if source_width and width:
+        for factor, color, gray in _REDUCED_FLAGS:
+            if source_width // factor >= width:
+                return gray if grayscale else color
+    return cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR
+
+
+def resolve_device(device: str) -> Optional[int]:
+    """
+    Find the current index of a V4L2 device. USB cameras may come back
+    as a different /dev/videoN after a reconnect, but their udev links
+    and serial numbers stay the same.
+    
+    Args:
+        device: Device path (/dev/video2, /dev/v4l/by-id/..., /dev/v4l/by-path/...)
+                or a serial number / name fragment matched against /dev/v4l/by-id
+    
+    Returns:
+        Device index, or None if the device is not present
+    """
+    if device.isdigit():
+        return int(device)
+    
+    if os.path.exists(device):
+        path = os.path.realpath(device)
+    else:
+        # Capture nodes end with -video-index0; other indexes are metadata nodes
+        matches = sorted(glob.glob('/dev/v4l/by-id/*'), key=lambda link: not link.endswith('-index0'))
+        matches = [link for link in matches if device in os.path.basename(link)]
+        if not matches:
+            return None
+        path = os.path.realpath(matches[0])
+    
+    name = os.path.basename(path)
+    if not name.startswith('video') or not name[len('video'):].isdigit():
+        logger.warning(f"{device} does not point to a /dev/videoN device ({path})")
+        return None
+    return int(name[len('video'):])
+
+
+class FrameSource:
+    """
+    Base class for frame sources.
+    Mirrors the subset of cv2.VideoCapture used by the camera module.
+    """
+    
+    name = "base"
+    passthrough = False  # True when read_jpeg() hands out the device's own JPEG data
+    
+    def open(self) -> bool:
+        """
+        Open the source.
+        
+        Returns:
+            True if the source is ready to deliver frames
+        """
+        raise NotImplementedError
+    
+    def is_opened(self) -> bool:
+        """Return True if the source is open."""
+        raise NotImplementedError
+    
+    def read(self, image: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        """
+        Read the next frame.
+        
+        Args:
+            image: Buffer to read into; used when its shape matches the
+                   frame, otherwise a new array is returned
+        
+        Returns:
+            Tuple of (success: bool, BGR frame or None)
+        """
+        raise NotImplementedError
+    
+    def read_jpeg(self) -> Tuple[bool, Optional[bytes]]:
+        """
+        Read the next frame as JPEG data.
+        Sources without native JPEG output encode a decoded frame, like a
+        camera's hardware encoder would.
+        
+        Returns:
+            Tuple of (success: bool, JPEG bytes or None)
+        """
+        ret, image = self.read()
+        if not ret or image is None:
+            return False, None
+        ret, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, config.STREAM_JPEG_QUALITY])
+        return ret, buffer.tobytes() if ret else None
+    
+    def release(self):
+        """Release source resources."""
+        raise NotImplementedError
+
+
+class V4L2Source(FrameSource):
+    """
+    USB camera opened through OpenCV's V4L2 backend.
+    In passthrough mode the camera is asked for MJPG and OpenCV's
+    conversion to BGR is disabled, so reads return the compressed frames
+    exactly as the camera sent them.
+    """
+    
+    name = "v4l2"
+    
+    def __init__(self, camera_index: int = config.CAMERA_INDEX,
+                 width: int = config.CAMERA_WIDTH,
+                 height: int = config.CAMERA_HEIGHT,
+                 fps: int = config.CAMERA_FPS,
+                 passthrough: bool = False):
+        """
+        Initialize V4L2 source.
+        
+        Args:
+            camera_index: Camera device index (0 for /dev/video0)
+            width: Requested frame width
+            height: Requested frame height
+            fps: Requested frame rate
+            passthrough: Read the camera's MJPEG frames without decoding them
+        """
+        self.camera_index = camera_index
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.passthrough = passthrough
+        self.capture = None
+    
+    def open(self) -> bool:
+        # Use V4L2 backend for Linux USB cameras
+        self.capture = cv2.VideoCapture(self.camera_index, cv2.CAP_V4L2)
+        
+        if not self.capture.isOpened():
+            logger.error(f"Failed to open camera at index {self.camera_index}")
+            return False
+        
+        # Set camera properties
+        self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        self.capture.set(cv2.CAP_PROP_FPS, self.fps)
+        
+        if self.passthrough:
+            self.capture.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+            fourcc = int(self.capture.get(cv2.CAP_PROP_FOURCC))
+            if fourcc != cv2.VideoWriter_fourcc(*'MJPG'):
+                logger.warning("Camera does not deliver MJPG, MJPEG passthrough disabled")
+                self.passthrough = False
+            else:
+                self.capture.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+        
+        # Try to enable auto exposure and auto white balance
+        self.capture.set(cv2.CAP_PROP_AUTO_EXPOSURE, 0.75)  # Auto exposure
+        self.capture.set(cv2.CAP_PROP_AUTOFOCUS, 1)  # Auto focus if available
+        
+        # Log actual camera settings
+        actual_width = self.capture.get(cv2.CAP_PROP_FRAME_WIDTH)
+        actual_height = self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT)
+        actual_fps = self.capture.get(cv2.CAP_PROP_FPS)
+        
+        logger.info(f"Camera opened: {actual_width}x{actual_height} @ {actual_fps}fps")
+        return True
+    
+    def is_opened(self) -> bool:
+        return self.capture is not None and self.capture.isOpened()
+    
+    def read(self, image: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        if self.capture is None:
+            return False, None
+        if self.passthrough:
+            ret, data = self.read_jpeg()
+            if not ret:
+                return False, None
+            return True, cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        return self.capture.read(image)
+    
+    def read_jpeg(self) -> Tuple[bool, Optional[bytes]]:
+        if not self.passthrough:
+            return super().read_jpeg()
+        if self.capture is None:
+            return False, None
+        ret, data = self.capture.read()
+        if not ret or data is None:
+            return False, None
+        if data.ndim != 2 or data.shape[0] != 1:
+            # The backend ignored CONVERT_RGB and decoded the frame anyway
+            logger.warning("Camera returned decoded frames, MJPEG passthrough disabled")
+            self.passthrough = False
+            ret, buffer = cv2.imencode('.jpg', data, [cv2.IMWRITE_JPEG_QUALITY, config.STREAM_JPEG_QUALITY])
+            return ret, buffer.tobytes() if ret else None
+        return True, data.tobytes()
+    
+    def release(self):
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
+
+
+class _PacedSource(FrameSource):
+    """Base for sources that emulate a camera's frame rate."""
+    
+    def __init__(self, fps: float):
+        self.fps = fps
+        self._next_frame_time = 0.0
+    
+    def _pace(self):
+        """Sleep until the next frame is due, like a real device would block."""
+        if self.fps <= 0:
+            return
+        now = time.monotonic()
+        if self._next_frame_time > now:
+            time.sleep(self._next_frame_time - now)
+            now = self._next_frame_time
+        elif now - self._next_frame_time > 1.0:
+            # Consumer fell far behind; do not try to catch up with a burst
+            self._next_frame_time = now
+        self._next_frame_time = max(self._next_frame_time, now - 1.0) + 1.0 / self.fps
+
+
+class SyntheticSource(_PacedSource):
+    """
+    Generated test pattern: a color gradient with a moving box and a frame
+    counter. Needs no hardware, so it can be used for benchmarks and CI.
+    Optionally the first frames after open are underexposed and brighten
+    like a camera's auto-exposure loop, to exercise the adaptive warmup.
+    """
+    
+    name = "synthetic"
+    
+    def __init__(self, width: int = config.CAMERA_WIDTH,
+                 height: int = config.CAMERA_HEIGHT,
+                 fps: float = config.CAMERA_FPS,
+                 passthrough: bool = False,
+                 exposure_seconds: float = 0.0):
+        """
+        Initialize synthetic source.
+        
+        Args:
+            width: Frame width in pixels
+            height: Frame height in pixels
+            fps: Frame rate to emulate (0 = as fast as possible)
+            passthrough: Deliver JPEG frames like an MJPEG camera (encoded here)
+            exposure_seconds: Emulated auto-exposure settling time after open (0 = off)
+        """
+        super().__init__(fps)
+        self.passthrough = passthrough
+        self.width = width
+        self.height = height
+        self.exposure_seconds = exposure_seconds
+        self._background = None
+        self._frame_number = 0
+        self._opened_at = 0.0
+    
+    def open(self) -> bool:
+        # Precompute the static gradient once
+        x = np.linspace(0, 255, self.width, dtype=np.float32)
+        y = np.linspace(0, 255, self.height, dtype=np.float32)
+        background = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        background[:, :, 0] = x[np.newaxis, :]
+        background[:, :, 1] = y[:, np.newaxis]
+        background[:, :, 2] = 128
+        self._background = background
+        self._frame_number = 0
+        self._next_frame_time = self._opened_at = time.monotonic()
+        logger.info(f"Synthetic source opened: {self.width}x{self.height} @ {self.fps}fps")
+        return True
+    
+    def is_opened(self) -> bool:
+        return self._background is not None
+    
+    def read(self, image: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        if self._background is None:
+            return False, None
+        self._pace()
+        
+        if image is not None and image.shape == self._background.shape:
+            frame = image
+            np.copyto(frame, self._background)
+        else:
+            frame = self._background.copy()
+        n = self._frame_number
+        box = max(8, min(self.width, self.height) // 6)
+        x = (n * 4) % max(1, self.width - box)
+        y = (n * 2) % max(1, self.height - box)
+        frame[y:y + box, x:x + box] = (255, 255, 255)
+        cv2.putText(frame, str(n), (10, max(20, self.height // 12)),
+                    cv2.FONT_HERSHEY_SIMPLEX, max(0.5, self.height / 480), (0, 0, 0), 2)
+        
+        if self.exposure_seconds > 0:
+            elapsed = time.monotonic() - self._opened_at
+            if elapsed < self.exposure_seconds:
+                # Starts black and approaches the final exposure exponentially
+                gain = 1.0 - math.exp(-5.0 * elapsed / self.exposure_seconds)
+                cv2.convertScaleAbs(frame, frame, alpha=gain)
+        
+        self._frame_number += 1
+        return True, frame
+    
+    def release(self):
+        self._background = None
+
+
+class ReplaySource(_PacedSource):
+    """
+    Replays a video file or a directory of JPEG images as a camera.
+    Loops at the end of the recording if requested.
+    A directory of JPEGs in passthrough mode stands in for an MJPEG
+    camera: the files are handed out as read, without decoding.
+    """
+    
+    name = "replay"
+    
+    def __init__(self, path: str, fps: float = config.CAMERA_FPS, loop: bool = True,
+                 passthrough: bool = False):
+        """
+        Initialize replay source.
+        
+        Args:
+            path: Video file or directory containing *.jpg files
+            fps: Frame rate to replay at (0 = as fast as possible)
+            loop: Restart from the beginning after the last frame
+            passthrough: Deliver JPEG frames like an MJPEG camera
+        """
+        super().__init__(fps)
+        self.passthrough = passthrough
+        self.path = path
+        self.loop = loop
+        self._video = None
+        self._files = None
+        self._position = 0
+    
+    def open(self) -> bool:
+        if not self.path:
+            logger.error("Replay source requires REPLAY_PATH")
+            return False
+        
+        if os.path.isdir(self.path):
+            self._files = sorted(glob.glob(os.path.join(self.path, '*.jpg')))
+            if not self._files:
+                logger.error(f"No JPEG files found in {self.path}")
+                self._files = None
+                return False
+            logger.info(f"Replay source opened: {len(self._files)} images from {self.path}")
+        else:
+            self._video = cv2.VideoCapture(self.path)
+            if not self._video.isOpened():
+                logger.error(f"Failed to open replay file {self.path}")
+                self._video = None
+                return False
+            logger.info(f"Replay source opened: {self.path}")
+        
+        self._position = 0
+        self._next_frame_time = time.monotonic()
+        return True
+    
+    def is_opened(self) -> bool:
+        return self._video is not None or self._files is not None
+    
+    def read(self, image: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        if not self.is_opened():
+            return False, None
+        self._pace()
+        
+        if self._files is not None:
+            path = self._next_file()
+            frame = cv2.imread(path) if path is not None else None
+            return frame is not None, frame
+        
+        ret, frame = self._video.read(image)
+        if not ret and self.loop:
+            self._video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self._video.read(image)
+        return ret, frame
+    
+    def read_jpeg(self) -> Tuple[bool, Optional[bytes]]:
+        if self._files is None:
+            return super().read_jpeg()
+        self._pace()
+        path = self._next_file()
+        if path is None:
+            return False, None
+        try:
+            with open(path, 'rb') as f:
+                return True, f.read()
+        except OSError as e:
+            logger.warning(f"Failed to read replay image {path}: {e}")
+            return False, None
+    
+    def _next_file(self) -> Optional[str]:
+        """Advance to the next JPEG file, looping if enabled."""
+        if self._position >= len(self._files):
+            if not self.loop:
+                return None
+            self._position = 0
+        path = self._files[self._position]
+        self._position += 1
+        return path
+    
+    def release(self):
+        if self._video is not None:
+            self._video.release()
+            self._video = None
+        self._files = None
+
+
+def create_frame_source(camera_index: int = config.CAMERA_INDEX,
+                        width: Optional[int] = None,
+                        height: Optional[int] = None,
+                        fps: Optional[float] = None,
+                        source: Optional[str] = None,
+                        replay_path: Optional[str] = None,
+                        passthrough: Optional[bool] = None) -> FrameSource:
+    """
+    Create a frame source. Settings that are not given come from config.
+    
+    Args:
+        camera_index: Camera device index (used by the V4L2 source)
+        width: Frame width
+        height: Frame height
+        fps: Frame rate
+        source: 'v4l2', 'synthetic' or 'replay' (default: config.FRAME_SOURCE)
+        replay_path: Video file or JPEG directory for the replay source
+        passthrough: Deliver JPEG frames without decoding (default: CAMERA_MJPEG_PASSTHROUGH)
+    
+    Returns:
+        FrameSource instance (not opened yet)
+    """
+    source = source or config.FRAME_SOURCE
+    width = width or config.CAMERA_WIDTH
+    height = height or config.CAMERA_HEIGHT
+    fps = config.CAMERA_FPS if fps is None else fps
+    passthrough = config.CAMERA_MJPEG_PASSTHROUGH if passthrough is None else passthrough
+    
+    if source == 'v4l2':
+        return V4L2Source(camera_index, width, height, fps, passthrough)
+    if source == 'synthetic':
+        return SyntheticSource(width, height, fps, passthrough, config.SYNTHETIC_EXPOSURE_SECONDS)
+    if source == 'replay':
+        return ReplaySource(replay_path or config.REPLAY_PATH, fps, config.REPLAY_LOOP, passthrough)
+    
+    raise ValueError(f"Unknown frame source: {source}")
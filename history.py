@@ -0,0 +1,502 @@
+"""
+Persistent snapshot history index backed by SQLite.
+Every stored timestamped snapshot gets a row with its capture time, size,
+dimensions and content hash, so time-range queries over months of
+history never have to scan the images directory.
+"""
+import cv2
+import os
+import json
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+from typing import List, Optional, Tuple
+import numpy as np
+import config
+from frame_source import jpeg_dimensions
+from storage import StoredImage, content_hash
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    filename TEXT NOT NULL UNIQUE,
+    captured_at REAL NOT NULL,
+    size INTEGER NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    content_hash TEXT,
+    brightness REAL,
+    sharpness REAL,
+    histogram TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_snapshots_captured_at ON snapshots (captured_at, id);
+CREATE TABLE IF NOT EXISTS motion_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    occurred_at REAL NOT NULL,
+    score REAL NOT NULL,
+    snapshot_filename TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_motion_events_occurred_at ON motion_events (occurred_at);
+CREATE TABLE IF NOT EXISTS recordings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    filename TEXT NOT NULL UNIQUE,
+    started_at REAL NOT NULL,
+    ended_at REAL NOT NULL,
+    frames INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    width INTEGER,
+    height INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_recordings_started_at ON recordings (started_at, id);
+"""
+
+# Columns added after the first release: (table, column, type)
+MIGRATIONS = (
+    ('snapshots', 'brightness', 'REAL'),
+    ('snapshots', 'sharpness', 'REAL'),
+    ('snapshots', 'histogram', 'TEXT'),
+)
+
+
+def _parse_capture_time(filename: str, fallback: float) -> float:
+    """Get the capture time from a snapshot_<timestamp>.jpg file name."""
+    stem = os.path.splitext(filename)[0]
+    try:
+        return datetime.strptime(stem[len('snapshot_'):], config.TIMESTAMP_FORMAT).timestamp()
+    except ValueError:
+        return fallback
+
+
+def parse_time(value: str) -> float:
+    """
+    Parse a query time given as UNIX timestamp or ISO 8601 string.
+    
+    Raises:
+        ValueError: If the value is neither
+    """
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def _decoded_dimensions(data: bytes) -> Tuple[Optional[int], Optional[int]]:
+    """
+    Image dimensions by a full decode, for unusual files whose JPEG frame
+    header jpeg_dimensions cannot parse.
+    
+    Args:
+        data: Image bytes
+    
+    Returns:
+        Tuple of (width, height), or (None, None) if the image is unreadable
+    """
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    if image is None:
+        return None, None
+    return image.shape[1], image.shape[0]
+
+
+class SnapshotHistory:
+    """
+    SQLite index of stored snapshots.
+    Maintained by the snapshot writer and retention index; reconciled with
+    the images directory once at startup.
+    """
+    
+    def __init__(self, db_path: Optional[str] = None, images_dir: Optional[str] = None):
+        """
+        Initialize snapshot history.
+        
+        Args:
+            db_path: SQLite database file (default: HISTORY_DB_PATH or
+                     snapshots.db in the images directory)
+            images_dir: Directory holding the snapshots (default: IMAGES_DIR)
+        """
+        self.db_path = db_path
+        self.images_dir = images_dir
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Open the database on first use. Caller holds the lock."""
+        if self._conn is None:
+            path = self.db_path or config.HISTORY_DB_PATH or os.path.join(self._images_dir(), 'snapshots.db')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+            self._migrate()
+            logger.info(f"Snapshot history database: {path}")
+        return self._conn
+    
+    def _migrate(self):
+        """Add columns missing from databases created by older versions. Caller holds the lock."""
+        for table, column, kind in MIGRATIONS:
+            columns = {row['name'] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {kind}")
+                logger.info(f"Snapshot history database: added column {table}.{column}")
+        self._conn.commit()
+    
+    @staticmethod
+    def _snapshot_row(row: sqlite3.Row) -> dict:
+        """Snapshot row as dictionary with the histogram decoded."""
+        item = dict(row)
+        item['histogram'] = json.loads(item['histogram']) if item.get('histogram') else None
+        return item
+    
+    def _images_dir(self) -> str:
+        """Directory holding the snapshots."""
+        return self.images_dir or config.IMAGES_DIR
+    
+    def add(self, image: StoredImage):
+        """
+        Insert or update a stored snapshot.
+        
+        Args:
+            image: Stored snapshot
+        """
+        with self._lock:
+            conn = self._connect()
+            quality = image.image_quality
+            conn.execute(
+                "INSERT INTO snapshots (filename, captured_at, size, width, height, content_hash, "
+                "brightness, sharpness, histogram) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(filename) DO UPDATE SET captured_at = excluded.captured_at, "
+                "size = excluded.size, width = excluded.width, height = excluded.height, "
+                "content_hash = excluded.content_hash, "
+                "brightness = COALESCE(excluded.brightness, brightness), "
+                "sharpness = COALESCE(excluded.sharpness, sharpness), "
+                "histogram = COALESCE(excluded.histogram, histogram)",
+                (os.path.basename(image.path), image.captured_at, image.size,
+                 image.width, image.height, image.content_hash,
+                 quality.brightness if quality else None, quality.sharpness if quality else None,
+                 json.dumps([round(value, 4) for value in quality.histogram]) if quality else None)
+            )
+            conn.commit()
+    
+    def remove(self, path: str):
+        """
+        Remove a deleted snapshot from the index.
+        
+        Args:
+            path: Snapshot file path
+        """
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM snapshots WHERE filename = ?", (os.path.basename(path),))
+            conn.commit()
+    
+    def sync(self) -> Tuple[int, int]:
+        """
+        Reconcile the index with the images directory.
+        Only files missing from the index are read; rows of files that no
+        longer exist are removed.
+        
+        Returns:
+            Tuple of (added, removed) row counts
+        """
+        on_disk = {}
+        try:
+            with os.scandir(self._images_dir()) as entries:
+                for entry in entries:
+                    if entry.name.startswith('snapshot_') and entry.name.endswith('.jpg'):
+                        on_disk[entry.name] = entry
+        except FileNotFoundError:
+            pass
+        
+        with self._lock:
+            conn = self._connect()
+            indexed = set(row[0] for row in conn.execute("SELECT filename FROM snapshots"))
+        
+        missing = [name for name in on_disk if name not in indexed]
+        vanished = [name for name in indexed if name not in on_disk]
+        
+        rows = []
+        for name in missing:
+            entry = on_disk[name]
+            try:
+                with open(entry.path, 'rb') as f:
+                    data = f.read()
+                mtime = entry.stat().st_mtime
+            except OSError:
+                continue
+            width, height = jpeg_dimensions(data) or _decoded_dimensions(data)
+            rows.append((name, _parse_capture_time(name, mtime), len(data),
+                         width, height, content_hash(data)))
+        
+        with self._lock:
+            conn = self._connect()
+            conn.executemany(
+                "INSERT OR IGNORE INTO snapshots (filename, captured_at, size, width, height, content_hash) "
+                "VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            conn.executemany("DELETE FROM snapshots WHERE filename = ?", [(name,) for name in vanished])
+            conn.commit()
+        
+        if rows or vanished:
+            logger.info(f"Snapshot history synced: {len(rows)} added, {len(vanished)} removed")
+        return len(rows), len(vanished)
+    
+    def stored_images(self) -> List[StoredImage]:
+        """
+        Sync with the images directory and list all snapshots, oldest first.
+        Used to seed the retention index without a second directory scan.
+        
+        Returns:
+            List of StoredImage
+        """
+        self.sync()
+        with self._lock:
+            conn = self._connect()
+            rows = conn.execute(
+                "SELECT filename, size, captured_at, width, height, content_hash "
+                "FROM snapshots ORDER BY captured_at, id"
+            ).fetchall()
+        return [
+            StoredImage(os.path.join(self._images_dir(), row['filename']), row['size'],
+                        row['captured_at'], row['width'], row['height'], row['content_hash'])
+            for row in rows
+        ]
+    
+    def query(self, start: Optional[float] = None, end: Optional[float] = None,
+              limit: int = 100, cursor: Optional[str] = None, min_brightness: Optional[float] = None,
+              min_sharpness: Optional[float] = None) -> Tuple[List[dict], Optional[str]]:
+        """
+        List snapshots in a time range, oldest first, with keyset pagination.
+        
+        Args:
+            start: Earliest capture time (UNIX timestamp, inclusive)
+            end: Latest capture time (UNIX timestamp, inclusive)
+            limit: Maximum number of items
+            cursor: Value of next_cursor from the previous page
+            min_brightness: Only snapshots at least this bright (unanalyzed ones are skipped)
+            min_sharpness: Only snapshots at least this sharp (unanalyzed ones are skipped)
+        
+        Returns:
+            Tuple of (items, next_cursor or None on the last page)
+        
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        clauses = []
+        params = []
+        if start is not None:
+            clauses.append("captured_at >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("captured_at <= ?")
+            params.append(end)
+        if min_brightness is not None:
+            clauses.append("brightness >= ?")
+            params.append(min_brightness)
+        if min_sharpness is not None:
+            clauses.append("sharpness >= ?")
+            params.append(min_sharpness)
+        if cursor:
+            cursor_time, cursor_id = cursor.split(':', 1)
+            clauses.append("(captured_at > ? OR (captured_at = ? AND id > ?))")
+            params.extend([float(cursor_time), float(cursor_time), int(cursor_id)])
+        
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = f"SELECT * FROM snapshots {where} ORDER BY captured_at, id LIMIT ?"
+        params.append(limit + 1)
+        
+        with self._lock:
+            conn = self._connect()
+            rows = conn.execute(sql, params).fetchall()
+        
+        items = [self._snapshot_row(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = items[-1]
+            next_cursor = f"{last['captured_at']!r}:{last['id']}"
+        return items, next_cursor
+    
+    def get(self, snapshot_id: int) -> Optional[dict]:
+        """
+        Get a snapshot by id.
+        
+        Args:
+            snapshot_id: Row id
+        
+        Returns:
+            Snapshot row as dictionary, or None if not found
+        """
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT * FROM snapshots WHERE id = ?", (snapshot_id,)).fetchone()
+        return self._snapshot_row(row) if row else None
+    
+    def path_for(self, item: dict) -> str:
+        """Get the file path of a snapshot row."""
+        return os.path.join(self._images_dir(), item['filename'])
+    
+    def add_motion_event(self, occurred_at: float, score: float, snapshot_filename: Optional[str]):
+        """
+        Record a motion event.
+        
+        Args:
+            occurred_at: Event time as UNIX timestamp
+            score: Fraction of changed pixels in the region of interest
+            snapshot_filename: Name of the snapshot stored for the event
+        """
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT INTO motion_events (occurred_at, score, snapshot_filename) VALUES (?, ?, ?)",
+                (occurred_at, score, snapshot_filename)
+            )
+            conn.commit()
+    
+    def query_motion_events(self, start: Optional[float] = None, end: Optional[float] = None,
+                            limit: int = 100) -> List[dict]:
+        """
+        List motion events in a time range, newest first.
+        
+        Args:
+            start: Earliest event time (UNIX timestamp, inclusive)
+            end: Latest event time (UNIX timestamp, inclusive)
+            limit: Maximum number of events
+        
+        Returns:
+            List of events with the id of the stored snapshot (if still present)
+        """
+        clauses = []
+        params = []
+        if start is not None:
+            clauses.append("e.occurred_at >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("e.occurred_at <= ?")
+            params.append(end)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        params.append(limit)
+        
+        with self._lock:
+            conn = self._connect()
+            rows = conn.execute(
+                "SELECT e.id, e.occurred_at, e.score, e.snapshot_filename, s.id AS snapshot_id "
+                f"FROM motion_events e LEFT JOIN snapshots s ON s.filename = e.snapshot_filename "
+                f"{where} ORDER BY e.occurred_at DESC LIMIT ?", params
+            ).fetchall()
+        return [dict(row) for row in rows]
+    
+    def add_recording(self, filename: str, started_at: float, ended_at: float, frames: int,
+                      size: int, width: Optional[int], height: Optional[int]) -> int:
+        """
+        Record a finished recording segment.
+        
+        Args:
+            filename: Segment file name
+            started_at: Capture time of the first frame (UNIX timestamp)
+            ended_at: Capture time of the last frame (UNIX timestamp)
+            frames: Number of frames
+            size: File size in bytes
+            width: Frame width
+            height: Frame height
+        
+        Returns:
+            Row id of the segment
+        """
+        with self._lock:
+            conn = self._connect()
+            cursor = conn.execute(
+                "INSERT OR REPLACE INTO recordings (filename, started_at, ended_at, frames, size, width, height) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (filename, started_at, ended_at, frames, size, width, height)
+            )
+            conn.commit()
+            return cursor.lastrowid
+    
+    def remove_recording(self, filename: str):
+        """
+        Remove a deleted recording segment from the index.
+        
+        Args:
+            filename: Segment file name
+        """
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM recordings WHERE filename = ?", (filename,))
+            conn.commit()
+    
+    def get_recording(self, recording_id: int) -> Optional[dict]:
+        """
+        Get a recording segment by id.
+        
+        Args:
+            recording_id: Row id
+        
+        Returns:
+            Segment row as dictionary, or None if not found
+        """
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT * FROM recordings WHERE id = ?", (recording_id,)).fetchone()
+        return dict(row) if row else None
+    
+    def recordings(self) -> List[dict]:
+        """
+        List all recording segments, oldest first (used for retention).
+        
+        Returns:
+            Segment rows as dictionaries
+        """
+        with self._lock:
+            conn = self._connect()
+            rows = conn.execute("SELECT * FROM recordings ORDER BY started_at, id").fetchall()
+        return [dict(row) for row in rows]
+    
+    def query_recordings(self, start: Optional[float] = None, end: Optional[float] = None,
+                         limit: int = 100, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        """
+        List recording segments overlapping a time range, oldest first,
+        with keyset pagination.
+        
+        Args:
+            start: Earliest time (UNIX timestamp, inclusive)
+            end: Latest time (UNIX timestamp, inclusive)
+            limit: Maximum number of items
+            cursor: Value of next_cursor from the previous page
+        
+        Returns:
+            Tuple of (items, next_cursor or None on the last page)
+        
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        clauses = []
+        params = []
+        if start is not None:
+            clauses.append("ended_at >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("started_at <= ?")
+            params.append(end)
+        if cursor:
+            cursor_time, cursor_id = cursor.split(':', 1)
+            clauses.append("(started_at > ? OR (started_at = ? AND id > ?))")
+            params.extend([float(cursor_time), float(cursor_time), int(cursor_id)])
+        
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = f"SELECT * FROM recordings {where} ORDER BY started_at, id LIMIT ?"
+        params.append(limit + 1)
+        
+        with self._lock:
+            conn = self._connect()
+            rows = conn.execute(sql, params).fetchall()
+        
+        items = [dict(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = items[-1]
+            next_cursor = f"{last['started_at']!r}:{last['id']}"
+        return items, next_cursor
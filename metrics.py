@@ -0,0 +1,300 @@
+"""
+Prometheus metrics for the camera server.
+
+Metrics are plain Python objects with pre-allocated bucket arrays and no
+locks on the update path: an observation is one bisect and two additions,
+cheap enough for every frame at 30 fps. Writers are mostly single threads
+(capture loop, snapshot writer); a rare lost increment between concurrent
+writers is an accepted trade-off for keeping the hot path lock-free.
+"""
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Latency buckets in seconds, from sub-millisecond reads to slow device opens
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Size buckets in bytes for encoded frames
+SIZE_BUCKETS = (8192, 16384, 32768, 65536, 131072, 262144, 524288, 1048576, 2097152)
+
+_registry: List["_Metric"] = []
+
+
+def _format_value(value: float) -> str:
+    """Format a sample value in Prometheus text format."""
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    """Build a {name="value",...} label string."""
+    parts = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class _Metric:
+    """Base class: registration, labels and exposition header."""
+    
+    kind = 'untyped'
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registered: bool = True):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], "_Metric"] = {}
+        self._children_lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self
+        if registered:
+            _registry.append(self)
+    
+    def labels(self, *values: str) -> "_Metric":
+        """
+        Get the child metric for a set of label values.
+        Children are created once; later lookups are a plain dict read.
+        """
+        child = self._children.get(values)
+        if child is None:
+            with self._children_lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._new_child()
+                    self._children[values] = child
+        return child
+    
+    def _new_child(self) -> "_Metric":
+        raise NotImplementedError
+    
+    def _samples(self, labels: Tuple[str, ...]) -> List[str]:
+        raise NotImplementedError
+    
+    def render(self) -> List[str]:
+        """Render the metric in Prometheus text exposition format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for labels, child in list(self._children.items()):
+            lines.extend(child._samples(labels))
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter."""
+    
+    kind = 'counter'
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registered: bool = True):
+        self.value = 0
+        super().__init__(name, documentation, labelnames, registered)
+    
+    def _new_child(self) -> "Counter":
+        return Counter(self.name, self.documentation, self.labelnames, registered=False)
+    
+    def inc(self, amount: float = 1):
+        """Increase the counter."""
+        self.value += amount
+    
+    def _samples(self, labels: Tuple[str, ...]) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(self.value)}"]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, or be read from a function at scrape time."""
+    
+    kind = 'gauge'
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 function: Optional[Callable[[], float]] = None, registered: bool = True):
+        self.value = 0
+        self.function = function
+        super().__init__(name, documentation, labelnames, registered)
+    
+    def _new_child(self) -> "Gauge":
+        return Gauge(self.name, self.documentation, self.labelnames, registered=False)
+    
+    def inc(self, amount: float = 1):
+        self.value += amount
+    
+    def dec(self, amount: float = 1):
+        self.value -= amount
+    
+    def set(self, value: float):
+        self.value = value
+    
+    def _samples(self, labels: Tuple[str, ...]) -> List[str]:
+        value = self.function() if self.function is not None else self.value
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    """Histogram with fixed, pre-allocated buckets."""
+    
+    kind = 'histogram'
+    
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = LATENCY_BUCKETS,
+                 labelnames: Sequence[str] = (), registered: bool = True):
+        self.bounds = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        super().__init__(name, documentation, labelnames, registered)
+    
+    def _new_child(self) -> "Histogram":
+        return Histogram(self.name, self.documentation, self.bounds, self.labelnames, registered=False)
+    
+    def observe(self, value: float):
+        """Record one observation."""
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+    
+    def time(self) -> "_Timer":
+        """Context manager observing the elapsed time of its block."""
+        return _Timer(self)
+    
+    def _samples(self, labels: Tuple[str, ...]) -> List[str]:
+        counts = list(self.counts)
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + (float('inf'),), counts):
+            cumulative += count
+            label_str = _format_labels(self.labelnames, labels, f'le="{_format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{label_str} {cumulative}")
+        label_str = _format_labels(self.labelnames, labels)
+        lines.append(f"{self.name}_sum{label_str} {_format_value(self.sum)}")
+        lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+
+class _Timer:
+    """Observe the duration of a with-block in a histogram."""
+    
+    __slots__ = ('histogram', 'start')
+    
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class TimedLock:
+    """
+    Lock that records how long callers waited to acquire it.
+    The uncontended case is a single non-blocking acquire.
+    """
+    
+    def __init__(self, histogram: Histogram):
+        self._lock = threading.Lock()
+        self._histogram = histogram
+    
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        if self._lock.acquire(False):
+            self._histogram.observe(0.0)
+            return True
+        if not blocking:
+            return False
+        start = time.perf_counter()
+        acquired = self._lock.acquire(True, timeout)
+        if acquired:
+            self._histogram.observe(time.perf_counter() - start)
+        return acquired
+    
+    def release(self):
+        self._lock.release()
+    
+    def locked(self) -> bool:
+        return self._lock.locked()
+    
+    def __enter__(self):
+        self.acquire()
+        return self
+    
+    def __exit__(self, *exc):
+        self.release()
+
+
+def render() -> str:
+    """
+    Render all registered metrics.
+    
+    Returns:
+        Prometheus text exposition
+    """
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# Camera device (labelled by camera name)
+CAMERA_OPEN_SECONDS = Histogram('camera_open_seconds', 'Time to open the frame source.',
+                                labelnames=('camera',))
+CAMERA_WARMUP_SECONDS = Histogram('camera_warmup_seconds', 'Time spent warming up the camera after opening.',
+                                  labelnames=('camera',))
+CAMERA_WARMUP_TIMEOUTS = Counter('camera_warmup_timeouts_total',
+                                 'Adaptive warmups that ended at the time limit before exposure converged.',
+                                 labelnames=('camera',))
+CAMERA_READ_SECONDS = Histogram('camera_read_seconds', 'Latency of one camera read.', labelnames=('camera',))
+CAMERA_READ_FAILURES = Counter('camera_read_failures_total', 'Camera reads that returned no frame.',
+                               labelnames=('camera',))
+CAMERA_LOCK_WAIT_SECONDS = Histogram('camera_lock_wait_seconds', 'Time spent waiting for the camera lock.',
+                                     labelnames=('camera',))
+FRAMES_CAPTURED = Counter('camera_frames_captured_total', 'Frames read from the camera.', labelnames=('camera',))
+CAMERA_READY = Gauge('camera_ready', 'Camera state: 1 if ready, 0 while initializing or failed.', labelnames=('camera',))
+CAMERA_OPEN_FAILURES = Counter('camera_open_failures_total', 'Failed attempts to open the device.',
+                               labelnames=('camera',))
+CAMERA_RECONNECTS = Counter('camera_reconnects_total', 'Recoveries of a failed camera.', labelnames=('camera',))
+CAMERA_FAULTS = Counter('camera_faults_total', 'Detected device faults (read, stall, frozen).',
+                        labelnames=('camera', 'reason'))
+CAMERA_BRIGHTNESS = Gauge('camera_brightness', 'Mean luminance (0-255) of the last analyzed frame.',
+                          labelnames=('camera',))
+CAMERA_SHARPNESS = Gauge('camera_sharpness', 'Laplacian variance sharpness of the last analyzed frame.',
+                         labelnames=('camera',))
+QUALITY_ANALYSIS_SECONDS = Histogram('quality_analysis_seconds', 'Time to analyze brightness, sharpness and histogram.')
+FRAME_BUFFER_ALLOCATIONS = Counter('frame_buffer_allocations_total',
+                                   'Capture reads that could not reuse a ring buffer.', labelnames=('camera',))
+
+# Encoding and storage ('stream' variants or stored 'snapshot's)
+JPEG_ENCODE_SECONDS = Histogram('jpeg_encode_seconds', 'Duration of JPEG encoding (including resize).',
+                                labelnames=('kind',))
+JPEG_ENCODE_BYTES = Histogram('jpeg_encode_bytes', 'Size of encoded JPEG frames.', SIZE_BUCKETS,
+                              labelnames=('kind',))
+JPEG_DECODE_SECONDS = Histogram('jpeg_decode_seconds', 'Duration of decoding passthrough frames to pixels.')
+JPEG_PASSTHROUGH = Counter('jpeg_passthrough_total', 'Frames forwarded as the camera\'s own JPEG without re-encoding.',
+                           labelnames=('kind',))
+SNAPSHOT_WRITE_SECONDS = Histogram('snapshot_write_seconds', 'Duration of one atomic snapshot file write.')
+SNAPSHOT_WRITE_BYTES = Histogram('snapshot_write_bytes', 'Size of snapshot files written.', SIZE_BUCKETS)
+SNAPSHOTS_DROPPED = Counter('snapshot_writer_dropped_total', 'Snapshots dropped because the writer queue was full.')
+THUMBNAIL_REQUESTS = Counter('thumbnail_cache_requests_total', 'Thumbnail lookups by cache result (hit or miss).',
+                             labelnames=('result',))
+THUMBNAIL_GENERATE_SECONDS = Histogram('thumbnail_generate_seconds',
+                                       'Time to decode a snapshot and encode its thumbnails.')
+RECORDING_FRAMES = Counter('recording_frames_total', 'Frames written to recording segments.',
+                           labelnames=('camera',))
+RECORDING_FRAMES_DROPPED = Counter('recording_frames_dropped_total',
+                                   'Frames dropped because the recording queue was full.', labelnames=('camera',))
+
+ENCODER_QUEUE_DEPTH = Gauge('encoder_queue_depth', 'Frames waiting for an encoder pool thread.',
+                            labelnames=('camera',))
+ENCODER_FRAMES_DROPPED = Counter('encoder_frames_dropped_total', 'Frames skipped because the encoder queue was full.',
+                                 labelnames=('camera',))
+
+# Streaming
+STREAM_CLIENTS = Gauge('stream_clients', 'Active /video_feed clients.', labelnames=('camera',))
+STREAM_FRAMES_DROPPED = Counter('stream_frames_dropped_total', 'Frames skipped by slow stream clients.',
+                                labelnames=('camera',))
+
+# HTTP
+HTTP_REQUEST_SECONDS = Histogram('http_request_duration_seconds',
+                                 'Time to produce the response (stream start for /video_feed).',
+                                 labelnames=('endpoint', 'method', 'status'))
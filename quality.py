@@ -0,0 +1,141 @@
+"""
+Image quality analytics: brightness, sharpness and a compact histogram.
+
+Frames are analyzed on a small grayscale copy (QUALITY_FRAME_WIDTH wide,
+nearest-neighbour subsampled), so one analysis takes a fraction of a
+millisecond and can run for every captured frame. Values are therefore
+relative to that scale: sharpness is the variance of the Laplacian of the
+small image, which drops sharply for out-of-focus or motion-blurred
+frames; brightness is the mean gray level (0-255).
+"""
+import cv2
+from typing import List, Optional
+import numpy as np
+import config
+from frame_source import jpeg_dimensions, reduced_decode_flag
+
+
+class FrameQuality:
+    """Quality measurements of one frame."""
+    
+    __slots__ = ('brightness', 'sharpness', 'histogram')
+    
+    def __init__(self, brightness: float, sharpness: float, histogram: List[float]):
+        """
+        Args:
+            brightness: Mean luminance (0-255)
+            sharpness: Variance of the Laplacian of the downscaled frame
+            histogram: Fraction of pixels per luminance bin (QUALITY_HISTOGRAM_BINS bins)
+        """
+        self.brightness = brightness
+        self.sharpness = sharpness
+        self.histogram = histogram
+    
+    def meets(self, min_brightness: Optional[float] = None, min_sharpness: Optional[float] = None) -> bool:
+        """
+        Check the frame against quality thresholds.
+        
+        Args:
+            min_brightness: Minimum mean luminance (None = no limit)
+            min_sharpness: Minimum sharpness (None = no limit)
+        
+        Returns:
+            True if all given thresholds are met
+        """
+        return ((min_brightness is None or self.brightness >= min_brightness)
+                and (min_sharpness is None or self.sharpness >= min_sharpness))
+    
+    def to_dict(self) -> dict:
+        """JSON-friendly representation."""
+        return {
+            "brightness": round(self.brightness, 1),
+            "sharpness": round(self.sharpness, 1),
+            "histogram": [round(value, 4) for value in self.histogram]
+        }
+
+
+def luminance(image: np.ndarray, width: int = config.QUALITY_FRAME_WIDTH) -> np.ndarray:
+    """
+    Downscaled grayscale copy of a frame.
+    
+    Args:
+        image: BGR or grayscale frame
+        width: Output width (frames narrower than this are only converted)
+    
+    Returns:
+        Grayscale image as uint8 numpy array
+    """
+    height, source_width = image.shape[:2]
+    if source_width > width:
+        size = (width, max(1, round(height * width / source_width)))
+        # Nearest neighbour only picks pixels; area averaging would cost more than the analysis
+        image = cv2.resize(image, size, interpolation=cv2.INTER_NEAREST)
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return image
+
+
+def analyze_gray(gray: np.ndarray) -> FrameQuality:
+    """
+    Measure an already downscaled grayscale frame.
+    
+    Args:
+        gray: Grayscale image as uint8 numpy array
+    
+    Returns:
+        FrameQuality of the image
+    """
+    bins = config.QUALITY_HISTOGRAM_BINS
+    _, stddev = cv2.meanStdDev(cv2.Laplacian(gray, cv2.CV_32F))
+    histogram = cv2.calcHist([gray], [0], None, [bins], [0, 256]).ravel() / gray.size
+    return FrameQuality(float(gray.mean()), float(stddev[0, 0]) ** 2, histogram.tolist())
+
+
+def analyze(image: np.ndarray) -> FrameQuality:
+    """
+    Measure brightness, sharpness and histogram of a frame.
+    
+    Args:
+        image: BGR frame as numpy array
+    
+    Returns:
+        FrameQuality of the frame
+    """
+    return analyze_gray(luminance(image))
+
+
+def jpeg_luminance(jpeg, width: int = config.QUALITY_FRAME_WIDTH) -> Optional[np.ndarray]:
+    """
+    Downscaled grayscale copy of a JPEG image. The decoder downscales by
+    2, 4 or 8 while the result is still at least width pixels wide, which
+    is much cheaper than a full decode.
+    
+    Args:
+        jpeg: JPEG data
+        width: Output width
+    
+    Returns:
+        Grayscale image as uint8 numpy array, or None if the data cannot be decoded
+    """
+    size = jpeg_dimensions(jpeg)
+    flag = reduced_decode_flag(size[0] if size else None, width, grayscale=True)
+    gray = cv2.imdecode(np.frombuffer(jpeg, np.uint8), flag)
+    if gray is None:
+        return None
+    return luminance(gray, width)
+
+
+def analyze_jpeg(jpeg) -> Optional[FrameQuality]:
+    """
+    Measure a JPEG image without a full-size decode.
+    
+    Args:
+        jpeg: JPEG data
+    
+    Returns:
+        FrameQuality, or None if the data cannot be decoded
+    """
+    gray = jpeg_luminance(jpeg)
+    if gray is None:
+        return None
+    return analyze_gray(gray)
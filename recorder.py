@@ -0,0 +1,418 @@
+"""
+Continuous recording of the live stream into rolling segment files.
+
+Frames come from the shared capture session (the same JPEGs the stream
+clients get, so passthrough cameras are recorded without re-encoding)
+and are written as Motion JPEG AVI segments aligned to
+RECORDING_SEGMENT_SECONDS of wall-clock time. Each finished segment has a
+JSON index next to it with the capture time, byte offset and size of
+every frame, so a client can fetch a single frame or a time window of a
+segment with an HTTP Range request.
+
+A reader thread takes frames from the capture worker and a writer thread
+writes them; between them is a bounded queue that drops the oldest
+frames when the disk falls behind, so recording never slows down capture
+or streaming. Segments are indexed in the snapshot history database and
+the oldest are deleted when RECORDING_MAX_BYTES is exceeded.
+"""
+import os
+import glob
+import json
+import logging
+import struct
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import List, Optional
+import config
+import metrics
+from history import SnapshotHistory
+
+logger = logging.getLogger(__name__)
+
+# Offset of the 'movi' fourcc; idx1 offsets are relative to it
+MOVI_OFFSET = 220
+HEADER_SIZE = MOVI_OFFSET + 4
+AVIF_HASINDEX = 0x10
+AVIIF_KEYFRAME = 0x10
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+class SegmentFile:
+    """
+    Motion JPEG AVI file written frame by frame. The header is written
+    with placeholder sizes and rewritten on close, when the frame count
+    and the actual frame rate are known.
+    """
+    
+    def __init__(self, path: str, started_at: float, width: int, height: int):
+        """
+        Create the file (as path + '.part' until it is closed).
+        
+        Args:
+            path: Final path of the segment
+            started_at: Segment start time (UNIX timestamp)
+            width: Frame width
+            height: Frame height
+        """
+        self.path = path
+        self.started_at = started_at
+        self.width = width
+        self.height = height
+        self.frames: List[list] = []  # [captured_at, offset, size] per frame
+        self.size = HEADER_SIZE
+        self._max_frame = 0
+        self._file = open(path + '.part', 'wb', buffering=WRITE_BUFFER_SIZE)
+        self._file.write(self._header(config.RECORDING_FPS))
+    
+    def write(self, jpeg, captured_at: float):
+        """
+        Append one JPEG frame.
+        
+        Args:
+            jpeg: JPEG data (bytes or memoryview)
+            captured_at: Capture time of the frame
+        """
+        length = len(jpeg)
+        self._file.write(b'00dc' + struct.pack('<I', length))
+        self._file.write(jpeg)
+        if length % 2:
+            self._file.write(b'\0')
+        self.frames.append([round(captured_at, 3), self.size + 8, length])
+        self.size += 8 + length + length % 2
+        self._max_frame = max(self._max_frame, length)
+    
+    def close(self) -> float:
+        """
+        Write the index, fix up the header and move the file into place.
+        
+        Returns:
+            Capture time of the last frame
+        """
+        ended_at = self.frames[-1][0] if self.frames else self.started_at
+        duration = ended_at - self.frames[0][0] if self.frames else 0.0
+        fps = (len(self.frames) - 1) / duration if duration > 0 else config.RECORDING_FPS
+        
+        index = bytearray()
+        for _, offset, length in self.frames:
+            index += b'00dc' + struct.pack('<III', AVIIF_KEYFRAME, offset - 8 - MOVI_OFFSET, length)
+        self._file.write(b'idx1' + struct.pack('<I', len(index)))
+        self._file.write(index)
+        total = self.size + 8 + len(index)
+        
+        self._file.seek(0)
+        self._file.write(self._header(fps, total))
+        self._file.close()
+        os.replace(self.path + '.part', self.path)
+        self.size = total
+        return ended_at
+    
+    def abort(self):
+        """Close and delete an unfinished segment."""
+        try:
+            self._file.close()
+        except OSError:
+            pass
+        try:
+            os.remove(self.path + '.part')
+        except OSError:
+            pass
+    
+    def _header(self, fps: float, total: int = 0) -> bytes:
+        """RIFF, hdrl and movi list headers (HEADER_SIZE bytes)."""
+        count = len(self.frames)
+        scale, rate = 1000, max(1, round(fps * 1000))
+        avih = struct.pack('<10I16x', round(1000000 / fps) if fps > 0 else 0, round(self._max_frame * fps), 0,
+                           AVIF_HASINDEX, count, 0, 1, self._max_frame, self.width, self.height)
+        strh = struct.pack('<4s4sIHHIIIIIIiI4h', b'vids', b'MJPG', 0, 0, 0, 0, scale, rate, 0, count,
+                           self._max_frame, -1, 0, 0, 0, self.width, self.height)
+        strf = struct.pack('<IiiHH4sIiiII', 40, self.width, self.height, 1, 24, b'MJPG',
+                           self.width * self.height * 3, 0, 0, 0, 0)
+        strl = (b'strh' + struct.pack('<I', len(strh)) + strh
+                + b'strf' + struct.pack('<I', len(strf)) + strf)
+        hdrl = (b'avih' + struct.pack('<I', len(avih)) + avih
+                + b'LIST' + struct.pack('<I', 4 + len(strl)) + b'strl' + strl)
+        movi_size = self.size - MOVI_OFFSET
+        return (b'RIFF' + struct.pack('<I', max(0, total - 8)) + b'AVI '
+                + b'LIST' + struct.pack('<I', 4 + len(hdrl)) + b'hdrl' + hdrl
+                + b'LIST' + struct.pack('<I', movi_size) + b'movi')
+
+
+def segment_start(timestamp: float, length: float = config.RECORDING_SEGMENT_SECONDS) -> float:
+    """
+    Start of the wall-clock segment a timestamp falls into.
+    
+    Args:
+        timestamp: UNIX timestamp
+        length: Segment length in seconds
+    
+    Returns:
+        Segment start (UNIX timestamp, a multiple of length)
+    """
+    return timestamp - timestamp % length
+
+
+def index_path(path: str) -> str:
+    """Path of the frame index of a segment."""
+    return path + '.json'
+
+
+class SegmentRecorder:
+    """
+    Records one camera's live stream into rolling segments on background
+    threads. The capture session is pinned while recording.
+    """
+    
+    def __init__(self, history: SnapshotHistory, output_dir: str, name: str = 'default'):
+        """
+        Initialize segment recorder.
+        
+        Args:
+            history: Snapshot history of the camera (indexes the segments)
+            output_dir: Directory for segment files
+            name: Camera name used for thread names and metrics
+        """
+        self.history = history
+        self.output_dir = output_dir
+        self.name = name
+        self._condition = threading.Condition()
+        self._queue = deque()
+        self._worker = None
+        self._threads: List[threading.Thread] = []
+        self._stopped = True
+        self._segment: Optional[SegmentFile] = None
+        
+        self._frames_written = 0
+        self._frames_dropped = 0
+        self._segments_written = 0
+        self._segments_deleted = 0
+        self._write_errors = 0
+        
+        self._recorded = metrics.RECORDING_FRAMES.labels(name)
+        self._dropped = metrics.RECORDING_FRAMES_DROPPED.labels(name)
+    
+    def path_for(self, row: dict) -> str:
+        """Absolute path of an indexed segment."""
+        return os.path.join(self.output_dir, row['filename'])
+    
+    def start(self, worker):
+        """
+        Start recording frames of a capture worker.
+        
+        Args:
+            worker: CaptureWorker providing live frames (kept open while recording)
+        """
+        with self._condition:
+            if not self._stopped:
+                return
+            self._stopped = False
+            self._worker = worker
+        
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._recover()
+        worker.pin()
+        self._threads = [
+            threading.Thread(target=self._read, name=f"recorder-read-{self.name}", daemon=True),
+            threading.Thread(target=self._write, name=f"recorder-write-{self.name}", daemon=True)
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Recording camera '{self.name}' to {self.output_dir}")
+    
+    def stop(self, timeout: float = 5.0):
+        """Stop recording; queued frames are written and the open segment is finished."""
+        with self._condition:
+            if self._stopped:
+                return
+            self._stopped = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+        self._worker.unpin()
+    
+    def is_running(self) -> bool:
+        """Return True while recording."""
+        with self._condition:
+            return not self._stopped
+    
+    def read_index(self, row: dict) -> Optional[dict]:
+        """
+        Load the frame index of a segment.
+        
+        Args:
+            row: Segment row from the history database
+        
+        Returns:
+            Index with a 'frames' list of [captured_at, offset, size], or
+            None if it is missing
+        """
+        try:
+            with open(index_path(self.path_for(row))) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def get_stats(self) -> dict:
+        """
+        Get recorder statistics.
+        
+        Returns:
+            Dictionary with the current segment, queue and counters
+        """
+        with self._condition:
+            segment = self._segment
+            return {
+                "running": not self._stopped,
+                "fps": config.RECORDING_FPS,
+                "segment_seconds": config.RECORDING_SEGMENT_SECONDS,
+                "max_bytes": config.RECORDING_MAX_BYTES,
+                "current_segment": os.path.basename(segment.path) if segment else None,
+                "queue_depth": len(self._queue),
+                "frames_written": self._frames_written,
+                "frames_dropped": self._frames_dropped,
+                "segments_written": self._segments_written,
+                "segments_deleted": self._segments_deleted,
+                "write_errors": self._write_errors
+            }
+    
+    def _recover(self):
+        """Delete segments left unfinished by a crash and forget segments removed from disk."""
+        for path in glob.glob(os.path.join(self.output_dir, '*.part')):
+            logger.warning(f"Removing unfinished recording segment {path}")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        for row in self.history.recordings():
+            if not os.path.exists(self.path_for(row)):
+                self.history.remove_recording(row['filename'])
+    
+    def _read(self):
+        """Take live frames from the capture worker at RECORDING_FPS and queue them."""
+        interval = 1.0 / config.RECORDING_FPS if config.RECORDING_FPS > 0 else 0.0
+        last_seq = -1
+        next_due = 0.0
+        
+        while True:
+            with self._condition:
+                if self._stopped:
+                    return
+            
+            frame = self._worker.wait_for_frame(last_seq, timeout=1.0)
+            if frame is None:
+                if not self._worker.is_running():
+                    # Camera failed; the supervisor restarts the pinned session
+                    with self._condition:
+                        self._condition.wait_for(lambda: self._stopped, 0.5)
+                continue
+            last_seq = frame.seq
+            if frame.placeholder or frame.captured_at < next_due:
+                continue
+            # Keep the average rate, but do not burst after a gap
+            next_due = max(next_due + interval, frame.captured_at)
+            
+            # Same variant as full-size stream clients, so it is encoded once (or not at all)
+            jpeg = frame.jpeg(None, config.STREAM_JPEG_QUALITY)
+            if jpeg is None:
+                continue
+            
+            with self._condition:
+                if len(self._queue) >= config.RECORDING_QUEUE_SIZE:
+                    self._queue.popleft()
+                    self._frames_dropped += 1
+                    self._dropped.inc()
+                self._queue.append((frame.captured_at, jpeg, frame.width, frame.height))
+                self._condition.notify_all()
+    
+    def _write(self):
+        """Write queued frames, rotating segments at wall-clock boundaries."""
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._queue or self._stopped, 1.0)
+                item = self._queue.popleft() if self._queue else None
+                stopped = self._stopped
+            
+            if item is None:
+                segment = self._segment
+                # Finish the segment when frames stop arriving (camera failed or stopped)
+                if segment is not None and (stopped or time.time() >= segment.started_at
+                                            + config.RECORDING_SEGMENT_SECONDS + 2.0):
+                    self._finish()
+                if stopped:
+                    return
+                continue
+            
+            captured_at, jpeg, width, height = item
+            segment = self._segment
+            if segment is not None and (captured_at >= segment.started_at + config.RECORDING_SEGMENT_SECONDS
+                                        or (width, height) != (segment.width, segment.height)):
+                self._finish()
+                segment = None
+            
+            try:
+                if segment is None:
+                    started_at = segment_start(captured_at)
+                    timestamp = datetime.fromtimestamp(captured_at).strftime(config.TIMESTAMP_FORMAT)
+                    segment = SegmentFile(os.path.join(self.output_dir, f"segment_{timestamp}.avi"),
+                                          started_at, width, height)
+                    with self._condition:
+                        self._segment = segment
+                segment.write(jpeg, captured_at)
+                self._frames_written += 1
+                self._recorded.inc()
+            except OSError as e:
+                logger.error(f"Error writing recording segment: {e}")
+                self._write_errors += 1
+                if segment is not None:
+                    segment.abort()
+                with self._condition:
+                    self._segment = None
+    
+    def _finish(self):
+        """Close the current segment, index it and enforce the disk budget."""
+        segment = self._segment
+        with self._condition:
+            self._segment = None
+        if not segment.frames:
+            segment.abort()
+            return
+        try:
+            ended_at = segment.close()
+            with open(index_path(segment.path), 'w') as f:
+                json.dump({"started_at": segment.frames[0][0], "ended_at": ended_at,
+                           "width": segment.width, "height": segment.height,
+                           "frames": segment.frames}, f, separators=(',', ':'))
+        except OSError as e:
+            logger.error(f"Error finishing recording segment {segment.path}: {e}")
+            self._write_errors += 1
+            segment.abort()
+            return
+        
+        self.history.add_recording(os.path.basename(segment.path), segment.frames[0][0], ended_at,
+                                   len(segment.frames), segment.size, segment.width, segment.height)
+        self._segments_written += 1
+        logger.info(f"Recording segment written: {segment.path} ({len(segment.frames)} frames)")
+        self._enforce_budget()
+    
+    def _enforce_budget(self):
+        """Delete the oldest segments while the total size exceeds RECORDING_MAX_BYTES."""
+        if config.RECORDING_MAX_BYTES is None:
+            return
+        rows = self.history.recordings()
+        total = sum(row['size'] for row in rows)
+        # The newest segment is always kept
+        for row in rows[:-1]:
+            if total <= config.RECORDING_MAX_BYTES:
+                break
+            path = self.path_for(row)
+            for victim in (path, index_path(path)):
+                try:
+                    os.remove(victim)
+                except OSError:
+                    pass
+            self.history.remove_recording(row['filename'])
+            total -= row['size']
+            self._segments_deleted += 1
+            logger.info(f"Recording retention: removed {path}")
@@ -0,0 +1,107 @@
+"""
+Periodic snapshot capture for the camera server.
+"""
+import logging
+import threading
+import time
+from typing import Callable, Optional, Tuple
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class CaptureScheduler:
+    """
+    Captures a timestamped snapshot every CAPTURE_INTERVAL_SECONDS.
+    Frames come from the shared capture session, which the scheduler pins
+    while it runs: the interval is usually longer than
+    CAMERA_IDLE_TIMEOUT_SECONDS, and an unpinned session would release
+    the device before every capture and reopen and warm it up again.
+    Retention is enforced by the snapshot writer's index after every
+    stored image.
+    """
+    
+    def __init__(self, capture: Callable[[], Tuple[bool, Optional[str]]],
+                 interval: float = config.CAPTURE_INTERVAL_SECONDS):
+        """
+        Initialize capture scheduler.
+        
+        Args:
+            capture: Function that captures and stores one snapshot
+            interval: Seconds between captures
+        """
+        self.capture = capture
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._worker = None
+        self._captures = 0
+        self._failures = 0
+        self._last_capture: Optional[float] = None
+    
+    def start(self, worker=None):
+        """
+        Start the scheduler thread.
+        
+        Args:
+            worker: CaptureWorker the captures take frames from, kept open
+                    while the scheduler runs (None = not pinned)
+        """
+        if self._thread is not None:
+            return
+        if worker is not None:
+            worker.pin()
+            self._worker = worker
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="capture-scheduler", daemon=True)
+        self._thread.start()
+        logger.info(f"Capture scheduler started (every {self.interval}s)")
+    
+    def stop(self):
+        """Stop the scheduler thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+            self._thread = None
+        if self._worker is not None:
+            self._worker.unpin()
+            self._worker = None
+    
+    def get_stats(self) -> dict:
+        """
+        Get scheduler state.
+        
+        Returns:
+            Dictionary with interval and capture counters
+        """
+        return {
+            "running": self._thread is not None,
+            "interval_seconds": self.interval,
+            "captures": self._captures,
+            "failures": self._failures,
+            "last_capture": self._last_capture
+        }
+    
+    def _run(self):
+        """Capture on a fixed schedule that does not drift with capture time."""
+        next_run = time.monotonic() + self.interval
+        
+        while not self._stop.wait(max(0.0, next_run - time.monotonic())):
+            try:
+                success, _ = self.capture()
+            except Exception as e:
+                logger.error(f"Scheduled capture failed: {e}")
+                success = False
+            
+            if success:
+                self._captures += 1
+                self._last_capture = time.time()
+            else:
+                self._failures += 1
+                logger.warning("Scheduled capture failed")
+            
+            # Skip missed slots instead of capturing in a burst
+            next_run += self.interval
+            now = time.monotonic()
+            if next_run < now:
+                next_run = now + self.interval
@@ -0,0 +1,501 @@
+"""
+Snapshot persistence for the camera server.
+Encoding and disk writes run on a background writer thread, so slow
+SD cards never block the capture path or other camera users.
+"""
+import cv2
+import os
+import glob
+import hashlib
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Callable, List, Optional
+import config
+import metrics
+from frame_source import jpeg_dimensions
+from quality import FrameQuality, analyze, analyze_jpeg
+
+logger = logging.getLogger(__name__)
+
+
+class WriteJob:
+    """A frame queued for encoding and persistence."""
+    
+    def __init__(self, frame, save_with_timestamp: bool, captured_at: float,
+                 jpeg: Optional[bytes] = None, image_quality: Optional[FrameQuality] = None,
+                 on_written: Optional[Callable[["WriteJob"], None]] = None):
+        """
+        Args:
+            frame: BGR frame as numpy array (owned by the job), or None if jpeg is given
+            save_with_timestamp: Also write a timestamped copy
+            captured_at: Capture time as UNIX timestamp
+            jpeg: Already encoded JPEG to store as is
+            image_quality: Quality of the frame if already analyzed
+            on_written: Called with the job on the writer thread once it is done
+        """
+        self.frame = frame
+        self.on_written = on_written
+        self.captured_at = captured_at
+        self.timestamped_name = None
+        if save_with_timestamp:
+            timestamp = datetime.fromtimestamp(captured_at).strftime(config.TIMESTAMP_FORMAT)
+            self.timestamped_name = f"snapshot_{timestamp}.jpg"
+        self.jpeg: Optional[bytes] = jpeg
+        self.image_quality = image_quality
+        self.width: Optional[int] = None
+        self.height: Optional[int] = None
+        self.success = False
+        self.encoded = threading.Event()
+        self.written = threading.Event()
+    
+    def _finish(self, success: bool):
+        """Mark the job as done and wake up waiters."""
+        self.success = success
+        self.frame = None
+        self.encoded.set()
+        self.written.set()
+
+
+def atomic_write(path: str, data: bytes):
+    """
+    Write a file so readers never see a partially written image.
+    Data goes to a temporary file in the same directory which is then
+    renamed over the target.
+    
+    Args:
+        path: Target file path
+        data: File contents
+    """
+    directory, name = os.path.split(path)
+    tmp_path = os.path.join(directory, f".{name}.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class StoredImage:
+    """A timestamped snapshot file tracked by the snapshot indexes."""
+    
+    __slots__ = ('path', 'size', 'captured_at', 'width', 'height', 'content_hash', 'image_quality')
+    
+    def __init__(self, path: str, size: int, captured_at: float,
+                 width: Optional[int] = None, height: Optional[int] = None,
+                 content_hash: Optional[str] = None, image_quality: Optional[FrameQuality] = None):
+        self.path = path
+        self.size = size
+        self.captured_at = captured_at
+        self.width = width
+        self.height = height
+        self.content_hash = content_hash
+        self.image_quality = image_quality
+
+
+def content_hash(data: bytes) -> str:
+    """Hash used to identify snapshot contents (also used as HTTP ETag)."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def list_stored_images(images_dir: Optional[str] = None) -> List[StoredImage]:
+    """
+    List timestamped snapshots in the images directory, oldest first.
+    
+    Args:
+        images_dir: Directory to scan (default: IMAGES_DIR)
+    
+    Returns:
+        List of StoredImage with path, size and modification time
+    """
+    pattern = os.path.join(images_dir or config.IMAGES_DIR, 'snapshot_*.jpg')
+    images = []
+    for path in glob.glob(pattern):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        images.append(StoredImage(path, stat.st_size, stat.st_mtime))
+    
+    # Timestamped names sort chronologically
+    images.sort(key=lambda image: os.path.basename(image.path))
+    return images
+
+
+class RetentionIndex:
+    """
+    In-memory index of stored timestamped snapshots, oldest first.
+    
+    The directory is listed once on first use; afterwards the index is
+    kept up to date by the writer, so enforcing retention never re-lists
+    a directory that may hold tens of thousands of files. The first load
+    can take a while (the history indexes unknown files), so it runs
+    without the index lock and get_stats() does not wait for it.
+    """
+    
+    def __init__(self, max_images: Optional[int] = config.MAX_STORED_IMAGES,
+                 max_bytes: Optional[int] = config.MAX_STORED_BYTES,
+                 max_age_seconds: Optional[float] = config.MAX_IMAGE_AGE_SECONDS,
+                 loader: Callable[[], List[StoredImage]] = list_stored_images,
+                 on_removed: Optional[Callable[[str], None]] = None):
+        """
+        Initialize retention index.
+        
+        Args:
+            max_images: Maximum number of stored snapshots (None = unlimited)
+            max_bytes: Maximum total size of stored snapshots (None = unlimited)
+            max_age_seconds: Maximum snapshot age (None = unlimited)
+            loader: Returns the stored snapshots, oldest first, on first use
+            on_removed: Called with the path of every deleted snapshot
+        """
+        self.max_images = max_images
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.loader = loader
+        self.on_removed = on_removed
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._images = deque()
+        self._total_bytes = 0
+        self._loaded = False
+        self._pruned = 0
+    
+    def _ensure_loaded(self):
+        """Load the stored snapshots once. Caller does not hold the lock."""
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            images = self.loader()
+            with self._lock:
+                self._images.extend(images)
+                self._total_bytes += sum(image.size for image in images)
+                self._loaded = True
+        logger.info(f"Retention index loaded: {len(images)} stored snapshots")
+    
+    def add(self, image: StoredImage):
+        """
+        Register a newly written snapshot and enforce retention.
+        
+        Args:
+            image: Stored snapshot
+        """
+        self._ensure_loaded()
+        with self._lock:
+            # Same-second captures overwrite the same file
+            if self._images and self._images[-1].path == image.path:
+                self._total_bytes -= self._images[-1].size
+                self._images.pop()
+            
+            self._images.append(image)
+            self._total_bytes += image.size
+            self._prune()
+    
+    def prune(self) -> int:
+        """
+        Enforce retention limits.
+        
+        Returns:
+            Number of deleted snapshots
+        """
+        self._ensure_loaded()
+        with self._lock:
+            return self._prune()
+    
+    def _prune(self) -> int:
+        """Delete the oldest snapshots while over a limit. Caller holds the lock."""
+        removed = 0
+        oldest_allowed = None
+        if self.max_age_seconds is not None:
+            oldest_allowed = time.time() - self.max_age_seconds
+        
+        while self._images:
+            oldest = self._images[0]
+            over_count = self.max_images is not None and len(self._images) > self.max_images
+            over_bytes = self.max_bytes is not None and self._total_bytes > self.max_bytes
+            too_old = oldest_allowed is not None and oldest.captured_at < oldest_allowed
+            if not (over_count or over_bytes or too_old):
+                break
+            
+            self._images.popleft()
+            self._total_bytes -= oldest.size
+            try:
+                os.remove(oldest.path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"Failed to delete {oldest.path}: {e}")
+            if self.on_removed is not None:
+                self.on_removed(oldest.path)
+            removed += 1
+        
+        if removed:
+            self._pruned += removed
+            logger.info(f"Retention: deleted {removed} old snapshots")
+        return removed
+    
+    def get_stats(self) -> dict:
+        """
+        Get retention index state.
+        
+        Returns:
+            Dictionary with stored image count, total bytes and limits
+        """
+        with self._lock:
+            return {
+                "loaded": self._loaded,
+                "stored_images": len(self._images),
+                "stored_bytes": self._total_bytes,
+                "pruned": self._pruned,
+                "max_images": self.max_images,
+                "max_bytes": self.max_bytes,
+                "max_age_seconds": self.max_age_seconds
+            }
+
+
+class SnapshotWriter:
+    """
+    Background writer for snapshots.
+    
+    Each frame is encoded once and the same bytes are written to
+    snapshot.jpg and the timestamped file. When the queue backs up, pending
+    jobs are coalesced: snapshot.jpg is written only for the newest frame
+    and frames that would only have updated snapshot.jpg are skipped.
+    """
+    
+    def __init__(self, quality: int = 95, max_queue: int = config.WRITER_QUEUE_SIZE,
+                 on_encoded: Optional[Callable[[bytes, float], None]] = None,
+                 on_stored: Optional[Callable[[StoredImage, bytes], None]] = None,
+                 images_dir: Optional[str] = None):
+        """
+        Initialize snapshot writer.
+        
+        Args:
+            quality: JPEG quality for stored snapshots
+            max_queue: Maximum number of pending jobs; the oldest is dropped when full
+            on_encoded: Called with (jpeg, captured_at) for the newest encoded snapshot
+            on_stored: Called with a StoredImage and its JPEG bytes after a timestamped file is written
+            images_dir: Target directory (default: IMAGES_DIR)
+        """
+        self.images_dir = images_dir
+        self.quality = quality
+        self.max_queue = max_queue
+        self.on_encoded = on_encoded
+        self.on_stored = on_stored
+        self._condition = threading.Condition()
+        self._queue = deque()
+        self._busy = False
+        self._thread: Optional[threading.Thread] = None
+        
+        # Metrics
+        self._written = 0
+        self._coalesced = 0
+        self._dropped = 0
+        self._errors = 0
+        self._write_count = 0
+        self._write_total_ms = 0.0
+        self._write_last_ms = 0.0
+        self._write_max_ms = 0.0
+    
+    def submit(self, frame, save_with_timestamp: bool = True,
+               captured_at: Optional[float] = None, jpeg: Optional[bytes] = None,
+               image_quality: Optional[FrameQuality] = None,
+               on_written: Optional[Callable[[WriteJob], None]] = None) -> WriteJob:
+        """
+        Queue a frame for encoding and persistence.
+        
+        Args:
+            frame: BGR frame as numpy array; the writer takes ownership
+            save_with_timestamp: Also write a timestamped copy
+            captured_at: Capture time as UNIX timestamp (default: now)
+            jpeg: Already encoded JPEG (e.g. from an MJPEG camera); stored
+                  without re-encoding, frame may then be None
+            image_quality: Quality of the frame if already analyzed; otherwise
+                           timestamped snapshots are analyzed by the writer
+            on_written: Called with the job on the writer thread after its batch
+                        is written (job.success tells if it was stored), so slow
+                        follow-up work such as database inserts stays off the
+                        caller's thread. Not called for jobs dropped from a full queue.
+        
+        Returns:
+            WriteJob whose events signal encoding and write completion
+        """
+        job = WriteJob(frame, save_with_timestamp,
+                       time.time() if captured_at is None else captured_at, jpeg, image_quality, on_written)
+        
+        with self._condition:
+            if len(self._queue) >= self.max_queue:
+                dropped = self._queue.popleft()
+                dropped._finish(False)
+                self._dropped += 1
+                metrics.SNAPSHOTS_DROPPED.inc()
+                logger.warning("Snapshot writer queue full, dropped oldest frame")
+            self._queue.append(job)
+            
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="snapshot-writer", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        
+        return job
+    
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until all queued jobs are written.
+        
+        Args:
+            timeout: Maximum time to wait in seconds
+        
+        Returns:
+            True if the queue drained in time
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._queue and not self._busy, timeout
+            )
+    
+    def get_stats(self) -> dict:
+        """
+        Get writer metrics.
+        
+        Returns:
+            Dictionary with queue depth, counters and write latency in milliseconds
+        """
+        with self._condition:
+            count = self._write_count
+            return {
+                "queue_depth": len(self._queue),
+                "written": self._written,
+                "coalesced": self._coalesced,
+                "dropped": self._dropped,
+                "errors": self._errors,
+                "last_write_ms": round(self._write_last_ms, 2),
+                "avg_write_ms": round(self._write_total_ms / count, 2) if count else 0.0,
+                "max_write_ms": round(self._write_max_ms, 2)
+            }
+    
+    def _run(self):
+        """Writer loop: take everything queued and write it as one batch."""
+        while True:
+            with self._condition:
+                self._busy = False
+                self._condition.notify_all()
+                self._condition.wait_for(lambda: self._queue)
+                batch = list(self._queue)
+                self._queue.clear()
+                self._busy = True
+            
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                logger.error(f"Error in snapshot writer: {e}")
+                with self._condition:
+                    self._errors += 1
+                for job in batch:
+                    if not job.written.is_set():
+                        job._finish(False)
+            
+            for job in batch:
+                if job.on_written is not None:
+                    try:
+                        job.on_written(job)
+                    except Exception as e:
+                        logger.error(f"Error in snapshot write callback: {e}")
+    
+    def _store(self, path: str, data: bytes):
+        """Write one snapshot file and record its duration and size."""
+        start = time.perf_counter()
+        atomic_write(path, data)
+        metrics.SNAPSHOT_WRITE_SECONDS.observe(time.perf_counter() - start)
+        metrics.SNAPSHOT_WRITE_BYTES.observe(len(data))
+    
+    def _write_batch(self, batch):
+        """Encode and write a batch of jobs, coalescing redundant writes."""
+        newest = batch[-1]
+        
+        # Only the newest frame and frames with their own file need encoding;
+        # for the same timestamped name the later frame wins
+        needed = {}
+        for job in batch:
+            if job.timestamped_name is not None:
+                needed[job.timestamped_name] = job
+        keep = set(id(job) for job in needed.values())
+        keep.add(id(newest))
+        
+        skipped = [job for job in batch if id(job) not in keep]
+        jobs = [job for job in batch if id(job) in keep]
+        if skipped:
+            with self._condition:
+                self._coalesced += len(skipped)
+            logger.debug(f"Coalesced {len(skipped)} snapshot writes")
+        
+        params = [cv2.IMWRITE_JPEG_QUALITY, self.quality]
+        for job in jobs:
+            # Stored snapshots carry their quality into the history index
+            if job.timestamped_name is not None and job.image_quality is None:
+                try:
+                    job.image_quality = analyze(job.frame) if job.frame is not None else analyze_jpeg(job.jpeg)
+                except Exception as e:
+                    logger.warning(f"Failed to analyze snapshot quality: {e}")
+            if job.jpeg is not None:
+                job.width, job.height = jpeg_dimensions(job.jpeg) or (None, None)
+                metrics.JPEG_PASSTHROUGH.labels('snapshot').inc()
+                continue
+            encode_start = time.perf_counter()
+            ret, buffer = cv2.imencode('.jpg', job.frame, params)
+            if not ret:
+                logger.error("Failed to encode snapshot")
+                job._finish(False)
+                continue
+            job.jpeg = buffer.tobytes()
+            metrics.JPEG_ENCODE_SECONDS.labels('snapshot').observe(time.perf_counter() - encode_start)
+            metrics.JPEG_ENCODE_BYTES.labels('snapshot').observe(len(job.jpeg))
+            job.height, job.width = job.frame.shape[:2]
+            job.frame = None
+        
+        # Publish the newest image first so readers see it before the disk write
+        if newest.jpeg is not None and self.on_encoded is not None:
+            self.on_encoded(newest.jpeg, newest.captured_at)
+        for job in batch:
+            job.encoded.set()
+        
+        start = time.monotonic()
+        images_dir = self.images_dir or config.IMAGES_DIR
+        os.makedirs(images_dir, exist_ok=True)
+        
+        if newest.jpeg is not None:
+            latest_path = os.path.join(images_dir, config.LATEST_IMAGE_NAME)
+            self._store(latest_path, newest.jpeg)
+            logger.info(f"Latest snapshot saved: {latest_path}")
+        
+        written = 0
+        for job in jobs:
+            if job.jpeg is None:
+                continue
+            if job.timestamped_name is not None:
+                timestamped_path = os.path.join(images_dir, job.timestamped_name)
+                self._store(timestamped_path, job.jpeg)
+                logger.info(f"Timestamped snapshot saved: {timestamped_path}")
+                if self.on_stored is not None:
+                    self.on_stored(StoredImage(
+                        timestamped_path, len(job.jpeg), job.captured_at,
+                        job.width, job.height, content_hash(job.jpeg), job.image_quality
+                    ), job.jpeg)
+                written += 1
+        
+        elapsed_ms = (time.monotonic() - start) * 1000
+        with self._condition:
+            self._written += written + (newest.jpeg is not None)
+            self._write_count += 1
+            self._write_total_ms += elapsed_ms
+            self._write_last_ms = elapsed_ms
+            self._write_max_ms = max(self._write_max_ms, elapsed_ms)
+        
+        for job in jobs:
+            if not job.written.is_set():
+                job.jpeg = None
+                job._finish(True)
+        # Coalesced jobs are represented by the newest snapshot
+        for job in skipped:
+            job._finish(newest.success)
@@ -0,0 +1,275 @@
+"""
+Background camera startup, health monitoring and device recovery.
+"""
+import logging
+import threading
+import time
+from typing import Dict, Optional
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+INITIALIZING = 'initializing'
+READY = 'ready'
+FAILED = 'failed'
+
+
+class CameraSupervisor:
+    """
+    Brings a camera up in the background, so the web server can accept
+    requests while the device is still opening (or missing), and brings
+    it back after a fault.
+    
+    The first probe opens the shared capture session and takes the
+    initial snapshot from it. Faults are reported by the capture worker
+    (failed open, failed read, frozen image) or detected here (a read
+    blocked for CAMERA_STALL_SECONDS). The camera is then marked failed
+    and only the supervisor touches the device: it retries with
+    exponential backoff, while captures fail fast and stream clients get
+    placeholder frames at CAMERA_PLACEHOLDER_FPS. After recovery, pinned
+    sessions (e.g. motion detection) are restarted.
+    """
+    
+    def __init__(self, camera, initial_delay: float = config.CAMERA_RECONNECT_INITIAL_SECONDS,
+                 max_delay: float = config.CAMERA_RECONNECT_MAX_SECONDS):
+        """
+        Initialize camera supervisor.
+        
+        Args:
+            camera: Camera bundle to supervise
+            initial_delay: Seconds before the first retry
+            max_delay: Upper bound of the retry delay
+        """
+        self.camera = camera
+        self.name = camera.name
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+        self._state = INITIALIZING
+        self._since = time.time()
+        self._probing = False
+        self._attempts = 0  # consecutive failed probes
+        self._next_attempt: Optional[float] = None
+        self._failed_probes = 0
+        self._faults: Dict[str, int] = {}
+        self._recoveries = 0
+        self._last_fault: Optional[str] = None
+        self._last_failure: Optional[float] = None
+        
+        self._ready = metrics.CAMERA_READY.labels(self.name)
+        self._open_failures = metrics.CAMERA_OPEN_FAILURES.labels(self.name)
+        self._reconnects = metrics.CAMERA_RECONNECTS.labels(self.name)
+    
+    @property
+    def state(self) -> str:
+        """Current camera state: initializing, ready or failed."""
+        with self._condition:
+            return self._state
+    
+    def start(self):
+        """Start probing the camera in the background."""
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name=f"camera-supervisor-{self.name}",
+                                            daemon=True)
+            self._thread.start()
+    
+    def stop(self):
+        """Stop the supervisor thread."""
+        with self._condition:
+            self._stopped = True
+            thread, self._thread = self._thread, None
+            self._condition.notify_all()
+        if thread is not None:
+            thread.join(timeout=5.0)
+    
+    def allow_open(self) -> bool:
+        """
+        Check if the capture worker may open the device. While the camera
+        is failed, only the supervisor's own probes open it.
+        
+        Returns:
+            True if opening the device is allowed
+        """
+        with self._condition:
+            return self._thread is None or self._state != FAILED or self._probing
+    
+    def report_failure(self, reason: str) -> bool:
+        """
+        Record a device fault and start recovering the camera.
+        
+        Args:
+            reason: 'open', 'read', 'frozen' or 'stall'
+        
+        Returns:
+            True if the supervisor recovers the device, False if it is not
+            running and the caller has to handle the fault itself
+        """
+        if reason == 'open':
+            self._open_failures.inc()
+        else:
+            metrics.CAMERA_FAULTS.labels(self.name, reason).inc()
+        
+        with self._condition:
+            self._faults[reason] = self._faults.get(reason, 0) + 1
+            self._last_fault = reason
+            self._last_failure = time.time()
+            if self._thread is None:
+                return False
+            # During a probe the failure is handled as a failed probe
+            if self._probing or self._state == FAILED:
+                return True
+            self._attempts = 1
+            self._next_attempt = time.monotonic() + self.initial_delay
+            self._set_state(FAILED)
+            self._condition.notify_all()
+        logger.warning(f"Camera '{self.name}' failed ({reason}), recovering in the background")
+        return True
+    
+    def get_stats(self) -> dict:
+        """
+        Get supervisor state.
+        
+        Returns:
+            Dictionary with the camera state, fault and recovery counters
+        """
+        with self._condition:
+            next_attempt = None
+            if self._state == FAILED and self._next_attempt is not None:
+                next_attempt = round(max(0.0, self._next_attempt - time.monotonic()), 1)
+            return {
+                "state": self._state,
+                "since": self._since,
+                "consecutive_failures": self._attempts,
+                "next_attempt_in": next_attempt,
+                "failed_probes": self._failed_probes,
+                "faults": dict(self._faults),
+                "last_fault": self._last_fault,
+                "last_failure": self._last_failure,
+                "recoveries": self._recoveries
+            }
+    
+    def _set_state(self, state: str):
+        """Change the state. Caller holds the condition."""
+        if state != self._state:
+            self._state = state
+            self._since = time.time()
+            self._ready.set(1 if state == READY else 0)
+    
+    def _probe(self) -> bool:
+        """Open the shared capture session and wait for a frame."""
+        with self._condition:
+            self._probing = True
+        try:
+            return self.camera.worker.capture_frame() is not None
+        except Exception as e:
+            logger.error(f"Error probing camera '{self.name}': {e}")
+            return False
+        finally:
+            with self._condition:
+                self._probing = False
+    
+    def _wait_failed(self, delay: float) -> bool:
+        """
+        Wait before the next probe. While the camera is failed, stream
+        clients get a placeholder frame right away and then at
+        CAMERA_PLACEHOLDER_FPS.
+        
+        Args:
+            delay: Seconds to wait
+        
+        Returns:
+            False if the supervisor was stopped
+        """
+        deadline = time.monotonic() + delay
+        interval = 1.0 / config.CAMERA_PLACEHOLDER_FPS if config.CAMERA_PLACEHOLDER_FPS > 0 else None
+        first = True
+        
+        while True:
+            with self._condition:
+                if self._stopped:
+                    return False
+                failed = self._state == FAILED
+                message = f"Reconnecting ({self._last_fault or 'no frames'})"
+            
+            # The placeholder also replaces the last live frame, so it is not served as current
+            if failed and (first or interval):
+                self.camera.worker.publish_placeholder(message)
+            first = False
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return True
+            
+            with self._condition:
+                timeout = min(remaining, interval) if interval else remaining
+                if self._condition.wait_for(lambda: self._stopped, timeout):
+                    return False
+    
+    def _wait_ready(self) -> bool:
+        """
+        Watch a working camera until a fault is reported. A read that
+        blocks for CAMERA_STALL_SECONDS is reported as a stall.
+        
+        Returns:
+            False if the supervisor was stopped
+        """
+        interval = max(0.1, min(1.0, config.CAMERA_STALL_SECONDS / 2))
+        while True:
+            with self._condition:
+                if self._condition.wait_for(lambda: self._stopped or self._state == FAILED, interval):
+                    return not self._stopped
+            if self.camera.worker.read_stalled(config.CAMERA_STALL_SECONDS):
+                logger.warning(f"Camera '{self.name}' read blocked for more than {config.CAMERA_STALL_SECONDS}s")
+                self.report_failure('stall')
+    
+    def _run(self):
+        """Probe until the camera works, then watch it until the next fault."""
+        initial_snapshot = True
+        delay = 0.0
+        
+        while True:
+            if not self._wait_failed(delay):
+                return
+            
+            logger.info(f"Probing camera '{self.name}'...")
+            if not self._probe():
+                with self._condition:
+                    self._attempts += 1
+                    self._failed_probes += 1
+                    self._last_failure = time.time()
+                    delay = min(self.initial_delay * 2 ** (self._attempts - 1), self.max_delay)
+                    self._next_attempt = time.monotonic() + delay
+                    self._set_state(FAILED)
+                logger.warning(f"✗ Camera '{self.name}' not available, retrying in {delay:.1f}s")
+                continue
+            
+            with self._condition:
+                recovered = self._state == FAILED
+                self._attempts = 0
+                self._next_attempt = None
+                self._set_state(READY)
+                if recovered:
+                    self._recoveries += 1
+            logger.info(f"✓ Camera '{self.name}' ready")
+            
+            if recovered:
+                self._reconnects.inc()
+                self.camera.worker.resume()
+            
+            if initial_snapshot:
+                # Taken from the session the probe just warmed up
+                initial_snapshot = False
+                success, filepath = self.camera.capture_snapshot()
+                if success:
+                    logger.info(f"✓ Initial snapshot saved: {filepath}")
+                else:
+                    logger.warning("✗ Failed to capture initial snapshot")
+            
+            if not self._wait_ready():
+                return
+            delay = self.initial_delay
@@ -0,0 +1,35 @@
+"""
+Shared test setup: the modules live in the repository root.
+"""
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def synthetic_camera(tmp_path, monkeypatch):
+    """
+    The default camera on the synthetic frame source, storing snapshots,
+    history and warmup profiles in a temporary directory. The camera
+    registry is reset around the test.
+    """
+    import camera
+    import config
+    import warmup
+    
+    monkeypatch.setattr(config, 'FRAME_SOURCE', 'synthetic')
+    monkeypatch.setattr(config, 'CAMERAS', None)
+    monkeypatch.setattr(config, 'IMAGES_DIR', str(tmp_path))
+    monkeypatch.setattr(camera, '_settings', None)
+    monkeypatch.setattr(camera, '_cameras', {})
+    monkeypatch.setattr(warmup, '_profiles', None)
+    
+    cam = camera.get_camera()
+    yield cam
+    
+    cam.writer.flush(5.0)
+    if cam._worker is not None:
+        # Let the capture thread release the source once the test is done
+        cam._worker.idle_timeout = 0
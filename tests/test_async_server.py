@@ -0,0 +1,255 @@
+"""
+HTTP/1.1 handling of the asyncio server: framing, keep-alive and the
+WSGI adapter, run on an ephemeral port against the synthetic source.
+"""
+import asyncio
+import json
+import socket
+import threading
+import pytest
+from async_server import AsyncCameraServer
+
+GENERATED_CHUNKS = 300  # Chunks of 1000 bytes from the test route without Content-Length
+
+
+@pytest.fixture
+def server(synthetic_camera):
+    """Asyncio server running in a background event loop."""
+    import app
+    
+    def wsgi_app(environ, start_response):
+        # A streamed body of unknown length, which keep-alive responses send chunked
+        if environ['PATH_INFO'] == '/generated':
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return (b'x' * 1000 for _ in range(GENERATED_CHUNKS))
+        return app.app(environ, start_response)
+    
+    server = AsyncCameraServer(wsgi_app, '127.0.0.1', 0, executor_workers=4)
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(server.start(), loop).result(5)
+    yield server
+    
+    async def shutdown():
+        server.server.close()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    asyncio.run_coroutine_threadsafe(shutdown(), loop).result(5)
+    # Pumps publish to the loop until they notice that their clients are gone
+    for pump in server.pumps.values():
+        pump_thread = pump._thread
+        if pump_thread is not None:
+            pump_thread.join(5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    loop.close()
+    server.executor.shutdown()
+
+
+class Connection:
+    """Raw client connection that reads responses exactly as framed by the server."""
+    
+    def __init__(self, port: int):
+        self.sock = socket.create_connection(('127.0.0.1', port), timeout=10)
+        self.file = self.sock.makefile('rb')
+    
+    def close(self):
+        self.file.close()
+        self.sock.close()
+    
+    def send(self, data: bytes):
+        self.sock.sendall(data)
+    
+    def request(self, method: str, path: str, headers: dict = None, version: str = 'HTTP/1.1'):
+        lines = [f"{method} {path} {version}", "Host: test"]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        self.send(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        return self.response(method)
+    
+    def response(self, method: str = 'GET'):
+        """
+        Read one response.
+        
+        Returns:
+            Tuple of (status code, lower-cased headers, body, chunked)
+        """
+        status = self.file.readline().decode('latin-1')
+        assert status.startswith('HTTP/1.1 '), status
+        code = int(status.split(' ')[1])
+        headers = {}
+        while True:
+            line = self.file.readline().decode('latin-1')
+            if line == '\r\n':
+                break
+            name, value = line.split(':', 1)
+            assert name.lower() not in headers, f"Duplicate header {name}"
+            headers[name.lower()] = value.strip()
+        
+        chunked = headers.get('transfer-encoding') == 'chunked'
+        if method == 'HEAD' or code < 200 or code in (204, 304):
+            return code, headers, b'', chunked
+        if chunked:
+            body = b''
+            while True:
+                size = int(self.file.readline(), 16)
+                data = self.file.read(size + 2)
+                assert data.endswith(b'\r\n')
+                if size == 0:
+                    break
+                body += data[:-2]
+            return code, headers, body, chunked
+        if 'content-length' in headers:
+            return code, headers, self.file.read(int(headers['content-length'])), chunked
+        return code, headers, self.file.read(), chunked
+    
+    def at_eof(self, timeout: float = 1.0) -> bool:
+        """True if the server closed the connection without sending anything else."""
+        self.sock.settimeout(timeout)
+        return self.file.read(1) == b''
+
+
+@pytest.fixture
+def connect(server):
+    connections = []
+    
+    def connect():
+        connection = Connection(server.port)
+        connections.append(connection)
+        return connection
+    
+    yield connect
+    for connection in connections:
+        connection.close()
+
+
+@pytest.fixture
+def snapshot(synthetic_camera):
+    """Store one snapshot so /snapshot.jpg has something to serve."""
+    success, _ = synthetic_camera.capture_snapshot()
+    assert success
+    return synthetic_camera.snapshot_cache.get()
+
+
+def test_content_length_body(connect):
+    connection = connect()
+    code, headers, body, chunked = connection.request('GET', '/status')
+    assert code == 200
+    assert not chunked
+    assert int(headers['content-length']) == len(body)
+    assert 'cameras' in json.loads(body)
+    assert headers['connection'] == 'keep-alive'
+
+
+def test_chunked_body(connect):
+    connection = connect()
+    code, headers, body, chunked = connection.request('GET', '/generated')
+    assert code == 200
+    assert chunked
+    assert 'content-length' not in headers
+    assert body == b'x' * 1000 * GENERATED_CHUNKS
+
+
+def test_http10_body_ends_with_close(connect):
+    connection = connect()
+    code, headers, body, chunked = connection.request('GET', '/generated', version='HTTP/1.0')
+    assert code == 200
+    assert not chunked
+    assert headers['connection'] == 'close'
+    assert body == b'x' * 1000 * GENERATED_CHUNKS
+
+
+def test_keep_alive_reuse(connect, snapshot):
+    connection = connect()
+    for path in ('/status', '/generated', '/snapshot.jpg', '/missing', '/status'):
+        code, headers, body, _ = connection.request('GET', path)
+        assert code == (404 if path == '/missing' else 200)
+        assert headers['connection'] == 'keep-alive'
+    
+    code, headers, body, _ = connection.request('GET', '/snapshot.jpg', {'Connection': 'close'})
+    assert code == 200
+    assert body == snapshot.jpeg
+    assert headers['connection'] == 'close'
+    assert connection.at_eof()
+
+
+def test_conditional_get_keep_alive(connect, snapshot):
+    connection = connect()
+    code, headers, body, _ = connection.request('GET', '/snapshot.jpg')
+    assert code == 200
+    etag = headers['etag']
+    
+    # Polling like the index page: the 304 must not carry chunked framing
+    for _ in range(3):
+        code, headers, body, chunked = connection.request(
+            'GET', '/snapshot.jpg', {'If-None-Match': etag, 'Cache-Control': 'no-cache'})
+        assert code == 304
+        assert not chunked
+        assert headers['connection'] == 'keep-alive'
+    
+    code, headers, body, _ = connection.request('GET', '/status')
+    assert code == 200
+    assert 'cameras' in json.loads(body)
+
+
+def test_head(connect, snapshot):
+    connection = connect()
+    code, headers, body, chunked = connection.request('HEAD', '/snapshot.jpg')
+    assert code == 200
+    assert not chunked
+    assert int(headers['content-length']) == len(snapshot.jpeg)
+    
+    code, headers, body, chunked = connection.request('HEAD', '/generated')
+    assert code == 200
+    assert not chunked
+    
+    # Nothing of either body was sent: the next response starts right away
+    code, headers, body, _ = connection.request('GET', '/snapshot.jpg')
+    assert code == 200
+    assert body == snapshot.jpeg
+
+
+@pytest.mark.parametrize('request_line', [
+    b'GET /status',
+    b'GET /status HTTP/1.1 extra',
+    b'GET  /status HTTP/1.1',
+    b'garbage',
+    b'GET /status SPDY/3',
+])
+def test_malformed_request_line(connect, request_line):
+    connection = connect()
+    connection.send(request_line + b'\r\nHost: test\r\n\r\n')
+    code, headers, body, _ = connection.response()
+    assert code == 400
+    assert 'error' in json.loads(body)
+    assert connection.at_eof()
+
+
+def test_invalid_content_length(connect):
+    connection = connect()
+    connection.send(b'POST /capture HTTP/1.1\r\nHost: test\r\nContent-Length: -5\r\n\r\n')
+    code, headers, body, _ = connection.response()
+    assert code == 400
+    assert connection.at_eof()
+
+
+def test_video_feed(connect, server):
+    connection = connect()
+    connection.send(b'GET /video_feed?width=160 HTTP/1.1\r\nHost: test\r\n\r\n')
+    assert connection.file.readline() == b'HTTP/1.1 200 OK\r\n'
+    while connection.file.readline() != b'\r\n':
+        pass
+    
+    # Two multipart parts, each a complete JPEG
+    for _ in range(2):
+        assert connection.file.readline() == b'--frame\r\n'
+        assert connection.file.readline() == b'Content-Type: image/jpeg\r\n'
+        assert connection.file.readline() == b'\r\n'
+        data = b''
+        while not data.endswith(b'\xff\xd9\r\n'):
+            data += connection.file.readline()
+        assert data.startswith(b'\xff\xd8')
+    assert server.stream_clients == 1
@@ -0,0 +1,137 @@
+"""
+SQLite snapshot history: keyset pagination, directory sync and schema
+migrations.
+"""
+import sqlite3
+import cv2
+import numpy as np
+import pytest
+from history import SnapshotHistory
+from quality import FrameQuality
+from storage import StoredImage
+
+# Schema of the first release, before the image quality columns and the
+# motion and recording tables
+OLD_SCHEMA = """
+CREATE TABLE snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    filename TEXT NOT NULL UNIQUE,
+    captured_at REAL NOT NULL,
+    size INTEGER NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    content_hash TEXT
+);
+CREATE INDEX idx_snapshots_captured_at ON snapshots (captured_at, id);
+"""
+
+
+@pytest.fixture
+def history(tmp_path):
+    return SnapshotHistory(str(tmp_path / 'snapshots.db'), str(tmp_path))
+
+
+def add(history, tmp_path, name: str, captured_at: float, quality: FrameQuality = None):
+    history.add(StoredImage(str(tmp_path / name), 1000, captured_at, 64, 48, name, quality))
+
+
+def all_pages(history, limit: int, **filters):
+    """Follow next_cursor to the end; returns the pages as lists of file names."""
+    pages = []
+    cursor = None
+    while True:
+        items, cursor = history.query(limit=limit, cursor=cursor, **filters)
+        pages.append([item['filename'] for item in items])
+        if cursor is None:
+            return pages
+
+
+def test_cursor_pages_through_equal_capture_times(history, tmp_path):
+    # Bursts of snapshots share a capture time; inserted out of order
+    times = [1700000000.5, 1700000001.0, 1700000000.5, 1700000000.5,
+             1700000002.25, 1700000001.0, 1700000000.5, 1700000002.25]
+    for index, captured_at in enumerate(times):
+        add(history, tmp_path, f"snapshot_{index}.jpg", captured_at)
+    
+    expected = [f"snapshot_{index}.jpg" for index in sorted(range(len(times)), key=lambda i: (times[i], i))]
+    for limit in (1, 2, 3, 5, 8, 20):
+        pages = all_pages(history, limit)
+        assert [name for page in pages for name in page] == expected
+        assert all(len(page) == limit for page in pages[:-1])
+        assert 0 < len(pages[-1]) <= limit
+
+
+def test_cursor_with_time_range(history, tmp_path):
+    for index in range(10):
+        add(history, tmp_path, f"snapshot_{index}.jpg", 1700000000.0 + index // 2)
+    pages = all_pages(history, 2, start=1700000001.0, end=1700000003.0)
+    assert [name for page in pages for name in page] == [f"snapshot_{index}.jpg" for index in range(2, 8)]
+
+
+def test_cursor_keeps_full_time_precision(history, tmp_path):
+    # repr() of the float survives the round trip through the cursor string
+    captured_at = 1700000000.123457
+    for index in range(3):
+        add(history, tmp_path, f"snapshot_{index}.jpg", captured_at)
+    items, cursor = history.query(limit=1)
+    assert cursor == f"{captured_at!r}:{items[0]['id']}"
+    assert [name for page in all_pages(history, 1) for name in page] == [
+        "snapshot_0.jpg", "snapshot_1.jpg", "snapshot_2.jpg"]
+
+
+@pytest.mark.parametrize('cursor', ['abc', '1700000000.0', '1700000000.0:x', 'x:1'])
+def test_malformed_cursor(history, tmp_path, cursor):
+    add(history, tmp_path, "snapshot_0.jpg", 1700000000.0)
+    with pytest.raises(ValueError):
+        history.query(cursor=cursor)
+
+
+def test_upgrade_from_old_schema(tmp_path):
+    path = str(tmp_path / 'snapshots.db')
+    conn = sqlite3.connect(path)
+    conn.executescript(OLD_SCHEMA)
+    conn.execute("INSERT INTO snapshots (filename, captured_at, size, width, height, content_hash) "
+                 "VALUES ('snapshot_old.jpg', 1600000000.0, 1234, 640, 480, 'abc')")
+    conn.commit()
+    conn.close()
+    
+    history = SnapshotHistory(path, str(tmp_path))
+    items, _ = history.query()
+    assert len(items) == 1
+    old = items[0]
+    assert old['filename'] == 'snapshot_old.jpg'
+    assert old['size'] == 1234
+    assert old['brightness'] is None and old['sharpness'] is None and old['histogram'] is None
+    
+    # New columns and tables are usable
+    quality = FrameQuality(120.0, 35.5, [0.5, 0.5])
+    add(history, tmp_path, "snapshot_new.jpg", 1700000000.0, quality)
+    history.add_motion_event(1700000000.0, 0.3, "snapshot_new.jpg")
+    history.add_recording("segment.avi", 1700000000.0, 1700000060.0, 600, 10**6, 640, 480)
+    items, _ = history.query(min_brightness=100)
+    assert [item['filename'] for item in items] == ["snapshot_new.jpg"]
+    assert items[0]['histogram'] == [0.5, 0.5]
+    assert history.query_motion_events()[0]['snapshot_id'] == items[0]['id']
+    
+    # Opening an upgraded database again changes nothing
+    reopened = SnapshotHistory(path, str(tmp_path))
+    assert [item['filename'] for item in reopened.query()[0]] == ["snapshot_old.jpg", "snapshot_new.jpg"]
+    columns = [row[1] for row in sqlite3.connect(path).execute("PRAGMA table_info(snapshots)")]
+    assert columns[-3:] == ['brightness', 'sharpness', 'histogram']
+
+
+def test_sync_reads_dimensions(history, tmp_path):
+    image = np.zeros((48, 64, 3), dtype=np.uint8)
+    (tmp_path / "snapshot_20240101_120000.jpg").write_bytes(cv2.imencode('.jpg', image)[1].tobytes())
+    # Not a JPEG despite its name: the header cannot be parsed, so it is decoded
+    (tmp_path / "snapshot_20240101_120100.jpg").write_bytes(cv2.imencode('.png', image[:30, :40])[1].tobytes())
+    (tmp_path / "snapshot_20240101_120200.jpg").write_bytes(b'garbage')
+    
+    assert history.sync() == (3, 0)
+    items = {item['filename']: item for item in history.query()[0]}
+    assert (items["snapshot_20240101_120000.jpg"]['width'], items["snapshot_20240101_120000.jpg"]['height']) == (64, 48)
+    assert (items["snapshot_20240101_120100.jpg"]['width'], items["snapshot_20240101_120100.jpg"]['height']) == (40, 30)
+    assert items["snapshot_20240101_120200.jpg"]['width'] is None
+    
+    (tmp_path / "snapshot_20240101_120200.jpg").unlink()
+    assert history.sync() == (0, 1)
@@ -0,0 +1,138 @@
+"""
+Frame-differencing motion detection on synthetic frames.
+"""
+import threading
+import numpy as np
+import pytest
+from camera import Frame
+from history import SnapshotHistory
+from motion import MotionDetector, start_motion_detection
+from storage import SnapshotWriter
+
+WIDTH, HEIGHT = 320, 240
+STARTED_AT = 1700000000.0
+
+
+def make_frame(seq: int, box=None, level: int = 200) -> Frame:
+    """
+    Gray frame, optionally with a bright box.
+    
+    Args:
+        seq: Sequence number (frames are captured one second apart)
+        box: (x, y, width, height) fractions of the frame
+        level: Gray level of the box
+    """
+    image = np.full((HEIGHT, WIDTH, 3), 60, dtype=np.uint8)
+    if box is not None:
+        x, y, w, h = box
+        image[int(y * HEIGHT):int((y + h) * HEIGHT), int(x * WIDTH):int((x + w) * WIDTH)] = level
+    return Frame(seq, image, STARTED_AT + seq)
+
+
+def run(detector: MotionDetector, frames) -> list:
+    """Feed frames to a detector and return the sequence numbers that triggered."""
+    triggered = []
+    detector.on_motion = lambda frame, timestamp, score: triggered.append(frame.seq)
+    for frame in frames:
+        detector.process(frame, frame.seq, frame.captured_at)
+    return triggered
+
+
+def detector(**kwargs) -> MotionDetector:
+    settings = dict(width=160, pixel_threshold=25, min_area=0.05, learning_rate=0.05, cooldown=0, roi=None)
+    settings.update(kwargs)
+    return MotionDetector(lambda frame, timestamp, score: None, **settings)
+
+
+def test_static_scene_does_not_trigger():
+    assert run(detector(), [make_frame(seq) for seq in range(1, 6)]) == []
+
+
+def test_changed_area_threshold():
+    # 4% of the frame changes: below min_area
+    small = (0.4, 0.4, 0.2, 0.2)
+    assert run(detector(), [make_frame(1), make_frame(2, small)]) == []
+    # 16% of the frame changes
+    large = (0.3, 0.3, 0.4, 0.4)
+    assert run(detector(), [make_frame(1), make_frame(2, large)]) == [2]
+
+
+def test_pixel_threshold():
+    large = (0.3, 0.3, 0.4, 0.4)
+    # A change of 15 gray levels is noise for a threshold of 25
+    assert run(detector(), [make_frame(1), make_frame(2, large, level=75)]) == []
+    assert run(detector(pixel_threshold=10), [make_frame(1), make_frame(2, large, level=75)]) == [2]
+
+
+def test_roi_mask():
+    left_half = [(0.0, 0.0, 0.5, 1.0)]
+    outside = (0.6, 0.2, 0.35, 0.6)
+    inside = (0.1, 0.2, 0.35, 0.6)
+    assert run(detector(roi=left_half), [make_frame(1), make_frame(2, outside)]) == []
+    assert run(detector(roi=left_half), [make_frame(1), make_frame(2, inside)]) == [2]
+    # The score is relative to the ROI: a change that is small for the
+    # whole frame is large for a small region
+    corner = [(0.0, 0.0, 0.25, 0.25)]
+    spot = (0.05, 0.05, 0.1, 0.1)
+    assert run(detector(), [make_frame(1), make_frame(2, spot)]) == []
+    assert run(detector(roi=corner), [make_frame(1), make_frame(2, spot)]) == [2]
+
+
+def test_cooldown():
+    boxes = [(0.1, 0.1, 0.3, 0.3), (0.6, 0.1, 0.3, 0.3), (0.1, 0.6, 0.3, 0.3), (0.6, 0.6, 0.3, 0.3)]
+    # Motion in every frame: one per second captured, a trigger at most every 3 s
+    frames = [make_frame(1)] + [make_frame(seq, boxes[seq % 4]) for seq in range(2, 10)]
+    assert run(detector(cooldown=3), frames) == [2, 5, 8]
+
+
+def test_stats():
+    motion = detector()
+    run(motion, [make_frame(1), make_frame(2, (0.3, 0.3, 0.4, 0.4))])
+    stats = motion.get_stats()
+    assert stats["events"] == 1
+    # The first frame only initializes the background
+    assert stats["frames"] == 1
+    assert stats["last_score"] == pytest.approx(0.16, abs=0.03)
+
+
+class FakeWorker:
+    """Collects the frame listener instead of running a capture thread."""
+    
+    def __init__(self):
+        self.listeners = []
+        self.pins = 0
+    
+    def add_frame_listener(self, listener):
+        self.listeners.append(listener)
+    
+    def pin(self):
+        self.pins += 1
+
+
+def test_events_are_recorded_by_the_writer(tmp_path, monkeypatch):
+    history = SnapshotHistory(str(tmp_path / 'snapshots.db'), str(tmp_path))
+    writer = SnapshotWriter(on_stored=lambda image, jpeg: history.add(image), images_dir=str(tmp_path))
+    recorded_on = []
+    add_motion_event = history.add_motion_event
+    
+    def record(*args):
+        recorded_on.append(threading.current_thread().name)
+        add_motion_event(*args)
+    
+    monkeypatch.setattr(history, 'add_motion_event', record)
+    worker = FakeWorker()
+    detector = start_motion_detection(worker, writer, history)
+    assert worker.pins == 1
+    assert worker.listeners == [detector.process]
+    
+    for frame in (make_frame(1), make_frame(2, (0.3, 0.3, 0.4, 0.4))):
+        detector.process(frame, frame.seq, frame.captured_at)
+    assert writer.flush(5.0)
+    
+    # Recorded off the capture thread, after the snapshot was indexed
+    assert recorded_on == ['snapshot-writer']
+    events = history.query_motion_events()
+    assert len(events) == 1
+    assert events[0]["occurred_at"] == STARTED_AT + 2
+    assert events[0]["snapshot_id"] is not None
+    assert (tmp_path / events[0]["snapshot_filename"]).exists()
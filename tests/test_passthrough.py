@@ -0,0 +1,128 @@
+"""
+MJPEG passthrough, exercised with the file-replay stand-in for an MJPEG camera.
+"""
+import cv2
+import numpy as np
+import pytest
+import config
+from camera import Frame
+from frame_source import ReplaySource, jpeg_dimensions
+from motion import MotionDetector
+
+
+def encode(width: int, height: int, progressive: bool = False) -> bytes:
+    """Encode a test pattern of the given size."""
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    image[:, :, 0] = np.linspace(0, 255, width, dtype=np.uint8)[np.newaxis, :]
+    image[:, :, 1] = np.linspace(0, 255, height, dtype=np.uint8)[:, np.newaxis]
+    params = [cv2.IMWRITE_JPEG_QUALITY, 90]
+    if progressive:
+        params += [cv2.IMWRITE_JPEG_PROGRESSIVE, 1]
+    ret, buffer = cv2.imencode('.jpg', image, params)
+    assert ret
+    return buffer.tobytes()
+
+
+@pytest.fixture
+def jpeg_dir(tmp_path):
+    """Directory with three JPEG files of different content."""
+    files = []
+    for index, size in enumerate(((64, 48), (80, 60), (96, 72))):
+        data = encode(*size)
+        path = tmp_path / f"frame_{index:03d}.jpg"
+        path.write_bytes(data)
+        files.append(data)
+    return tmp_path, files
+
+
+def test_replay_passthrough_returns_file_bytes(jpeg_dir):
+    path, files = jpeg_dir
+    source = ReplaySource(str(path), fps=0, loop=True, passthrough=True)
+    assert source.open()
+    try:
+        # Files come back unchanged, in order, and loop at the end
+        for expected in files + files[:1]:
+            ret, data = source.read_jpeg()
+            assert ret
+            assert data == expected
+    finally:
+        source.release()
+
+
+def test_replay_without_loop_ends(jpeg_dir):
+    path, files = jpeg_dir
+    source = ReplaySource(str(path), fps=0, loop=False, passthrough=True)
+    assert source.open()
+    for _ in files:
+        assert source.read_jpeg()[0]
+    assert source.read_jpeg() == (False, None)
+
+
+def test_frame_serves_native_jpeg_for_default_variant():
+    native = encode(64, 48)
+    frame = Frame(1, None, 0.0, native_jpeg=native)
+    assert (frame.width, frame.height) == (64, 48)
+    
+    # Full size at the default quality is the camera's own JPEG, not a re-encode
+    assert bytes(frame.jpeg()) == native
+    assert bytes(frame.jpeg(None, config.STREAM_JPEG_QUALITY)) == native
+    assert frame._image is None
+
+
+def test_frame_reencodes_other_variants():
+    native = encode(64, 48)
+    frame = Frame(1, None, 0.0, native_jpeg=native)
+    
+    smaller = bytes(frame.jpeg(32))
+    assert smaller != native
+    assert jpeg_dimensions(smaller) == (32, 24)
+    
+    other_quality = bytes(frame.jpeg(None, config.STREAM_JPEG_QUALITY - 20))
+    assert other_quality != native
+    assert jpeg_dimensions(other_quality) == (64, 48)
+
+
+def test_motion_detection_keeps_passthrough_frames_encoded():
+    still = encode(640, 480)
+    image = cv2.imdecode(np.frombuffer(still, np.uint8), cv2.IMREAD_COLOR)
+    image[100:300, 200:400] = 255
+    moved = cv2.imencode('.jpg', image)[1].tobytes()
+    
+    events = []
+    detector = MotionDetector(lambda frame, timestamp, score: events.append(frame.seq),
+                              width=160, min_area=0.05, cooldown=0)
+    frames = [Frame(seq, None, float(seq), native_jpeg=jpeg)
+              for seq, jpeg in enumerate((still, still, moved), start=1)]
+    for frame in frames:
+        detector.process(frame, frame.seq, frame.captured_at)
+    
+    assert events == [3]
+    # Analyzed from a reduced decode only
+    assert not any(frame.decoded for frame in frames)
+
+
+def test_jpeg_dimensions_baseline():
+    assert jpeg_dimensions(encode(320, 240)) == (320, 240)
+
+
+def test_jpeg_dimensions_progressive():
+    data = encode(200, 150, progressive=True)
+    # Progressive images carry an SOF2 header instead of SOF0
+    assert b'\xff\xc2' in data
+    assert jpeg_dimensions(data) == (200, 150)
+
+
+@pytest.mark.parametrize('data', [
+    b'',
+    b'\xff\xd8',
+    b'not a jpeg image at all',
+    bytes(256),
+    b'\xff\xd8\xff\xe0\x00\x10JFIF',
+])
+def test_jpeg_dimensions_garbage(data):
+    assert jpeg_dimensions(data) is None
+
+
+def test_jpeg_dimensions_truncated():
+    data = encode(320, 240)
+    assert jpeg_dimensions(data[:20]) is None
@@ -0,0 +1,154 @@
+"""
+Motion JPEG AVI segments written by the recorder.
+"""
+import json
+import struct
+import threading
+import time
+import cv2
+import numpy as np
+import pytest
+from camera import Frame
+from history import SnapshotHistory
+from recorder import MOVI_OFFSET, SegmentFile, SegmentRecorder, index_path
+
+WIDTH, HEIGHT = 64, 48
+STARTED_AT = 1700000040.0  # Start of a 60 s segment
+
+
+def make_jpegs(count: int):
+    """Distinct JPEG frames; every other one padded to an odd length."""
+    rng = np.random.default_rng(1)
+    frames = []
+    for index in range(count):
+        image = rng.integers(0, 256, (HEIGHT, WIDTH, 3), dtype=np.uint8)
+        data = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 80])[1].tobytes()
+        # Bytes after EOI are ignored by decoders; odd frames need a pad byte in the AVI
+        if len(data) % 2 == index % 2:
+            data += b'\0'
+        frames.append(data)
+    return frames
+
+
+class FakeWorker:
+    """Stands in for the capture worker and hands out a fixed list of frames."""
+    
+    def __init__(self, frames):
+        self.frames = frames
+        self.served = threading.Event()
+        self.pins = 0
+    
+    def pin(self):
+        self.pins += 1
+    
+    def unpin(self):
+        self.pins -= 1
+    
+    def is_running(self) -> bool:
+        return True
+    
+    def wait_for_frame(self, last_seq: int, timeout: float = 2.0):
+        for frame in self.frames:
+            if frame.seq > last_seq:
+                return frame
+        self.served.set()
+        time.sleep(0.01)
+        return None
+
+
+def check_avi(data: bytes, frames: list, jpegs: list):
+    """Check the RIFF structure and that every indexed frame is the recorded JPEG."""
+    assert data[:4] == b'RIFF' and data[8:12] == b'AVI '
+    assert struct.unpack_from('<I', data, 4)[0] == len(data) - 8
+    assert data[MOVI_OFFSET:MOVI_OFFSET + 4] == b'movi'
+    
+    for (_, offset, size), jpeg in zip(frames, jpegs):
+        assert data[offset - 8:offset - 4] == b'00dc'
+        assert struct.unpack_from('<I', data, offset - 4)[0] == size
+        assert data[offset:offset + 2] == b'\xff\xd8'
+        assert data[offset:offset + size] == jpeg
+    
+    # idx1 offsets point at the chunk headers, relative to the 'movi' fourcc
+    idx1 = data.rindex(b'idx1')
+    count = struct.unpack_from('<I', data, idx1 + 4)[0] // 16
+    assert count == len(frames)
+    for entry, (_, offset, size) in enumerate(frames):
+        fourcc, _, chunk_offset, chunk_size = struct.unpack_from('<4sIII', data, idx1 + 8 + entry * 16)
+        assert fourcc == b'00dc'
+        assert chunk_offset + MOVI_OFFSET + 8 == offset
+        assert chunk_size == size
+
+
+def check_opencv(path: str, count: int):
+    """Reopen the segment with OpenCV and read every frame."""
+    capture = cv2.VideoCapture(path)
+    try:
+        assert capture.isOpened()
+        assert int(capture.get(cv2.CAP_PROP_FRAME_COUNT)) == count
+        assert capture.get(cv2.CAP_PROP_FPS) == pytest.approx(10.0, rel=0.01)
+        read = 0
+        while True:
+            ret, image = capture.read()
+            if not ret:
+                break
+            assert image.shape == (HEIGHT, WIDTH, 3)
+            read += 1
+        assert read == count
+    finally:
+        capture.release()
+
+
+def test_segment_file_layout(tmp_path):
+    jpegs = make_jpegs(10)
+    path = str(tmp_path / 'segment.avi')
+    segment = SegmentFile(path, STARTED_AT, WIDTH, HEIGHT)
+    for index, jpeg in enumerate(jpegs):
+        segment.write(memoryview(jpeg), STARTED_AT + index * 0.1)
+    assert segment.close() == pytest.approx(STARTED_AT + 0.9)
+    
+    with open(path, 'rb') as f:
+        data = f.read()
+    assert segment.size == len(data)
+    assert not (tmp_path / 'segment.avi.part').exists()
+    check_avi(data, segment.frames, jpegs)
+    check_opencv(path, len(jpegs))
+
+
+def test_segment_file_abort(tmp_path):
+    path = str(tmp_path / 'segment.avi')
+    segment = SegmentFile(path, STARTED_AT, WIDTH, HEIGHT)
+    segment.write(make_jpegs(1)[0], STARTED_AT)
+    segment.abort()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_recorder_writes_indexed_segment(tmp_path):
+    jpegs = make_jpegs(10)
+    worker = FakeWorker([Frame(index + 1, None, STARTED_AT + index * 0.1, native_jpeg=jpeg)
+                         for index, jpeg in enumerate(jpegs)])
+    history = SnapshotHistory(str(tmp_path / 'snapshots.db'), str(tmp_path))
+    recorder = SegmentRecorder(history, str(tmp_path / 'recordings'))
+    
+    recorder.start(worker)
+    assert worker.pins == 1
+    assert worker.served.wait(5.0)
+    recorder.stop()
+    assert worker.pins == 0
+    
+    rows = history.recordings()
+    assert len(rows) == 1
+    row = rows[0]
+    assert row['frames'] == len(jpegs)
+    path = recorder.path_for(row)
+    
+    with open(index_path(path)) as f:
+        index = json.load(f)
+    assert index == recorder.read_index(row)
+    assert (index['width'], index['height']) == (WIDTH, HEIGHT)
+    assert index['started_at'] == pytest.approx(STARTED_AT)
+    
+    with open(path, 'rb') as f:
+        data = f.read()
+    assert row['size'] == len(data)
+    check_avi(data, index['frames'], jpegs)
+    check_opencv(path, len(jpegs))
@@ -0,0 +1,58 @@
+"""
+Periodic captures from the shared capture session.
+"""
+import time
+from scheduler import CaptureScheduler
+
+INTERVAL = 0.3
+
+
+def count_opens(worker, monkeypatch) -> list:
+    """Record every device open of a capture worker."""
+    opens = []
+    open_camera = worker._camera._open_camera
+    
+    def counting_open():
+        opens.append(time.monotonic())
+        return open_camera()
+    
+    monkeypatch.setattr(worker._camera, '_open_camera', counting_open)
+    return opens
+
+
+def run_scheduler(camera, captures: int, worker=None) -> CaptureScheduler:
+    scheduler = CaptureScheduler(camera.capture_snapshot, interval=INTERVAL)
+    scheduler.start(worker)
+    try:
+        deadline = time.monotonic() + 10
+        while scheduler.get_stats()["captures"] < captures and time.monotonic() < deadline:
+            time.sleep(0.02)
+    finally:
+        scheduler.stop()
+    return scheduler
+
+
+def test_scheduled_captures_do_not_reopen_the_source(synthetic_camera, monkeypatch):
+    worker = synthetic_camera.worker
+    # Shorter than the interval, like the defaults (60 s idle, 300 s interval)
+    worker.idle_timeout = INTERVAL / 6
+    opens = count_opens(worker, monkeypatch)
+    
+    scheduler = run_scheduler(synthetic_camera, 3, worker)
+    
+    stats = scheduler.get_stats()
+    assert stats["captures"] >= 3
+    assert stats["failures"] == 0
+    assert len(opens) == 1
+    assert worker.get_stats()["captures"] >= 3
+    assert worker.get_stats()["pins"] == 0
+
+
+def test_unpinned_session_is_released_between_captures(synthetic_camera, monkeypatch):
+    worker = synthetic_camera.worker
+    worker.idle_timeout = INTERVAL / 6
+    opens = count_opens(worker, monkeypatch)
+    
+    run_scheduler(synthetic_camera, 2)
+    
+    assert len(opens) >= 2
@@ -0,0 +1,109 @@
+"""
+/snapshot.jpg served from the in-memory snapshot cache: conditional GET
+and the max_age freshness bound, with the Flask test client.
+"""
+import time
+import cv2
+import numpy as np
+import pytest
+
+
+def encode(level: int) -> bytes:
+    image = np.full((48, 64, 3), level, dtype=np.uint8)
+    return cv2.imencode('.jpg', image)[1].tobytes()
+
+
+@pytest.fixture
+def client(synthetic_camera):
+    import app
+    return app.app.test_client()
+
+
+@pytest.fixture
+def captures(synthetic_camera, monkeypatch):
+    """Replace device captures with a counter that stores a new image."""
+    calls = []
+    
+    def capture_snapshot(*args, **kwargs):
+        calls.append(time.time())
+        synthetic_camera.snapshot_cache.update(encode(200))
+        return True, None
+    
+    monkeypatch.setattr(synthetic_camera, 'capture_snapshot', capture_snapshot)
+    return calls
+
+
+def test_snapshot_is_cached(client, synthetic_camera, captures):
+    jpeg = encode(100)
+    synthetic_camera.snapshot_cache.update(jpeg)
+    response = client.get('/snapshot.jpg')
+    assert response.status_code == 200
+    assert response.data == jpeg
+    assert response.mimetype == 'image/jpeg'
+    assert 'no-cache' in response.headers['Cache-Control']
+    assert captures == []
+
+
+def test_missing_snapshot_is_captured(client, captures):
+    response = client.get('/snapshot.jpg')
+    assert response.status_code == 200
+    assert response.data == encode(200)
+    assert len(captures) == 1
+
+
+def test_if_none_match(client, synthetic_camera, captures):
+    synthetic_camera.snapshot_cache.update(encode(100))
+    etag = client.get('/snapshot.jpg').headers['ETag']
+    
+    response = client.get('/snapshot.jpg', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+    
+    # A new image gets a new validator
+    synthetic_camera.snapshot_cache.update(encode(150))
+    response = client.get('/snapshot.jpg', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.data == encode(150)
+    assert response.headers['ETag'] != etag
+
+
+def test_if_modified_since(client, synthetic_camera, captures):
+    synthetic_camera.snapshot_cache.update(encode(100), captured_at=time.time() - 10)
+    last_modified = client.get('/snapshot.jpg').headers['Last-Modified']
+    
+    response = client.get('/snapshot.jpg', headers={'If-Modified-Since': last_modified})
+    assert response.status_code == 304
+    
+    response = client.get('/snapshot.jpg', headers={'If-Modified-Since': 'Mon, 01 Jan 2001 00:00:00 GMT'})
+    assert response.status_code == 200
+
+
+def test_max_age_fresh_snapshot_is_served(client, synthetic_camera, captures):
+    synthetic_camera.snapshot_cache.update(encode(100), captured_at=time.time() - 5)
+    response = client.get('/snapshot.jpg?max_age=60')
+    assert response.status_code == 200
+    assert response.data == encode(100)
+    assert captures == []
+
+
+def test_max_age_stale_snapshot_is_recaptured(client, synthetic_camera, captures):
+    synthetic_camera.snapshot_cache.update(encode(100), captured_at=time.time() - 120)
+    response = client.get('/snapshot.jpg?max_age=60')
+    assert response.status_code == 200
+    assert response.data == encode(200)
+    assert len(captures) == 1
+    
+    # Zero means "capture now"
+    response = client.get('/snapshot.jpg?max_age=0')
+    assert response.status_code == 200
+    assert len(captures) == 2
+
+
+@pytest.mark.parametrize('value', ['abc', '-1', 'nan', 'inf', '-inf', '1e999'])
+def test_invalid_max_age(client, synthetic_camera, captures, value):
+    synthetic_camera.snapshot_cache.update(encode(100), captured_at=time.time() - 120)
+    response = client.get(f'/snapshot.jpg?max_age={value}')
+    assert response.status_code == 400
+    assert 'max_age' in response.get_json()["error"]
+    assert captures == []
@@ -0,0 +1,207 @@
+"""
+Coalescing snapshot writer and retention of stored snapshots.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+import cv2
+import numpy as np
+import config
+from storage import RetentionIndex, SnapshotWriter, StoredImage, content_hash, list_stored_images
+
+CAPTURED_AT = 1700000000.0
+
+
+def timestamped_name(captured_at: float) -> str:
+    return f"snapshot_{datetime.fromtimestamp(captured_at).strftime(config.TIMESTAMP_FORMAT)}.jpg"
+
+
+class BlockedWriter:
+    """SnapshotWriter whose first batch waits until released, so later jobs queue up."""
+    
+    def __init__(self, tmp_path, **kwargs):
+        self.encoded = []
+        self.stored = []
+        self.stored_jpegs = []
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.writer = SnapshotWriter(on_encoded=self.on_encoded, on_stored=self.on_stored,
+                                     images_dir=str(tmp_path), **kwargs)
+    
+    def on_stored(self, image: StoredImage, jpeg: bytes):
+        self.stored.append(image)
+        self.stored_jpegs.append(jpeg)
+    
+    def on_encoded(self, jpeg: bytes, captured_at: float):
+        self.encoded.append(jpeg)
+        self.started.set()
+        assert self.release.wait(5)
+    
+    def block(self):
+        """Submit a first job and wait until the writer is stuck in it."""
+        job = self.writer.submit(None, save_with_timestamp=False, captured_at=CAPTURED_AT, jpeg=b'first')
+        assert self.started.wait(5)
+        return job
+
+
+def test_batch_coalesces_onto_newest_snapshot(tmp_path):
+    blocked = BlockedWriter(tmp_path)
+    writer = blocked.writer
+    blocked.block()
+    
+    # Queued while the writer is busy: one batch
+    stale = writer.submit(None, save_with_timestamp=False, captured_at=CAPTURED_AT + 1, jpeg=b'stale')
+    kept = writer.submit(None, save_with_timestamp=True, captured_at=CAPTURED_AT + 2, jpeg=b'timestamped')
+    image = np.full((48, 64, 3), 128, dtype=np.uint8)
+    newest = writer.submit(image, save_with_timestamp=False, captured_at=CAPTURED_AT + 3)
+    blocked.release.set()
+    assert writer.flush(5)
+    
+    # snapshot.jpg is written once, with the newest frame
+    latest = (tmp_path / config.LATEST_IMAGE_NAME).read_bytes()
+    assert cv2.imdecode(np.frombuffer(latest, np.uint8), cv2.IMREAD_COLOR).shape == image.shape
+    assert blocked.encoded == [b'first', latest]
+    # The frame that would only have updated snapshot.jpg is skipped
+    assert writer.get_stats()["coalesced"] == 1
+    assert stale.success and stale.encoded.is_set()
+    # Frames with their own file are always stored
+    assert (tmp_path / kept.timestamped_name).read_bytes() == b'timestamped'
+    assert [os.path.basename(image.path) for image in blocked.stored] == [kept.timestamped_name]
+    assert blocked.stored_jpegs == [b'timestamped']
+    assert kept.success and newest.success
+
+
+def test_same_second_captures_keep_the_later_frame(tmp_path):
+    blocked = BlockedWriter(tmp_path)
+    writer = blocked.writer
+    blocked.block()
+    
+    first = writer.submit(None, captured_at=CAPTURED_AT + 0.1, jpeg=b'earlier')
+    second = writer.submit(None, captured_at=CAPTURED_AT + 0.6, jpeg=b'later')
+    assert first.timestamped_name == second.timestamped_name
+    blocked.release.set()
+    assert writer.flush(5)
+    
+    assert (tmp_path / second.timestamped_name).read_bytes() == b'later'
+    assert len(blocked.stored) == 1
+    assert blocked.stored[0].captured_at == CAPTURED_AT + 0.6
+
+
+def test_full_queue_drops_oldest_job(tmp_path):
+    blocked = BlockedWriter(tmp_path, max_queue=2)
+    writer = blocked.writer
+    blocked.block()
+    
+    jobs = [writer.submit(None, captured_at=CAPTURED_AT + seconds, jpeg=b'%d' % seconds) for seconds in (1, 2, 3)]
+    assert jobs[0].written.is_set() and not jobs[0].success
+    blocked.release.set()
+    assert writer.flush(5)
+    
+    assert writer.get_stats()["dropped"] == 1
+    assert not (tmp_path / jobs[0].timestamped_name).exists()
+    assert all(job.success for job in jobs[1:])
+
+
+def write_images(tmp_path, sizes, start: float = CAPTURED_AT):
+    """Create timestamped snapshot files one minute apart, oldest first."""
+    images = []
+    for index, size in enumerate(sizes):
+        captured_at = start + 60 * index
+        path = tmp_path / timestamped_name(captured_at)
+        path.write_bytes(b'x' * size)
+        images.append(StoredImage(str(path), size, captured_at))
+    return images
+
+
+def retention(images, removed=None, **limits) -> RetentionIndex:
+    settings = dict(max_images=None, max_bytes=None, max_age_seconds=None)
+    settings.update(limits)
+    return RetentionIndex(loader=lambda: list(images),
+                          on_removed=removed.append if removed is not None else None, **settings)
+
+
+def test_prune_by_count(tmp_path):
+    images = write_images(tmp_path, [100] * 5)
+    removed = []
+    index = retention(images, removed, max_images=3)
+    
+    assert index.prune() == 2
+    assert removed == [images[0].path, images[1].path]
+    assert sorted(os.listdir(tmp_path)) == [os.path.basename(image.path) for image in images[2:]]
+    assert index.get_stats()["stored_images"] == 3
+    assert index.prune() == 0
+
+
+def test_prune_by_bytes(tmp_path):
+    images = write_images(tmp_path, [400, 300, 200, 100])
+    index = retention(images, max_bytes=350)
+    
+    assert index.prune() == 2
+    stats = index.get_stats()
+    assert stats["stored_images"] == 2
+    assert stats["stored_bytes"] == 300
+    assert not os.path.exists(images[1].path) and os.path.exists(images[2].path)
+
+
+def test_prune_by_age(tmp_path):
+    now = time.time()
+    images = write_images(tmp_path, [100] * 4, start=now - 3600)
+    # Captured 60, 59, 58 and 57 minutes ago
+    index = retention(images, max_age_seconds=58.5 * 60)
+    
+    assert index.prune() == 2
+    assert [os.path.exists(image.path) for image in images] == [False, False, True, True]
+
+
+def test_add_enforces_retention(tmp_path):
+    images = write_images(tmp_path, [100] * 3)
+    index = retention(images[:2], max_images=2)
+    
+    index.add(images[2])
+    assert not os.path.exists(images[0].path)
+    assert index.get_stats()["stored_images"] == 2
+    assert index.get_stats()["pruned"] == 1
+
+
+def test_add_same_second_overwrite(tmp_path):
+    images = write_images(tmp_path, [100, 200])
+    index = retention(images, max_images=2)
+    
+    # The writer stored a later frame under the same name: replaced, not added
+    replacement = StoredImage(images[1].path, 250, images[1].captured_at + 0.5)
+    index.add(replacement)
+    stats = index.get_stats()
+    assert stats["stored_images"] == 2
+    assert stats["stored_bytes"] == 350
+    assert stats["pruned"] == 0
+    assert all(os.path.exists(image.path) for image in images)
+
+
+def test_loader_runs_once(tmp_path):
+    write_images(tmp_path, [100] * 3)
+    calls = []
+    
+    def loader():
+        calls.append(1)
+        return list_stored_images(str(tmp_path))
+    
+    index = RetentionIndex(max_images=None, max_bytes=None, max_age_seconds=None, loader=loader)
+    assert not index.get_stats()["loaded"]
+    index.prune()
+    index.prune()
+    assert calls == [1]
+    assert index.get_stats()["stored_images"] == 3
+
+
+def test_eager_thumbnails_use_the_written_bytes(synthetic_camera, monkeypatch):
+    generated = []
+    monkeypatch.setattr(synthetic_camera.thumbnails, 'generate',
+                        lambda content_hash, source, widths: generated.append((content_hash, source, widths)))
+    success, path = synthetic_camera.capture_snapshot(min_brightness=None, min_sharpness=None)
+    assert success
+    assert synthetic_camera.writer.flush(5)
+    
+    with open(path, 'rb') as f:
+        written = f.read()
+    assert generated == [(content_hash(written), written, list(config.THUMBNAIL_EAGER_SIZES))]
@@ -0,0 +1,28 @@
+"""
+Cache keys of time-lapse builds.
+"""
+from history import SnapshotHistory
+from storage import StoredImage
+from timelapse import TimelapseBuilder, TimelapseJob
+
+CAPTURED_AT = 1700000000.0
+
+
+def collect(builder: TimelapseBuilder, fps, width=None, video_format='avi') -> str:
+    job = TimelapseJob(None, None, fps, width, video_format)
+    builder._collect(job)
+    return job.key
+
+
+def test_cache_key(tmp_path):
+    history = SnapshotHistory(str(tmp_path / 'snapshots.db'), str(tmp_path))
+    for seconds in range(3):
+        name = f"snapshot_{seconds}.jpg"
+        history.add(StoredImage(str(tmp_path / name), 1000, CAPTURED_AT + seconds, 64, 48, name))
+    builder = TimelapseBuilder(history, str(tmp_path / 'timelapse'))
+    
+    # An integer frame rate from a JSON body is the same video as the float from a query string
+    assert collect(builder, 24) == collect(builder, 24.0)
+    assert collect(builder, 24) != collect(builder, 25)
+    assert collect(builder, 24) != collect(builder, 24, width=32)
+    assert collect(builder, 24) != collect(builder, 24, video_format='mp4')
@@ -0,0 +1,108 @@
+"""
+Per-frame stream variant cache and the worker's variant subscriptions.
+"""
+import threading
+import numpy as np
+import pytest
+import config
+from camera import Frame, variant_key
+
+WIDTH, HEIGHT = 640, 480
+
+
+@pytest.fixture
+def encodes(monkeypatch):
+    """Count Frame._encode calls per (width, quality, roi)."""
+    calls = []
+    encode = Frame._encode
+    
+    def counting_encode(self, width, quality, roi):
+        calls.append((width, quality, roi))
+        return encode(self, width, quality, roi)
+    
+    monkeypatch.setattr(Frame, '_encode', counting_encode)
+    return calls
+
+
+@pytest.fixture
+def roi_presets(monkeypatch):
+    monkeypatch.setattr(config, 'ROI_PRESETS', {'left': (0.0, 0.0, 0.5, 1.0)})
+
+
+def make_frame(seq: int = 1) -> Frame:
+    image = np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+    image[:, :, 1] = np.linspace(0, 255, WIDTH, dtype=np.uint8)[np.newaxis, :]
+    return Frame(seq, image, 1700000000.0 + seq)
+
+
+def test_variant_key(roi_presets):
+    assert variant_key(None, 85, None, WIDTH, HEIGHT) == (None, 85, None)
+    assert variant_key(320, 85, None, WIDTH, HEIGHT) == (320, 85, None)
+    assert variant_key(640, 85, None, WIDTH, HEIGHT) == (None, 85, None)
+    assert variant_key(641, 85, None, WIDTH, HEIGHT) == (None, 85, None)
+    # The ROI is 320 pixels wide
+    assert variant_key(320, 85, 'left', WIDTH, HEIGHT) == (None, 85, 'left')
+    assert variant_key(319, 85, 'left', WIDTH, HEIGHT) == (319, 85, 'left')
+
+
+def test_one_encode_per_variant(encodes, roi_presets):
+    frame = make_frame()
+    requests = [(None, 85, None), (640, 85, None), (641, 85, None), (320, 85, None), (320, 85, None),
+                (320, 60, None), (None, 85, 'left'), (320, 85, 'left'), (160, 85, 'left')]
+    parts = {}
+    for _ in range(3):
+        for width, quality, roi in requests:
+            part = frame.mjpeg_part(width, quality, roi)
+            assert part is not None
+            # Every request for a variant gets the same object
+            assert parts.setdefault(frame._variant_key(width, quality, roi), part) is part
+    
+    assert sorted(encodes, key=repr) == sorted(
+        [(None, 85, None), (320, 85, None), (320, 60, None), (None, 85, 'left'), (160, 85, 'left')], key=repr)
+    assert frame.variant_size(641) == (WIDTH, HEIGHT)
+    assert frame.variant_size(160, 'left') == (160, 240)
+
+
+def test_concurrent_requests_share_one_encode(encodes):
+    frame = make_frame()
+    start = threading.Barrier(8)
+    parts = []
+    
+    def request():
+        start.wait()
+        parts.append(frame.mjpeg_part(320, 70))
+    
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    
+    assert encodes == [(320, 70, None)]
+    assert len(parts) == 8 and all(part is parts[0] for part in parts)
+    assert frame.cached_part(320, 70) is parts[0]
+    assert frame.cached_part(160, 70) is None
+
+
+def test_each_frame_encodes_its_own_variants(encodes):
+    frames = [make_frame(seq) for seq in (1, 2)]
+    for frame in frames:
+        frame.mjpeg_part(320, 85)
+        frame.mjpeg_part(330, 85)
+        frame.mjpeg_part(320, 85)
+    assert encodes == [(320, 85, None), (330, 85, None)] * 2
+
+
+def test_subscriptions_are_normalized(synthetic_camera):
+    worker = synthetic_camera.worker
+    quality = config.STREAM_JPEG_QUALITY
+    for width in (None, config.CAMERA_WIDTH, config.CAMERA_WIDTH + 1, 320):
+        worker.subscribe(width, quality)
+    assert worker._variants == {(None, quality, None): 3, (320, quality, None): 1}
+    
+    for width in (config.CAMERA_WIDTH + 1, 320, None):
+        worker.unsubscribe(width, quality)
+    assert worker._variants == {(None, quality, None): 1}
+    worker.unsubscribe(config.CAMERA_WIDTH, quality)
+    assert worker._variants == {}
+    assert worker.get_stats()["stream_clients"] == 0
@@ -0,0 +1,131 @@
+"""
+Adaptive warmup: exposure convergence on the synthetic source and the
+learned per-device profiles.
+"""
+import json
+import pytest
+import config
+from frame_source import SyntheticSource
+from warmup import LEARNED_FRACTION, ExposureTracker, WarmupProfiles, settle
+
+KEY = "synthetic:default:640x480"
+
+
+def feed(tracker: ExposureTracker, levels) -> list:
+    """Add levels one by one; returns the frame numbers at which the tracker reported convergence."""
+    return [index for index, level in enumerate(levels, start=1) if tracker.add(level)]
+
+
+def test_converges_once_the_window_is_stable():
+    tracker = ExposureTracker(window=3, tolerance=2.0, min_frames=3)
+    assert feed(tracker, [20, 60, 100, 120, 121, 122, 122]) == [6, 7]
+
+
+def test_min_frames():
+    tracker = ExposureTracker(window=3, tolerance=2.0, min_frames=8)
+    assert feed(tracker, [120] * 10) == [8, 9, 10]
+    # The window is the lower bound of min_frames
+    assert ExposureTracker(window=5, tolerance=2.0, min_frames=1).min_frames == 5
+
+
+def test_slow_drift_is_not_converged():
+    # Each step is within the tolerance, but the window spans more
+    tracker = ExposureTracker(window=4, tolerance=2.0, min_frames=4)
+    assert feed(tracker, [100 + 1.5 * index for index in range(20)]) == []
+
+
+def test_black_frames_are_not_converged():
+    # A camera that has not started exposing delivers a stable black image
+    tracker = ExposureTracker(window=3, tolerance=2.0, min_frames=3)
+    assert feed(tracker, [0.0, 0.2, 0.1, 0.3, 0.0, 50, 90, 110, 111, 111]) == [10]
+
+
+def test_settle_waits_for_emulated_exposure():
+    quick = SyntheticSource(320, 240, fps=60, exposure_seconds=0.0)
+    slow = SyntheticSource(320, 240, fps=60, exposure_seconds=0.4)
+    results = []
+    for source in (quick, slow):
+        assert source.open()
+        try:
+            results.append(settle(source, min_frames=3, max_seconds=3.0))
+        finally:
+            source.release()
+    quick_result, slow_result = results
+    
+    assert quick_result["converged"] and slow_result["converged"]
+    assert quick_result["frames"] < slow_result["frames"]
+    # Settling takes most of the emulated exposure ramp
+    assert slow_result["seconds"] >= 0.2
+    assert slow_result["brightness"] == pytest.approx(quick_result["brightness"], abs=3 * config.CAMERA_WARMUP_TOLERANCE)
+
+
+def test_settle_gives_up_at_the_time_limit():
+    source = SyntheticSource(320, 240, fps=60, exposure_seconds=10.0)
+    assert source.open()
+    try:
+        result = settle(source, min_frames=3, max_seconds=0.3)
+    finally:
+        source.release()
+    assert not result["converged"]
+    assert 0.3 <= result["seconds"] < 1.0
+
+
+def test_learned_fraction_floor(tmp_path):
+    profiles = WarmupProfiles(str(tmp_path / 'profiles.json'))
+    assert profiles.min_frames(KEY) == config.CAMERA_WARMUP_MIN_FRAMES
+    
+    profiles.update(KEY, 40, 1.3, True)
+    assert profiles.min_frames(KEY) == int(40 * LEARNED_FRACTION)
+    # A short learned warmup never goes below the configured minimum
+    profiles.update("synthetic:other:640x480", 2, 0.1, True)
+    assert profiles.min_frames("synthetic:other:640x480") == config.CAMERA_WARMUP_MIN_FRAMES
+    
+    # The floor keeps a warmup going through a false plateau
+    source = SyntheticSource(320, 240, fps=0)
+    assert source.open()
+    try:
+        assert settle(source, min_frames=profiles.min_frames(KEY))["frames"] >= 20
+    finally:
+        source.release()
+
+
+def test_profiles_are_smoothed_and_persisted(tmp_path):
+    path = str(tmp_path / 'profiles.json')
+    profiles = WarmupProfiles(path)
+    profiles.update(KEY, 40, 1.0, True)
+    profile = profiles.update(KEY, 20, 0.5, True)
+    # Exponentially weighted: 30 % of the newest warmup
+    assert profile["frames"] == pytest.approx(34.0)
+    assert profile["seconds"] == pytest.approx(0.85)
+    
+    # Timeouts are counted without changing the learned values
+    profile = profiles.update(KEY, 90, 3.0, False)
+    assert (profile["frames"], profile["warmups"], profile["timeouts"]) == (34.0, 3, 1)
+    
+    with open(path) as f:
+        assert json.load(f)[KEY]["frames"] == 34.0
+    reloaded = WarmupProfiles(path).get(KEY)
+    assert reloaded == profile
+
+
+def test_unreadable_profiles_are_ignored(tmp_path):
+    path = tmp_path / 'profiles.json'
+    path.write_text('{not json')
+    profiles = WarmupProfiles(str(path))
+    assert profiles.get(KEY) is None
+    profiles.update(KEY, 10, 0.3, True)
+    assert WarmupProfiles(str(path)).get(KEY)["frames"] == 10.0
+
+
+def test_worker_learns_the_warmup(synthetic_camera, monkeypatch, tmp_path):
+    monkeypatch.setattr(config, 'SYNTHETIC_EXPOSURE_SECONDS', 0.3)
+    worker = synthetic_camera.worker
+    assert worker.capture_frame(timeout=5.0) is not None
+    
+    warmup = worker.get_stats()["warmup"]
+    assert warmup["adaptive"] and warmup["converged"]
+    assert warmup["seconds"] >= 0.15
+    assert warmup["profile"]["warmups"] == 1
+    with open(tmp_path / 'warmup_profiles.json') as f:
+        stored = json.load(f)
+    assert list(stored.values())[0]["frames"] == warmup["frames"]
@@ -0,0 +1,134 @@
+"""
+Client message parsing of the WebSocket push (masking, fragmentation, size limits).
+"""
+import asyncio
+import io
+import os
+import struct
+import pytest
+import websocket_push
+from websocket_push import (MAX_CLIENT_MESSAGE, OP_BINARY, OP_CLOSE, OP_CONTINUATION, OP_PING, OP_TEXT,
+                            WebSocketError, read_message, read_message_async)
+
+
+def client_frame(opcode: int, payload: bytes, fin: bool = True, masked: bool = True,
+                 length: int = None) -> bytes:
+    """Encode a frame the way a browser sends it (masked with a random key)."""
+    length = len(payload) if length is None else length
+    first = (0x80 if fin else 0) | opcode
+    mask_bit = 0x80 if masked else 0
+    if length < 126:
+        head = struct.pack('!BB', first, mask_bit | length)
+    elif length < 65536:
+        head = struct.pack('!BBH', first, mask_bit | 126, length)
+    else:
+        head = struct.pack('!BBQ', first, mask_bit | 127, length)
+    if not masked:
+        return head + payload
+    mask = os.urandom(4)
+    return head + mask + bytes(byte ^ mask[index % 4] for index, byte in enumerate(payload))
+
+
+class Stream:
+    """Blocking read(n) over a byte string, tracking how much was consumed."""
+    
+    def __init__(self, data: bytes):
+        self.buffer = io.BytesIO(data)
+    
+    def read(self, n: int) -> bytes:
+        data = self.buffer.read(n)
+        if len(data) < n:
+            raise ConnectionError("Connection closed")
+        return data
+    
+    @property
+    def consumed(self) -> int:
+        return self.buffer.tell()
+
+
+def read_sync(data: bytes):
+    return read_message(Stream(data).read)
+
+
+def read_async(data: bytes):
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await read_message_async(reader)
+    return asyncio.run(run())
+
+
+@pytest.fixture(params=[read_sync, read_async], ids=['sync', 'async'])
+def read(request):
+    """Both readers implement the same protocol."""
+    return request.param
+
+
+@pytest.mark.parametrize('size', [0, 1, 125, 126, 1000, 65535, MAX_CLIENT_MESSAGE])
+def test_masked_payload_lengths(read, size):
+    # 7-bit, 16-bit and 64-bit length encodings
+    payload = os.urandom(size)
+    assert read(client_frame(OP_BINARY, payload)) == (OP_BINARY, payload)
+
+
+def test_text_message(read):
+    payload = b'{"type": "credit", "n": 2}'
+    opcode, data = read(client_frame(OP_TEXT, payload))
+    assert (opcode, data) == (OP_TEXT, payload)
+    assert websocket_push.handle_message(opcode, data) == (2, None, False)
+
+
+def test_unmasked_frame_rejected(read):
+    with pytest.raises(WebSocketError):
+        read(client_frame(OP_TEXT, b'hello', masked=False))
+
+
+def test_fragmented_message_joined(read):
+    data = (client_frame(OP_TEXT, b'{"type": ', fin=False)
+            + client_frame(OP_CONTINUATION, b'"credit", ', fin=False)
+            + client_frame(OP_CONTINUATION, b'"n": 3}'))
+    assert read(data) == (OP_TEXT, b'{"type": "credit", "n": 3}')
+
+
+def test_messages_read_one_at_a_time():
+    first = client_frame(OP_TEXT, b'one', fin=False) + client_frame(OP_CONTINUATION, b'two')
+    second = client_frame(OP_PING, b'ping')
+    stream = Stream(first + second)
+    assert read_message(stream.read) == (OP_TEXT, b'onetwo')
+    assert stream.consumed == len(first)
+    assert read_message(stream.read) == (OP_PING, b'ping')
+
+
+def test_control_frames(read):
+    assert read(client_frame(OP_PING, b'abc')) == (OP_PING, b'abc')
+    assert read(client_frame(OP_CLOSE, struct.pack('!H', 1000))) == (OP_CLOSE, struct.pack('!H', 1000))
+
+
+def test_oversized_frame_rejected_before_payload():
+    # Header and mask only; the announced length alone has to be rejected
+    data = client_frame(OP_BINARY, b'', length=MAX_CLIENT_MESSAGE + 1)
+    stream = Stream(data)
+    with pytest.raises(WebSocketError):
+        read_message(stream.read)
+    # Neither the mask nor the payload was read
+    assert stream.consumed == len(data) - 4
+
+
+def test_oversized_64bit_length_rejected(read):
+    head = struct.pack('!BBQ', 0x80 | OP_BINARY, 0x80 | 127, 2 ** 62)
+    with pytest.raises(WebSocketError):
+        read(head + bytes(4))
+
+
+def test_oversized_fragmented_message_rejected(read):
+    chunk = bytes(MAX_CLIENT_MESSAGE // 2 + 1)
+    data = client_frame(OP_BINARY, chunk, fin=False) + client_frame(OP_CONTINUATION, chunk)
+    with pytest.raises(WebSocketError):
+        read(data)
+
+
+def test_truncated_frame(read):
+    data = client_frame(OP_TEXT, b'hello')[:-2]
+    with pytest.raises((ConnectionError, asyncio.IncompleteReadError)):
+        read(data)
@@ -0,0 +1,250 @@
+"""
+Derivative (thumbnail) cache for snapshots.
+
+Downscaled copies of snapshots are generated once per source image and
+width, either eagerly when a snapshot is stored or on the first request,
+and kept on disk under the source's content hash. The cache is bounded
+by total bytes and evicts the least recently used files first.
+
+Requested widths are rounded up to one of THUMBNAIL_SIZES, so a grid of
+tiles shares a few derivatives instead of creating one per pixel width.
+"""
+import cv2
+import os
+import glob
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional, Tuple
+import numpy as np
+import config
+import metrics
+from frame_source import jpeg_dimensions, reduced_decode_flag
+from storage import atomic_write
+
+logger = logging.getLogger(__name__)
+
+
+def select_width(requested: int, source_width: Optional[int]) -> Optional[int]:
+    """
+    Map a requested width to a cached derivative size.
+    
+    Args:
+        requested: Width asked for by the client
+        source_width: Width of the source image, if known
+    
+    Returns:
+        Smallest configured size that is at least the requested width, or
+        None if the original image should be served instead
+    """
+    for size in sorted(config.THUMBNAIL_SIZES):
+        if size >= requested:
+            if source_width is not None and size >= source_width:
+                return None
+            return size
+    return None
+
+
+class DerivativeCache:
+    """
+    On-disk LRU cache of resized JPEGs keyed by (content hash, width).
+    Concurrent requests for a missing derivative wait for the first one
+    to generate it instead of decoding the source several times.
+    """
+    
+    def __init__(self, cache_dir: str, max_bytes: int = config.THUMBNAIL_CACHE_BYTES,
+                 quality: int = config.THUMBNAIL_QUALITY):
+        """
+        Initialize derivative cache.
+        
+        Args:
+            cache_dir: Directory holding the derivatives
+            max_bytes: Maximum total size of cached files
+            quality: JPEG quality of derivatives
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self._lock = threading.Lock()
+        self._index: Optional["OrderedDict[Tuple[str, int], int]"] = None
+        self._bytes = 0
+        self._pending = {}
+        
+        self._hits = 0
+        self._misses = 0
+        self._generated = 0
+        self._evicted = 0
+    
+    def _path(self, content_hash: str, width: int) -> str:
+        return os.path.join(self.cache_dir, f"{content_hash}_{width}.jpg")
+    
+    def _ensure_loaded(self):
+        """Index existing files once, oldest access first. Caller holds the lock."""
+        if self._index is not None:
+            return
+        index = OrderedDict()
+        total = 0
+        entries = []
+        for path in glob.glob(os.path.join(self.cache_dir, '*_*.jpg')):
+            stem = os.path.basename(path)[:-len('.jpg')]
+            content_hash, _, width = stem.rpartition('_')
+            try:
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, (content_hash, int(width)), stat.st_size))
+            except (OSError, ValueError):
+                continue
+        for _, key, size in sorted(entries):
+            index[key] = size
+            total += size
+        self._index = index
+        self._bytes = total
+        self._evict()
+    
+    def get(self, content_hash: str, width: int, load: Callable[[], Optional[bytes]]) -> Optional[bytes]:
+        """
+        Get a derivative, generating it from the source on a miss.
+        
+        Args:
+            content_hash: Content hash of the source JPEG
+            width: Derivative width (one of THUMBNAIL_SIZES)
+            load: Returns the source JPEG bytes (called only on a miss)
+        
+        Returns:
+            Derivative JPEG bytes, or None if the source is unavailable
+        """
+        key = (content_hash, width)
+        path = self._path(content_hash, width)
+        
+        with self._lock:
+            self._ensure_loaded()
+            if key in self._index:
+                self._index.move_to_end(key)
+                self._hits += 1
+                cached = True
+            else:
+                cached = False
+                event = self._pending.get(key)
+                owner = event is None
+                if owner:
+                    event = self._pending[key] = threading.Event()
+                    self._misses += 1
+        
+        if cached:
+            metrics.THUMBNAIL_REQUESTS.labels('hit').inc()
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                # Keep the LRU order across restarts
+                os.utime(path)
+                return data
+            except OSError:
+                # Removed behind our back; drop the entry and regenerate
+                with self._lock:
+                    size = self._index.pop(key, 0)
+                    self._bytes -= size
+                return self.get(content_hash, width, load)
+        
+        if not owner:
+            # Counted as a hit once the owner has stored the derivative
+            event.wait()
+            with self._lock:
+                hit = key in self._index
+            if hit:
+                return self.get(content_hash, width, load)
+            return None
+        
+        metrics.THUMBNAIL_REQUESTS.labels('miss').inc()
+        try:
+            source = load()
+            if source is None:
+                return None
+            return self._generate(content_hash, source, (width,)).get(width)
+        finally:
+            with self._lock:
+                del self._pending[key]
+            event.set()
+    
+    def generate(self, content_hash: str, source: bytes, widths: Iterable[int]):
+        """
+        Eagerly create derivatives of a source image (e.g. right after capture).
+        The source is decoded once for all widths; existing derivatives are skipped.
+        
+        Args:
+            content_hash: Content hash of the source JPEG
+            source: Source JPEG bytes
+            widths: Derivative widths to create
+        """
+        with self._lock:
+            self._ensure_loaded()
+            missing = tuple(width for width in widths if (content_hash, width) not in self._index)
+        if missing:
+            self._generate(content_hash, source, missing)
+    
+    def _generate(self, content_hash: str, source: bytes, widths: Tuple[int, ...]) -> dict:
+        """Decode the source once, then resize, encode and store each width."""
+        start = time.perf_counter()
+        data = np.frombuffer(source, np.uint8)
+        largest = max(widths)
+        
+        # Let the JPEG decoder downscale when that still covers the largest width
+        size = jpeg_dimensions(source)
+        image = cv2.imdecode(data, reduced_decode_flag(size[0] if size else None, largest))
+        if image is None:
+            logger.warning(f"Failed to decode source image {content_hash}")
+            return {}
+        
+        results = {}
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for width in widths:
+            if width < image.shape[1]:
+                height = max(1, round(image.shape[0] * width / image.shape[1]))
+                resized = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+            else:
+                resized = image
+            ret, buffer = cv2.imencode('.jpg', resized, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            if not ret:
+                continue
+            encoded = buffer.tobytes()
+            atomic_write(self._path(content_hash, width), encoded)
+            results[width] = encoded
+            
+            with self._lock:
+                key = (content_hash, width)
+                self._bytes += len(encoded) - self._index.get(key, 0)
+                self._index[key] = len(encoded)
+                self._generated += 1
+                self._evict()
+        
+        metrics.THUMBNAIL_GENERATE_SECONDS.observe(time.perf_counter() - start)
+        return results
+    
+    def _evict(self):
+        """Delete least recently used derivatives beyond max_bytes. Caller holds the lock."""
+        while self._bytes > self.max_bytes and len(self._index) > 1:
+            (content_hash, width), size = self._index.popitem(last=False)
+            self._bytes -= size
+            self._evicted += 1
+            try:
+                os.remove(self._path(content_hash, width))
+            except OSError:
+                pass
+    
+    def get_stats(self) -> dict:
+        """
+        Get cache statistics.
+        
+        Returns:
+            Dictionary with size, entries and hit/miss counters
+        """
+        with self._lock:
+            self._ensure_loaded()
+            return {
+                "entries": len(self._index),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "generated": self._generated,
+                "evicted": self._evicted
+            }
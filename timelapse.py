@@ -0,0 +1,384 @@
+"""
+Time-lapse videos built from stored snapshots.
+
+Builds run on a background thread per camera and stream through the
+frames: each snapshot is decoded (at a reduced scale when the output is
+smaller), resized and written to the video before the next one is read,
+so memory use does not depend on the number of frames. Finished videos
+are cached under a key derived from the exact frame set and output
+settings, so repeating a request returns the existing file.
+
+Can also be run from the command line:
+    python timelapse.py --from 2026-01-15T00:00 --to 2026-01-16T00:00 --fps 24 --width 1280
+"""
+import cv2
+import os
+import glob
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import List, Optional, Tuple
+import config
+from frame_source import reduced_decode_flag
+from history import SnapshotHistory, parse_time
+
+logger = logging.getLogger(__name__)
+
+# Output formats: file extension and FourCC
+FORMATS = {
+    'avi': ('avi', 'MJPG'),
+    'mp4': ('mp4', 'mp4v'),
+}
+
+
+class TimelapseJob:
+    """A requested time-lapse build and its progress."""
+    
+    def __init__(self, start: Optional[float], end: Optional[float], fps: float,
+                 width: Optional[int], video_format: str):
+        """
+        Args:
+            start: Earliest snapshot capture time (UNIX timestamp, None = oldest)
+            end: Latest snapshot capture time (UNIX timestamp, None = newest)
+            fps: Output frame rate
+            width: Output width in pixels (None = snapshot width)
+            video_format: 'avi' (Motion JPEG) or 'mp4' (MPEG-4)
+        """
+        self.id = uuid.uuid4().hex[:12]
+        self.start = start
+        self.end = end
+        self.fps = fps
+        self.width = width
+        self.format = video_format
+        self.key: Optional[str] = None
+        self.path: Optional[str] = None
+        self.status = 'queued'
+        self.cached = False
+        self.frames_total = 0
+        self.frames_done = 0
+        self.frames_skipped = 0
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.done = threading.Event()
+        self._files: List[Tuple[str, Optional[int]]] = []
+    
+    @property
+    def progress(self) -> float:
+        """Fraction of frames processed (1.0 when done)."""
+        if self.status == 'done':
+            return 1.0
+        if not self.frames_total:
+            return 0.0
+        return (self.frames_done + self.frames_skipped) / self.frames_total
+    
+    def to_dict(self) -> dict:
+        """Job state for the API."""
+        size = None
+        if self.status == 'done' and self.path and os.path.exists(self.path):
+            size = os.path.getsize(self.path)
+        return {
+            "id": self.id,
+            "status": self.status,
+            "progress": round(self.progress, 4),
+            "frames_total": self.frames_total,
+            "frames_done": self.frames_done,
+            "frames_skipped": self.frames_skipped,
+            "cached": self.cached,
+            "from": datetime.fromtimestamp(self.start).isoformat() if self.start is not None else None,
+            "to": datetime.fromtimestamp(self.end).isoformat() if self.end is not None else None,
+            "fps": self.fps,
+            "width": self.width,
+            "format": self.format,
+            "size": size,
+            "error": self.error,
+            "created": datetime.fromtimestamp(self.created_at).isoformat(),
+            "finished": datetime.fromtimestamp(self.finished_at).isoformat() if self.finished_at else None
+        }
+
+
+class TimelapseBuilder:
+    """
+    Builds time-lapse videos for one camera on a background thread.
+    Jobs run one at a time so a build never competes with capture and
+    streaming for more than one core.
+    """
+    
+    def __init__(self, history: SnapshotHistory, output_dir: str, name: str = 'default'):
+        """
+        Initialize time-lapse builder.
+        
+        Args:
+            history: Snapshot history of the camera
+            output_dir: Directory for finished videos (the cache)
+            name: Camera name used for the thread name
+        """
+        self.history = history
+        self.output_dir = output_dir
+        self.name = name
+        self._condition = threading.Condition()
+        self._queue = deque()
+        self._jobs: "OrderedDict[str, TimelapseJob]" = OrderedDict()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+    
+    def submit(self, start: Optional[float] = None, end: Optional[float] = None,
+               fps: float = config.TIMELAPSE_DEFAULT_FPS, width: Optional[int] = None,
+               video_format: str = 'avi') -> TimelapseJob:
+        """
+        Queue a time-lapse build.
+        If an identical request is already queued or running, that job is
+        returned instead; identical finished videos are served from the cache.
+        
+        Args:
+            start: Earliest snapshot capture time (UNIX timestamp)
+            end: Latest snapshot capture time (UNIX timestamp)
+            fps: Output frame rate
+            width: Output width in pixels (None = snapshot width)
+            video_format: 'avi' or 'mp4'
+        
+        Returns:
+            TimelapseJob
+        
+        Raises:
+            ValueError: If a setting is invalid
+        """
+        if video_format not in FORMATS:
+            raise ValueError(f"Unknown time-lapse format: {video_format}")
+        if start is not None and end is not None and start > end:
+            raise ValueError("from must not be after to")
+        
+        job = TimelapseJob(start, end, fps, width, video_format)
+        with self._condition:
+            for other in self._jobs.values():
+                if other.status in ('queued', 'running') and self._same_request(job, other):
+                    return other
+            self._jobs[job.id] = job
+            self._trim_jobs()
+            if self._closed:
+                self._cancel(job)
+                return job
+            self._queue.append(job)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"timelapse-{self.name}", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return job
+    
+    def close(self, timeout: float = 5.0):
+        """
+        Stop the build thread. Queued jobs are cancelled; a running build
+        stops after the current frame and its partial file is removed, so
+        no thread is inside OpenCV when the interpreter shuts down.
+        
+        Args:
+            timeout: Maximum time to wait for the build thread
+        """
+        with self._condition:
+            self._closed = True
+            while self._queue:
+                self._cancel(self._queue.popleft())
+            thread = self._thread
+            self._condition.notify_all()
+        if thread is not None:
+            thread.join(timeout)
+    
+    @staticmethod
+    def _cancel(job: TimelapseJob):
+        """Mark a job that will never run as failed."""
+        job.error = "Time-lapse builder stopped"
+        job.status = 'failed'
+        job.finished_at = time.time()
+        job.done.set()
+    
+    def get(self, job_id: str) -> Optional[TimelapseJob]:
+        """Look up a job by id."""
+        with self._condition:
+            return self._jobs.get(job_id)
+    
+    def build(self, job: TimelapseJob):
+        """
+        Build a job on the calling thread (used by the worker and the CLI).
+        
+        Args:
+            job: Job to build; its status and progress are updated in place
+        """
+        job.status = 'running'
+        try:
+            self._collect(job)
+            if job.cached:
+                logger.info(f"Time-lapse {job.id}: cached {job.path}")
+            else:
+                self._encode(job)
+                self._evict()
+                logger.info(f"Time-lapse {job.id}: {job.frames_done} frames written to {job.path}")
+            job.status = 'done'
+        except Exception as e:
+            logger.error(f"Time-lapse {job.id} failed: {e}")
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job._files = []
+            job.finished_at = time.time()
+            job.done.set()
+    
+    @staticmethod
+    def _same_request(a: TimelapseJob, b: TimelapseJob) -> bool:
+        return (a.start, a.end, a.fps, a.width, a.format) == (b.start, b.end, b.fps, b.width, b.format)
+    
+    def _trim_jobs(self):
+        """Forget the oldest finished jobs beyond TIMELAPSE_MAX_JOBS. Caller holds the condition."""
+        finished = [job_id for job_id, job in self._jobs.items() if job.done.is_set()]
+        for job_id in finished[:max(0, len(self._jobs) - config.TIMELAPSE_MAX_JOBS)]:
+            del self._jobs[job_id]
+    
+    def _run(self):
+        """Worker loop: build queued jobs one after another."""
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._queue or self._closed)
+                if self._closed:
+                    return
+                job = self._queue.popleft()
+            self.build(job)
+    
+    def _collect(self, job: TimelapseJob):
+        """
+        List the frames of a job from the history index and derive its cache key.
+        Only file paths are kept; images are read one at a time while encoding.
+        """
+        # float() so that 24 and 24.0 share a cached video
+        digest = hashlib.sha256(f"{float(job.fps)}|{job.width}|{job.format}".encode())
+        files = []
+        cursor = None
+        while True:
+            items, cursor = self.history.query(job.start, job.end, limit=1000, cursor=cursor)
+            for item in items:
+                files.append((self.history.path_for(item), item['width']))
+                digest.update(f"|{item['filename']}:{item['content_hash']}".encode())
+            if cursor is None:
+                break
+        
+        if not files:
+            raise ValueError("No snapshots in the requested time range")
+        if len(files) > config.TIMELAPSE_MAX_FRAMES:
+            raise ValueError(f"Too many snapshots ({len(files)}, limit {config.TIMELAPSE_MAX_FRAMES})")
+        
+        job.key = digest.hexdigest()[:16]
+        job.path = os.path.join(self.output_dir, f"timelapse_{job.key}.{FORMATS[job.format][0]}")
+        job.frames_total = len(files)
+        job._files = files
+        if os.path.exists(job.path):
+            # Touch so the cache keeps recently requested videos longest
+            os.utime(job.path)
+            job.cached = True
+            job.frames_done = job.frames_total
+    
+    def _encode(self, job: TimelapseJob):
+        """Decode, resize and write the frames one by one."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        extension, fourcc = FORMATS[job.format]
+        tmp_path = os.path.join(self.output_dir, f".timelapse_{job.key}.{job.id}.tmp.{extension}")
+        writer = None
+        size = None
+        
+        try:
+            for path, source_width in job._files:
+                if self._closed:
+                    raise RuntimeError("Time-lapse builder stopped")
+                image = self._read(path, source_width, job.width)
+                if image is None:
+                    # Deleted by retention since the listing, or unreadable
+                    job.frames_skipped += 1
+                    continue
+                
+                if size is None:
+                    height, width = image.shape[:2]
+                    out_width = min(job.width or width, width)
+                    out_height = max(2, round(height * out_width / width))
+                    # Even dimensions keep every codec happy
+                    size = (out_width - out_width % 2, out_height - out_height % 2)
+                    writer = cv2.VideoWriter(tmp_path, cv2.VideoWriter_fourcc(*fourcc), job.fps, size)
+                    if not writer.isOpened():
+                        raise RuntimeError(f"Video writer for {job.format} is not available")
+                
+                if (image.shape[1], image.shape[0]) != size:
+                    image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+                writer.write(image)
+                job.frames_done += 1
+            
+            if writer is None:
+                raise ValueError("None of the snapshots could be read")
+            writer.release()
+            writer = None
+            os.replace(tmp_path, job.path)
+        finally:
+            if writer is not None:
+                writer.release()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
+    @staticmethod
+    def _read(path: str, source_width: Optional[int], width: Optional[int]):
+        """
+        Read a snapshot, letting the JPEG decoder downscale by 2, 4 or 8
+        when the output is that much smaller (much cheaper than a full decode).
+        """
+        return cv2.imread(path, reduced_decode_flag(source_width, width))
+    
+    def _evict(self):
+        """Delete the least recently used videos beyond TIMELAPSE_CACHE_FILES."""
+        files = glob.glob(os.path.join(self.output_dir, 'timelapse_*'))
+        files.sort(key=os.path.getmtime, reverse=True)
+        for path in files[config.TIMELAPSE_CACHE_FILES:]:
+            try:
+                os.remove(path)
+                logger.info(f"Time-lapse cache: removed {path}")
+            except OSError as e:
+                logger.warning(f"Failed to remove {path}: {e}")
+
+
+def main():
+    """Build a time-lapse from the command line and print progress."""
+    import argparse
+    import shutil
+    from camera import get_camera
+    
+    parser = argparse.ArgumentParser(description="Build a time-lapse video from stored snapshots")
+    parser.add_argument('--camera', default=None, help="Camera name (default camera if omitted)")
+    parser.add_argument('--from', dest='start', help="Earliest capture time (UNIX timestamp or ISO 8601)")
+    parser.add_argument('--to', dest='end', help="Latest capture time (UNIX timestamp or ISO 8601)")
+    parser.add_argument('--fps', type=float, default=config.TIMELAPSE_DEFAULT_FPS)
+    parser.add_argument('--width', type=int, default=None, help="Output width (default: snapshot width)")
+    parser.add_argument('--format', choices=sorted(FORMATS), default='avi')
+    parser.add_argument('--output', help="Copy the finished video to this path")
+    args = parser.parse_args()
+    
+    builder = get_camera(args.camera).timelapse
+    job = TimelapseJob(parse_time(args.start) if args.start else None,
+                       parse_time(args.end) if args.end else None,
+                       args.fps, args.width, args.format)
+    
+    thread = threading.Thread(target=builder.build, args=(job,), daemon=True)
+    thread.start()
+    while not job.done.wait(1.0):
+        print(f"\r{job.frames_done + job.frames_skipped}/{job.frames_total} frames", end='', flush=True)
+    print()
+    
+    if job.status != 'done':
+        print(f"Failed: {job.error}")
+        raise SystemExit(1)
+    
+    path = job.path
+    if args.output:
+        shutil.copyfile(job.path, args.output)
+        path = args.output
+    print(f"{'Cached' if job.cached else 'Built'} {path} ({job.frames_done} frames, {job.frames_skipped} skipped)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+Adaptive camera warmup.
+
+After the device is opened, auto-exposure needs a number of frames to
+settle, and how many depends on the sensor and the lighting. Instead of
+a fixed delay, frames are discarded until the mean luminance of the last
+CAMERA_WARMUP_STABLE_FRAMES frames varies by at most
+CAMERA_WARMUP_TOLERANCE gray levels. The luminance is sampled on a
+coarse grid, so the check costs microseconds per frame.
+
+How long each device needed is remembered in a small JSON file
+(WarmupProfiles). The learned frame count keeps a later warmup from
+ending on a false plateau, e.g. a run of identical frames before the
+exposure loop has reacted.
+"""
+import json
+import os
+import logging
+import threading
+import time
+from typing import Optional
+import numpy as np
+import config
+from quality import jpeg_luminance
+from storage import atomic_write
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_WIDTH = 80  # Luminance is measured on about this many pixels per row
+LUMA_WEIGHTS = np.array([0.114, 0.587, 0.299], dtype=np.float32)  # BGR
+BLACK_LEVEL = 1.0  # Frames darker than this have not been exposed yet
+LEARNED_FRACTION = 0.5  # A warmup lasts at least this part of the learned frame count
+PROFILE_SMOOTHING = 0.3  # Weight of the newest warmup in a learned profile
+
+
+def mean_luminance(image: np.ndarray) -> float:
+    """
+    Mean luminance of a frame, sampled on a grid about SAMPLE_WIDTH wide.
+    
+    Args:
+        image: BGR or grayscale frame
+    
+    Returns:
+        Mean gray level (0-255)
+    """
+    step = max(1, image.shape[1] // SAMPLE_WIDTH)
+    sample = image[::step, ::step]
+    if sample.ndim == 3:
+        return float(np.dot(sample.mean(axis=(0, 1)), LUMA_WEIGHTS))
+    return float(sample.mean())
+
+
+class ExposureTracker:
+    """
+    Detects that auto-exposure has converged from the mean luminance of
+    consecutive frames: the window of the last levels must span at most
+    the tolerance, so both a jump between two frames and a slow drift
+    across the window keep the warmup going.
+    """
+    
+    def __init__(self, window: int = config.CAMERA_WARMUP_STABLE_FRAMES,
+                 tolerance: float = config.CAMERA_WARMUP_TOLERANCE,
+                 min_frames: int = config.CAMERA_WARMUP_MIN_FRAMES):
+        """
+        Initialize exposure tracker.
+        
+        Args:
+            window: Consecutive frames that have to agree
+            tolerance: Maximum luminance spread within the window (gray levels)
+            min_frames: Frames to see before convergence is accepted
+        """
+        self.window = max(2, window)
+        self.tolerance = tolerance
+        self.min_frames = max(min_frames, self.window)
+        self.frames = 0
+        self.level: Optional[float] = None
+        self._levels = np.zeros(self.window, dtype=np.float32)
+    
+    def add(self, level: float) -> bool:
+        """
+        Record the mean luminance of the next frame.
+        
+        Args:
+            level: Mean gray level of the frame
+        
+        Returns:
+            True once the exposure has converged
+        """
+        self._levels[self.frames % self.window] = level
+        self.frames += 1
+        self.level = level
+        if self.frames < self.min_frames:
+            return False
+        # Black frames before the exposure loop starts are stable, but not settled
+        if self._levels.max() < BLACK_LEVEL:
+            return False
+        return float(np.ptp(self._levels)) <= self.tolerance
+
+
+def settle(source, min_frames: int = config.CAMERA_WARMUP_MIN_FRAMES,
+           max_seconds: float = config.CAMERA_WARMUP_MAX_SECONDS) -> dict:
+    """
+    Read and discard frames until the exposure has converged.
+    Passthrough frames are decoded at reduced size only.
+    
+    Args:
+        source: Opened frame source
+        min_frames: Frames to discard at least
+        max_seconds: Give up after this long
+    
+    Returns:
+        Dictionary with the discarded frames, seconds, whether the exposure
+        converged and the last measured brightness
+    """
+    tracker = ExposureTracker(config.CAMERA_WARMUP_STABLE_FRAMES, config.CAMERA_WARMUP_TOLERANCE, min_frames)
+    start = time.monotonic()
+    deadline = start + max_seconds
+    # Non-passthrough frames are all read into one scratch buffer
+    scratch = None
+    converged = False
+    
+    while not converged and time.monotonic() < deadline:
+        if source.passthrough:
+            ret, jpeg = source.read_jpeg()
+            image = jpeg_luminance(jpeg, SAMPLE_WIDTH) if ret and jpeg is not None else None
+        else:
+            ret, scratch = source.read(scratch)
+            image = scratch if ret else None
+        if image is not None:
+            converged = tracker.add(mean_luminance(image))
+    
+    return {
+        "adaptive": True,
+        "frames": tracker.frames,
+        "seconds": round(time.monotonic() - start, 3),
+        "converged": converged,
+        "brightness": round(tracker.level, 1) if tracker.level is not None else None
+    }
+
+
+class WarmupProfiles:
+    """
+    Learned warmup per device, persisted as JSON so a restart does not
+    start from scratch. Keys identify the source, device and frame size,
+    e.g. 'v4l2:/dev/v4l/by-id/usb-046d_0825-video-index0:640x480'.
+    
+    Only converged warmups update the learned frame count and time
+    (exponentially weighted); warmups that ran into the time limit are
+    counted as timeouts.
+    """
+    
+    def __init__(self, path: str):
+        """
+        Initialize profile store.
+        
+        Args:
+            path: JSON file holding the profiles
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._profiles: Optional[dict] = None
+    
+    def _ensure_loaded(self):
+        """Read the profile file once. Caller holds the lock."""
+        if self._profiles is not None:
+            return
+        self._profiles = {}
+        try:
+            with open(self.path) as f:
+                profiles = json.load(f)
+            if isinstance(profiles, dict):
+                self._profiles = profiles
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable warmup profiles {self.path}: {e}")
+    
+    def get(self, key: str) -> Optional[dict]:
+        """
+        Get the profile of a device.
+        
+        Args:
+            key: Device key
+        
+        Returns:
+            Copy of the profile, or None if the device has not been warmed up yet
+        """
+        with self._lock:
+            self._ensure_loaded()
+            profile = self._profiles.get(key)
+            return dict(profile) if profile else None
+    
+    def min_frames(self, key: str) -> int:
+        """
+        Frames the next warmup of a device discards at least.
+        
+        Args:
+            key: Device key
+        
+        Returns:
+            CAMERA_WARMUP_MIN_FRAMES, or part of the learned frame count if larger
+        """
+        profile = self.get(key)
+        learned = profile.get("frames") if profile else None
+        if learned is None:
+            return config.CAMERA_WARMUP_MIN_FRAMES
+        return max(config.CAMERA_WARMUP_MIN_FRAMES, int(learned * LEARNED_FRACTION))
+    
+    def update(self, key: str, frames: int, seconds: float, converged: bool) -> dict:
+        """
+        Record a finished warmup and save the profiles.
+        
+        Args:
+            key: Device key
+            frames: Frames discarded
+            seconds: Warmup duration
+            converged: False if the warmup ran into the time limit
+        
+        Returns:
+            Copy of the updated profile
+        """
+        with self._lock:
+            self._ensure_loaded()
+            profile = self._profiles.setdefault(key, {"frames": None, "seconds": None,
+                                                      "warmups": 0, "timeouts": 0})
+            if converged:
+                if profile["frames"] is None:
+                    profile["frames"], profile["seconds"] = float(frames), seconds
+                else:
+                    profile["frames"] += PROFILE_SMOOTHING * (frames - profile["frames"])
+                    profile["seconds"] += PROFILE_SMOOTHING * (seconds - profile["seconds"])
+                profile["frames"] = round(profile["frames"], 1)
+                profile["seconds"] = round(profile["seconds"], 3)
+            else:
+                profile["timeouts"] += 1
+            profile["warmups"] += 1
+            profile["updated"] = time.time()
+            
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                atomic_write(self.path, json.dumps(self._profiles, indent=2, sort_keys=True).encode())
+            except OSError as e:
+                logger.error(f"Error saving warmup profiles: {e}")
+            return dict(profile)
+
+
+_profiles: Optional[WarmupProfiles] = None
+_profiles_lock = threading.Lock()
+
+
+def get_warmup_profiles() -> WarmupProfiles:
+    """
+    Shared profile store at CAMERA_WARMUP_PROFILES_PATH
+    (default IMAGES_DIR/warmup_profiles.json), created on first use.
+    
+    Returns:
+        WarmupProfiles instance
+    """
+    global _profiles
+    with _profiles_lock:
+        if _profiles is None:
+            path = config.CAMERA_WARMUP_PROFILES_PATH or os.path.join(config.IMAGES_DIR, 'warmup_profiles.json')
+            _profiles = WarmupProfiles(path)
+        return _profiles
@@ -0,0 +1,373 @@
+"""
+WebSocket frame push for the camera server (RFC 6455, no extra dependencies).
+
+Every frame is sent as one binary message: FRAME_HEADER (sequence number,
+capture time, width, height; big-endian) followed by the JPEG data.
+The client paces the stream with credits: the server sends one frame per
+credit and always the newest one, so a slow client skips frames instead
+of building up a queue in socket buffers.
+
+Client messages (JSON text):
+    {"type": "credit", "n": 1}               grant credits (one per frame)
+    {"type": "ping", "t": <client ms>}       clock sync for latency readouts
+Server messages:
+    binary  FRAME_HEADER + JPEG
+    text    {"type": "pong", "t": <echoed>, "server_time": <UNIX seconds>}
+"""
+import base64
+import hashlib
+import json
+import logging
+import socket
+import struct
+import threading
+import time
+from typing import Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+# uint32 sequence number, float64 capture time (UNIX seconds), uint16 width, uint16 height
+FRAME_HEADER = struct.Struct('!IdHH')
+MAX_CLIENT_MESSAGE = 65536
+MAX_CREDITS = 8  # Frames a client may have in flight at most
+CLOSE_NORMAL = 1000
+
+
+class WebSocketError(Exception):
+    """Protocol violation by the client."""
+
+
+def is_upgrade(headers) -> bool:
+    """
+    Check whether request headers ask for a WebSocket upgrade.
+    
+    Args:
+        headers: Mapping with case-insensitive or lower-case header names
+    """
+    upgrade = headers.get('upgrade') or headers.get('Upgrade') or ''
+    connection = headers.get('connection') or headers.get('Connection') or ''
+    return upgrade.lower() == 'websocket' and 'upgrade' in connection.lower()
+
+
+def handshake_response(key: str) -> bytes:
+    """
+    Build the 101 Switching Protocols response for a client key.
+    
+    Args:
+        key: Sec-WebSocket-Key request header
+    """
+    accept = base64.b64encode(hashlib.sha1((key + GUID).encode()).digest()).decode()
+    return (
+        "HTTP/1.1 101 Switching Protocols\r\n"
+        "Upgrade: websocket\r\nConnection: Upgrade\r\n"
+        f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+    ).encode()
+
+
+def frame_header(opcode: int, length: int) -> bytes:
+    """Header of a final, unmasked server frame with a payload of the given length."""
+    first = 0x80 | opcode
+    if length < 126:
+        return struct.pack('!BB', first, length)
+    if length < 65536:
+        return struct.pack('!BBH', first, 126, length)
+    return struct.pack('!BBQ', first, 127, length)
+
+
+def encode_message(opcode: int, payload: bytes) -> bytes:
+    """A complete server frame (for small messages; frames send header and JPEG separately)."""
+    return frame_header(opcode, len(payload)) + payload
+
+
+def close_message(code: int = CLOSE_NORMAL) -> bytes:
+    """A close frame with a status code."""
+    return encode_message(OP_CLOSE, struct.pack('!H', code))
+
+
+def _unmask(mask: bytes, data: bytes) -> bytes:
+    """XOR client payload with its 4-byte mask."""
+    n = len(data)
+    key = (mask * (n // 4 + 1))[:n]
+    return (int.from_bytes(data, 'big') ^ int.from_bytes(key, 'big')).to_bytes(n, 'big')
+
+
+def _parse_head(head: bytes) -> Tuple[bool, int, int]:
+    """
+    Parse the first two bytes of a client frame.
+    
+    Returns:
+        Tuple of (fin, opcode, length code)
+    
+    Raises:
+        WebSocketError: If the frame is not masked
+    """
+    if not head[1] & 0x80:
+        raise WebSocketError("Client frames must be masked")
+    return bool(head[0] & 0x80), head[0] & 0x0F, head[1] & 0x7F
+
+
+def _extended_length(code: int) -> int:
+    """Number of extended payload length bytes for a length code."""
+    return 2 if code == 126 else 8 if code == 127 else 0
+
+
+def _check_length(length: int):
+    if length > MAX_CLIENT_MESSAGE:
+        raise WebSocketError("Client message too large")
+
+
+def read_message(read: Callable[[int], bytes]) -> Tuple[int, bytes]:
+    """
+    Read one client message from a blocking connection.
+    Control frames are returned as they arrive, fragmented messages are joined.
+    
+    Args:
+        read: Function returning exactly n bytes (raises ConnectionError on EOF)
+    
+    Returns:
+        Tuple of (opcode, payload)
+    """
+    fragments = []
+    message_opcode = None
+    while True:
+        fin, opcode, length = _parse_head(read(2))
+        extra = _extended_length(length)
+        if extra:
+            length = int.from_bytes(read(extra), 'big')
+        _check_length(length)
+        mask = read(4)
+        payload = _unmask(mask, read(length)) if length else b''
+        
+        if opcode >= OP_CLOSE:
+            return opcode, payload
+        if opcode != OP_CONTINUATION:
+            message_opcode = opcode
+        fragments.append(payload)
+        _check_length(sum(len(fragment) for fragment in fragments))
+        if fin:
+            return message_opcode, b''.join(fragments)
+
+
+async def read_message_async(reader) -> Tuple[int, bytes]:
+    """
+    Read one client message from an asyncio stream (see read_message).
+    
+    Args:
+        reader: asyncio.StreamReader
+    
+    Returns:
+        Tuple of (opcode, payload)
+    """
+    fragments = []
+    message_opcode = None
+    while True:
+        fin, opcode, length = _parse_head(await reader.readexactly(2))
+        extra = _extended_length(length)
+        if extra:
+            length = int.from_bytes(await reader.readexactly(extra), 'big')
+        _check_length(length)
+        mask = await reader.readexactly(4)
+        payload = _unmask(mask, await reader.readexactly(length)) if length else b''
+        
+        if opcode >= OP_CLOSE:
+            return opcode, payload
+        if opcode != OP_CONTINUATION:
+            message_opcode = opcode
+        fragments.append(payload)
+        _check_length(sum(len(fragment) for fragment in fragments))
+        if fin:
+            return message_opcode, b''.join(fragments)
+
+
+def handle_message(opcode: int, payload: bytes) -> Tuple[int, Optional[bytes], bool]:
+    """
+    Interpret a client message.
+    
+    Args:
+        opcode: Message opcode
+        payload: Message payload
+    
+    Returns:
+        Tuple of (credits granted, reply frame or None, connection should close)
+    """
+    if opcode == OP_CLOSE:
+        return 0, close_message(), True
+    if opcode == OP_PING:
+        return 0, encode_message(OP_PONG, payload), False
+    if opcode != OP_TEXT:
+        return 0, None, False
+    
+    try:
+        message = json.loads(payload)
+    except ValueError:
+        logger.debug("Ignoring malformed WebSocket message")
+        return 0, None, False
+    if not isinstance(message, dict):
+        return 0, None, False
+    
+    if message.get('type') == 'credit':
+        try:
+            return max(0, int(message.get('n', 1))), None, False
+        except (TypeError, ValueError):
+            return 0, None, False
+    if message.get('type') == 'ping':
+        reply = json.dumps({"type": "pong", "t": message.get('t'), "server_time": time.time()})
+        return 0, encode_message(OP_TEXT, reply.encode()), False
+    return 0, None, False
+
+
+def frame_message(frame, width: Optional[int], quality: int,
+                  roi: Optional[str] = None) -> Optional[Tuple[bytes, memoryview]]:
+    """
+    Build the binary message for a frame variant.
+    
+    Args:
+        frame: Frame to send
+        width: Output width (None = full size)
+        quality: JPEG quality
+        roi: ROI preset to crop to (None = whole frame)
+    
+    Returns:
+        Tuple of (frame and message headers, JPEG view), or None if encoding failed
+    """
+    jpeg = frame.jpeg(width, quality, roi)
+    if jpeg is None:
+        return None
+    out_width, out_height = frame.variant_size(width, roi)
+    header = FRAME_HEADER.pack(frame.seq & 0xFFFFFFFF, frame.captured_at,
+                               min(out_width, 65535), min(out_height, 65535))
+    return frame_header(OP_BINARY, len(header) + len(jpeg)) + header, jpeg
+
+
+class _Credits:
+    """Credit counter shared by the socket reader and the sending loop."""
+    
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._credits = 0
+        self.closed = False
+    
+    def add(self, count: int):
+        with self._condition:
+            self._credits = min(MAX_CREDITS, self._credits + count)
+            self._condition.notify()
+    
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify()
+    
+    def take(self, timeout: float) -> bool:
+        """Wait for and consume one credit. Returns False on timeout or close."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._credits > 0 or self.closed, timeout)
+            if self.closed or self._credits <= 0:
+                return False
+            self._credits -= 1
+            return True
+
+
+def serve(sock: socket.socket, worker, width: Optional[int], quality: int,
+          fps: Optional[float] = None, roi: Optional[str] = None):
+    """
+    Push frames to one WebSocket client over a blocking socket (Flask mode).
+    The handshake must already have been sent. Returns when the client
+    disconnects; the socket is shut down afterwards.
+    
+    Args:
+        sock: Connected client socket
+        worker: CaptureWorker of the camera
+        width: Output width (None = full size)
+        quality: JPEG quality
+        fps: Maximum frame rate (None = device rate)
+        roi: ROI preset to crop to (None = whole frame)
+    """
+    credits = _Credits()
+    send_lock = threading.Lock()
+    
+    def send(*chunks):
+        with send_lock:
+            for chunk in chunks:
+                sock.sendall(chunk)
+    
+    def read(count: int) -> bytes:
+        data = bytearray()
+        while len(data) < count:
+            chunk = sock.recv(count - len(data))
+            if not chunk:
+                raise ConnectionError("WebSocket closed by client")
+            data += chunk
+        return bytes(data)
+    
+    def reader():
+        try:
+            while True:
+                granted, reply, close = handle_message(*read_message(read))
+                if reply is not None:
+                    send(reply)
+                if close:
+                    break
+                if granted:
+                    credits.add(granted)
+        except (OSError, WebSocketError) as e:
+            logger.debug(f"WebSocket reader stopped: {e}")
+        finally:
+            credits.close()
+    
+    threading.Thread(target=reader, name="websocket-reader", daemon=True).start()
+    worker.subscribe(width, quality, roi)
+    min_interval = 1.0 / fps if fps else 0.0
+    next_send = 0.0
+    frame_count = 0
+    seq = 0
+    
+    try:
+        while not credits.closed:
+            if not credits.take(timeout=1.0):
+                continue
+            if min_interval:
+                delay = next_send - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            
+            # Newest frame only; frames captured while waiting for credit are skipped
+            frame = None
+            while frame is None and not credits.closed:
+                frame = worker.wait_for_frame(seq, timeout=1.0)
+                if frame is None and not worker.is_running():
+                    logger.error("Capture worker stopped, ending WebSocket stream")
+                    return
+            if frame is None:
+                break
+            if seq and frame.seq - seq > 1:
+                worker.record_dropped(frame.seq - seq - 1)
+            seq = frame.seq
+            
+            message = frame_message(frame, width, quality, roi)
+            frame = None
+            if message is None:
+                credits.add(1)
+                continue
+            send(*message)
+            next_send = max(next_send + min_interval, time.monotonic())
+            frame_count += 1
+    except OSError as e:
+        logger.info(f"WebSocket stream stopped: {e}")
+    finally:
+        worker.unsubscribe(width, quality, roi)
+        try:
+            if not credits.closed:
+                send(close_message())
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        logger.info(f"WebSocket stream ended. Total frames: {frame_count}")